@@ -1,16 +1,76 @@
 import streamlit as st
-import os
-from openai import OpenAI
-api_key = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key) if api_key else None
-if "ngn_case_data" not in st.session_state:
-    st.session_state["ngn_case_data"] = None
+import json
+import statistics
+import time
+import uuid
+from nursethink.bank import bank_variant, get_question_bank
+from nursethink.chat import new_chat_memory, update_chat_memory
+from nursethink.cleanup import clean_notes, notes_cleanup_stats
+from nursethink.coalesce import get_single_flight
+from nursethink.engine import get_engine
+from nursethink.extraction import MAX_UPLOAD_MB, extract_upload_with_stats, get_extraction_cache, upload_key
+from nursethink.library import get_notes_library, new_student_token, student_from_token
+from nursethink.llm import get_client, get_response_cache
+from nursethink.ngn import DEFAULT_NGN_TOPIC, NGN_POOL_SIZE, NGNCaseStream, get_ngn_pool, get_ngn_stats, score_ngn_stage
+from nursethink.notes import NOTES_TOKEN_BUDGET, estimate_tokens, get_notes_index, select_notes_chunks
+from nursethink.notes_store import NOTES_PREVIEW_CHARS, notes_preview, resolve_notes
+from nursethink.page_index import get_page_index
+from nursethink.prompts import (
+    TEMPLATES,
+    build_prompt_sections,
+    build_study_chat_prompt,
+    join_sections,
+    latest_user_message,
+    prompt_section_sizes,
+    simulated_response,
+)
+from nursethink.quiz import QUIZ_BATCH_MAX
+from nursethink.scheduler import get_model_scheduler
+from nursethink.session import CHAT_PAGE_SIZE, ChatLog, NGNScores, get_session_stats, session_memory_report
+from nursethink.tracing import TRACE_FILE, RequestTrace, get_tracer
+from nursethink.upstream import get_circuit_breaker, get_upstream_stats
+from nursethink.warmup import WARMUP_ENABLED, get_cache_warmer
+
+# All model calls, caches and NGN generation go through the engine: in-process by
+# default, or a `python -m nursethink.server` instance when NURSETHINK_ENGINE_URL is set
+engine = get_engine()
+run_started = time.perf_counter()
+# Cleared at the bottom of the script; fragment reruns see it False
+st.session_state["full_run"] = True
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = uuid.uuid4().hex[:12]
 if "ngn_stage" not in st.session_state:
     st.session_state["ngn_stage"] = 0
 if "ngn_history" not in st.session_state:
-    st.session_state["ngn_history"] = []
+    # Scores only; chosen answers go to the on-disk session log
+    st.session_state["ngn_history"] = NGNScores(st.session_state["session_id"])
 if "chat_messages" not in st.session_state:
-    st.session_state["chat_messages"] = []
+    # Newest messages in memory (capped), the whole chat on disk
+    st.session_state["chat_messages"] = ChatLog(st.session_state["session_id"])
+if "chat_memory" not in st.session_state:
+    st.session_state["chat_memory"] = None
+if "chat_pages" not in st.session_state:
+    st.session_state["chat_pages"] = 1
+if "ngn_case_stream" not in st.session_state:
+    st.session_state["ngn_case_stream"] = None
+if "ngn_feedback" not in st.session_state:
+    st.session_state["ngn_feedback"] = None
+if "ingested_uploads" not in st.session_state:
+    st.session_state["ingested_uploads"] = {}
+if "library_docs" not in st.session_state:
+    st.session_state["library_docs"] = []
+
+# Student id: a signed token kept in the URL so a bookmark brings the student back to their
+# notes library and question-bank history. The link is the only key: anyone who has it can
+# read and remove that library. A missing or forged token gets a new, empty library.
+library = get_notes_library()
+page_index = get_page_index()
+bank = get_question_bank()
+student_id = student_from_token(st.query_params.get("student"))
+if student_id is None:
+    token = new_student_token()
+    st.query_params["student"] = token
+    student_id = student_from_token(token)
 
 
 
@@ -19,517 +79,211 @@ if "chat_messages" not in st.session_state:
 # Demo version with simulated responses
 # -------------------------
 
-SYSTEM_PROMPT = """
-You are NurseThink AI — an NCLEX-style nursing reasoning coach.
-
-SAFETY & SCOPE:
-Educational support only. Do not diagnose or prescribe. If user asks for real medical decisions, advise contacting instructor/clinician.
-Always stay within nursing scope and common NCLEX test frameworks.
-
-NCLEX REASONING ORDER (use explicitly):
-1) Identify Question Type (priority, first action, delegation, teaching, therapeutic response, assessment vs intervention, safety, triage, meds, infection control)
-2) Apply Priority Stack (state which rule wins):
-   - ABCs (Airway > Breathing > Circulation) / oxygenation
-   - Safety (falls, aspiration, bleeding, infection/sepsis, suicide/violence risk, med safety)
-   - Acute change/worsening > chronic/stable
-   - Unstable > stable
-   - Least invasive/least restrictive first (unless emergency)
-   - ADPIE: Assess before intervene unless life-threatening
-3) If information is missing AND no immediate threat: ask 1–2 clarifying questions OR choose the best assessment.
-
-DELEGATION RULES (algorithmic):
-- RN: initial assessment, unstable/new symptoms, clinical judgment, initial teaching, evaluation, care planning.
-- LPN/LVN: tasks for stable patients, focused data collection, reinforce teaching, sterile procedures per policy.
-- UAP: routine, predictable, non-judgment tasks (ADLs, hygiene, ambulation, vitals on stable, I&O if no judgment).
-
-THERAPEUTIC COMMUNICATION:
-Prefer reflection + validation + open-ended. Use silence, clarify, explore. Avoid advice-first, “why” blaming, false reassurance, changing subject.
-
-INFECTION CONTROL QUICK RULES:
-Hand hygiene first; standard precautions always; airborne (N95/negative pressure), droplet (surgical mask), contact (gown/gloves).
-
-ANSWER FORMAT (always):
-Question Type:
-A) Best answer
-B) Why (nursing logic + rule used)
-C) Why others are wrong (brief)
-D) Memory hook/mnemonic
-E) Test tip
-""".strip()
-
-
-TEMPLATES = {
-    "Priority (ABCs)": "Post-op patient with new shortness of breath and O2 sat 88%. What is the nurse’s priority?",
-    "Assessment vs Intervention": "Client reports chest tightness. Which action should the nurse take first?",
-    "Therapeutic Communication": "Patient says: “I’m scared my diagnosis means I’m going to die.” Best nurse response?",
-    "Delegation": "Which task is appropriate to delegate to the UAP on a stable med-surg unit?",
-}
-def extract_text_from_upload(uploaded_file) -> str:
-    """Return extracted text from .txt or .pdf upload. Safe MVP extraction."""
-    if uploaded_file is None:
-        return ""
-
-    filename = uploaded_file.name.lower()
-
-    # TXT
-    if filename.endswith(".txt"):
-        try:
-            return uploaded_file.getvalue().decode("utf-8", errors="ignore")
-        except Exception:
-            return ""
 
-    # PDF
-    if filename.endswith(".pdf"):
-        try:
-            data = uploaded_file.getvalue()
-            reader = PdfReader(io.BytesIO(data))
-            pages_text = []
-            for page in reader.pages:
-                pages_text.append(page.extract_text() or "")
-            return "\n".join(pages_text).strip()
-        except Exception:
-            return ""
-
-    return ""
-
-def build_context(notes_text: str) -> str:
-    notes_text = (notes_text or "").strip()
-    return "(none provided)" if not notes_text else notes_text
-
-def build_prompt(mode, request, notes, difficulty, notes_only, label_sources, strict_mode):
-    m = (mode or "").lower().strip()
-
-    base = (
-        f"{SYSTEM_PROMPT}\n\n"
-        f"USER NOTES (primary source):\n{build_context(notes)}\n\n"
-    )
+SESSION_TRACE_HISTORY = 20
+RUN_TIMING_HISTORY = 50
 
-    control_rules = f"""
-CONTROLS:
-- Notes-only mode: {notes_only}
-- Label sources: {label_sources}
-
-RULES:
-1) If Notes-only mode is TRUE:
-   - Use ONLY information explicitly present in USER NOTES.
-   - If notes are insufficient, output exactly:
-     "INSUFFICIENT NOTES" + a short list of what to add.
-   - Do NOT use outside/general nursing knowledge.
-
-2) If Label sources is TRUE:
-   - Tag major claims with:
-     [Notes] if supported by USER NOTES
-     [General] if not found in notes (only allowed when Notes-only mode is FALSE)
-
-3) If USER NOTES are empty AND Notes-only mode is TRUE:
-   - Output "INSUFFICIENT NOTES" immediately.
-""".strip()
-
-    strict_rules = """
-STRICT NCLEX MODE:
-- Keep answers concise (no long paragraphs).
-- Use bullets for rationales.
-- Do not hedge; choose ONE best answer.
-""".strip()
-
-    strict_block = ("\n\n" + strict_rules) if strict_mode else ""
-
-    nclex_quality_checklist = """
-NCLEX QUALITY CHECKLIST (must satisfy before final answer):
-- Did you clearly identify the Question Type?
-- Did you explicitly state which priority rule was used (ABCs, Safety, ADPIE, etc.)?
-- Did you choose assessment before intervention unless there was an immediate ABC threat?
-- Did you stay within nursing scope (no diagnosing/prescribing)?
-- Did you avoid adding facts not supported by USER NOTES when Notes-only mode is ON?
-- Did you use A–E answer format?
-""".strip()
-def build_ngn_case_prompt(topic: str) -> str:
-    return f"""
-You are NurseThink AI creating an NGN-style case progression for nursing students.
-
-Create a 3-stage case on this topic:
-TOPIC: {topic}
-
-OUTPUT MUST BE VALID JSON with this schema:
-{{
-  "title": "string",
-  "patient": {{
-    "age": int,
-    "sex": "string",
-    "setting": "string",
-    "history": ["string", ...]
-  }},
-  "stages": [
-    {{
-      "stage": 1,
-      "cues": ["string", ...],
-      "question": "string",
-      "options": {{
-        "key_cues": ["string", ...],
-        "hypotheses": ["string", ...],
-        "actions": ["string", ...],
-        "outcomes": ["string", ...]
-      }},
-      "best": {{
-        "key_cues": ["string", ...],
-        "hypothesis": "string",
-        "action": "string",
-        "outcome": "string"
-      }},
-      "rationale": "string",
-      "next_update": "string"
-    }},
-    ... stage 2 ...
-    ... stage 3 ...
-  ]
-}}
-
-Rules:
-- Make it NCLEX-safe and within nursing scope.
-- Use realistic vitals/labs but do not include medication prescribing beyond nursing protocols.
-- Ensure "best" answers are clearly supported by the cues.
-""".strip()
-import json
 
-def build_ngn_case_prompt(topic: str) -> str:
-    return f"""
-You are NurseThink AI creating an NGN-style case progression for nursing students.
-
-Create a 3-stage NGN case.
-
-TOPIC:
-{topic}
-
-OUTPUT FORMAT (STRICT JSON ONLY — NO EXTRA TEXT):
-
-{{
-  "title": "string",
-  "patient": {{
-    "age": 0,
-    "sex": "string",
-    "setting": "string",
-    "history": ["string"]
-  }},
-  "stages": [
-    {{
-      "stage": 1,
-      "cues": ["string"],
-      "question": "string",
-      "options": {{
-        "key_cues": ["string"],
-        "hypotheses": ["string"],
-        "actions": ["string"],
-        "outcomes": ["string"]
-      }},
-      "best": {{
-        "key_cues": ["string"],
-        "hypothesis": "string",
-        "action": "string",
-        "outcome": "string"
-      }},
-      "rationale": "string",
-      "next_update": "string"
-    }}
-  ]
-}}
-
-RULES:
-- NCLEX-safe
-- Nursing scope only
-- No medical diagnosis or prescribing
-- Cues must clearly support the best action
-""".strip()
-
-
-def generate_ngn_case(topic: str) -> dict:
-    prompt = build_ngn_case_prompt(topic)
-    text = get_ai_response(prompt)
-
-    try:
-        return json.loads(text)
-    except Exception:
-        start = text.find("{")
-        end = text.rfind("}")
-        if start != -1 and end != -1 and end > start:
-            return json.loads(text[start:end + 1])
-        raise ValueError("Could not parse NGN case JSON")
-def build_study_chat_prompt(notes: str, notes_only: bool, label_sources: bool, strict_mode: bool, chat_messages: list) -> str:
-    # keep last 12 messages so prompts don’t get huge
-    recent = chat_messages[-12:]
-
-    convo = "\n".join([f"{m['role'].upper()}: {m['content']}" for m in recent])
-
-    strict_rules = """
-STRICT NCLEX MODE:
-- Keep answers concise.
-- Use bullets for rationales.
-- Choose ONE best answer when applicable (no hedging).
-""".strip()
-
-    controls = f"""
-CONTROLS:
-- Notes-only mode: {notes_only}
-- Label sources: {label_sources}
-- Strict mode: {strict_mode}
-
-RULES:
-- This is a back-and-forth tutoring conversation.
-- Ask 1–2 clarifying questions if needed.
-- Use Socratic coaching: ask, then explain.
-- If Notes-only mode is TRUE, only use notes. If insufficient, output "INSUFFICIENT NOTES" and list what notes are needed.
-- If Label sources is TRUE, tag major claims [Notes] or [General] (General only allowed when Notes-only is FALSE).
-""".strip()
-
-    return f"""
-{SYSTEM_PROMPT}
-
-USER NOTES (primary source):
-{build_context(notes)}
-
-{controls}
-
-{strict_rules if strict_mode else ""}
-
-CONVERSATION SO FAR:
-{convo}
-
-Now respond to the student's latest message.
-""".strip()
-
-    # Helper: build full prompt for a given mode block
-    def pack(mode_block: str) -> str:
-        return (
-            base
-            + control_rules
-            + strict_block
-            + "\n\n"
-            + mode_block.strip()
-            + "\n\n"
-            + nclex_quality_checklist
-        )
+def start_trace(kind: str, mode: str = None) -> RequestTrace:
+    return RequestTrace(kind, mode, st.session_state.get("session_id"))
+
+
+def finish_trace(trace: RequestTrace):
+    """Record the trace and keep the latest few in this session for the timing panel."""
+    get_tracer().record(trace)
+    recent = st.session_state.setdefault("traces", [])
+    recent.append(trace.to_dict())
+    del recent[:-SESSION_TRACE_HISTORY]
+
+
+def render_stream(chunks, prefix: str = "", trace: RequestTrace = None) -> str:
+    """Render streamed text into a placeholder as it arrives; return the full text."""
+    placeholder = st.empty()
+    text = ""
+    render_seconds = 0.0
+    for chunk in chunks:
+        text += chunk
+        t = time.perf_counter()
+        placeholder.text(prefix + text + " ▌")
+        render_seconds += time.perf_counter() - t
+    text = text.strip()
+    t = time.perf_counter()
+    placeholder.text(prefix + text)
+    render_seconds += time.perf_counter() - t
+    if trace:
+        trace.add_span("render", render_seconds)
+    return text
+
+
+def queue_notice():
+    """on_queue callback for engine.stream_answer: the student's place in line, cleared when it's their turn."""
+    slot = st.empty()
+
+    def show(position: int):
+        if position:
+            slot.caption(f"⏳ Lots of students are asking right now — you're #{position} in line for the AI…")
+        else:
+            slot.empty()
+
+    return show
+
+
+def render_timings(timings: dict):
+    if not timings:
+        return
+    with st.expander("Debug: response timing", expanded=False):
+        ttft = timings.get("ttft")
+        total = timings.get("total")
+        st.write(f"Time to first token: {ttft * 1000:.0f} ms" if ttft is not None else "Time to first token: n/a")
+        st.write(f"Total time: {total:.2f}s" if total is not None else "Total time: n/a")
+        st.write(f"Characters: {timings.get('chars', 0):,} · Served from cache: {timings.get('cached', False)}")
+        st.write(f"Waited in line for the rate limit: {timings.get('queue_wait') or 0.0:.2f}s")
 
-    if m == "explain":
-        return pack(f"""
-MODE: EXPLAIN / TEACH
-REQUEST: {request}
-
-INSTRUCTIONS:
-- Explain using USER NOTES first.
-- If notes are missing details:
-  - If Notes-only is ON: output "INSUFFICIENT NOTES".
-  - Otherwise label that section "General overview" and tag [General] if labeling is ON.
-- Include a brief example of how it appears on exams.
-- If Label sources is ON, tag major claims [Notes] or [General].
-- End in A–E format.
-""")
-    if m == "mixed_drill":
-        return pack(f"""
-MODE: MIXED NCLEX DRILL
-QUESTION: {request}
-
-INSTRUCTIONS:
-- FIRST: Identify the Question Type as one of:
-  PRIORITY / DELEGATION / THERAPEUTIC COMMUNICATION
-- SECOND: Apply the correct decision engine for that question type.
-- THIRD: State explicitly which engine you used and why.
-
-ENGINE RULES:
-- If the question involves who to see first, what to do first, or unstable vs stable → PRIORITY engine.
-- If the question asks who can perform a task or who the RN can assign → DELEGATION engine.
-- If the question asks for the nurse’s best response → THERAPEUTIC engine.
-
-REQUIREMENTS:
-- First line MUST be: "Question Type: ___ (Engine Used)"
-- Do NOT blend engines—choose ONE.
-- If Label sources is ON, tag major claims [Notes] or [General].
-- If Notes-only is ON and notes lack rules for the identified engine, output "INSUFFICIENT NOTES".
-- End in A–E format.
-""")
-
-    if m == "priority":
-        return pack(f"""
-MODE: PRIORITY
-QUESTION: {request}
-
-PRIORITY DECISION ALGORITHM (must follow in order):
-1) ABCs / Oxygenation
-2) Safety
-3) Acute change > chronic
-4) Unstable > stable
-5) Assessment before intervention unless ABCs/safety threat
-6) Least invasive first
-7) Time-sensitive complications (post-op, OB, cardiac, neuro)
-RED FLAGS (any of these automatically win priority):
-- SpO₂ < 90%
-- Stridor, choking, inability to speak
-- Sudden chest pain + dyspnea
-- New confusion or LOC change
-- Active bleeding
-- Signs of sepsis
-- Did you clearly state which PRIORITY rule won and why?
-
-
-INSTRUCTIONS:
-- First line MUST be: "Question Type: PRIORITY"
-- Identify the FIRST rule in the algorithm that applies and state it explicitly.
-- Explain why this rule overrides other considerations.
-- If oxygenation or airway is threatened, intervene immediately.
-- If no immediate ABC/safety threat, choose assessment first.
-- If Label sources is ON, tag major claims [Notes] or [General].
-- If Notes-only is ON and notes lack priority rules, output "INSUFFICIENT NOTES".
-- End in A–E format.
-""")
-
-
-    if m == "quiz":
-        return pack(f"""
-MODE: QUIZ ME
-TOPIC: {request}
-DIFFICULTY: {difficulty}
-
-INSTRUCTIONS:
-- Write 1 NCLEX-style question (or NGN-style if appropriate).
-- Provide 4 options OR SATA.
-- Then answer using A–E format with rationales.
-- Add one simple mnemonic.
-- If Label sources is ON, tag major claims [Notes] or [General].
-- If Notes-only is ON and notes are insufficient, output "INSUFFICIENT NOTES".
-""")
-
-    if m == "mnemonics":
-        return pack(f"""
-MODE: MNEMONICS / MEMORY
-TOPIC: {request}
-
-INSTRUCTIONS:
-- Create: (1) mnemonic, (2) quick comparison, (3) test trigger cue.
-- If Label sources is ON, tag major claims [Notes] or [General].
-- If Notes-only is ON and notes are insufficient, output "INSUFFICIENT NOTES".
-- End in A–E format.
-""")
-
-    if m == "therapeutic":
-        return pack(f"""
-MODE: THERAPEUTIC COMMUNICATION
-PROMPT: {request}
-
-THERAPEUTIC DECISION HIERARCHY (must follow in order):
-1) Safety (self-harm, violence, abuse) → assess immediately
-2) Acknowledge emotion before giving facts
-3) Open-ended > closed-ended
-4) Assessment before advice or teaching
-5) Present-focused
-6) Client-centered language
-
-DO NOT CHOOSE (NCLEX traps):
-- False reassurance
-- Advice-giving
-- "Why" questions
-- Nurse-centered statements
-- Changing the subject
-- Premature teaching
-
-INSTRUCTIONS:
-- First line MUST be: "Question Type: THERAPEUTIC COMMUNICATION"
-- Provide the BEST therapeutic response as a **direct quote**.
-- Explain why it is therapeutic using the hierarchy.
-- Explain why 1–2 alternative responses are NOT therapeutic.
-- If Label sources is ON, tag major claims [Notes] or [General].
-- If Notes-only is ON and notes lack therapeutic principles, output "INSUFFICIENT NOTES".
-- End in A–E format.
-""")
-
-
-    if m == "delegation":
-        return pack(f"""
-MODE: DELEGATION
-QUESTION: {request}
-
-DELEGATION DECISION TREE (must follow in order):
-1) Unstable or new/worsening condition? → RN
-2) Requires assessment, teaching, or evaluation? → RN
-3) Stable and predictable? → consider LPN or UAP
-4) Routine, non-invasive, non-judgment task? → UAP
-5) If unsure → RN
-
-SCOPE RULES:
-- RN = A.T.E. (Assess initial, Teach initial, Evaluate)
-- LPN/LVN = stable clients, focused data, reinforce teaching
-- UAP = ADLs, routine vitals on stable clients, ambulation, I&O (no judgment)
-
-INSTRUCTIONS:
-- First line MUST be: "Question Type: DELEGATION"
-- State who the task is delegated to AND why.
-- Explicitly state why it cannot be delegated to the other roles.
-- If Label sources is ON, tag major claims [Notes] or [General].
-- If Notes-only is ON and notes lack delegation rules, output "INSUFFICIENT NOTES".
-- End in A–E format.
-""")
-
-
-
-def simulated_response(mode: str, request: str) -> str:
-    m = (mode or "").upper().strip()
-
-    return f"""
-Question Type: {m if m else "N/A"}
-
-A) Best answer:
-(DEMO) This is a simulated response.
-Turn on “Use real AI” for a real NCLEX-style answer.
-
-B) Why (nursing logic):
-(DEMO) The real AI would analyze this using:
-- ABCs
-- Safety
-- Acute vs chronic
-- Unstable vs stable
-- ADPIE (assess before intervene)
-
-C) Why others are wrong:
-(DEMO) Options would be ruled out if they:
-- Delay safety or oxygenation
-- Skip assessment
-- Require RN judgment when inappropriate
-- Focus on comfort before physiology
-
-D) Memory hook/mnemonic:
-(DEMO) “ABCs before TLC.”
-
-E) Test tip:
-(DEMO) Look for acute change, oxygen issues, and the word “first.”
-
---------------------------------
-Your question:
-{request}
-""".strip()
-
-def get_ai_response(prompt: str) -> str:
-    if not client:
-        return "❌ OpenAI API key not found. Please set OPENAI_API_KEY."
-
-    try:
-        response = client.responses.create(
-            model="gpt-4.1-mini",
-            input=prompt,
-            timeout=30,
-        )
-        return response.output_text.strip()
-    except Exception as e:
-        return f"AI error: {type(e).__name__}: {e}"
 
 # -------------------------
 # UI
 # -------------------------
+def render_session_traces():
+    traces = st.session_state.get("traces") or []
+    with st.expander("Session timing (latest requests)", expanded=False):
+        if not traces:
+            st.caption("No requests traced yet in this session.")
+            return
+        rows = []
+        for t in reversed(traces):
+            ttft = t.get("ttft_seconds")
+            rows.append({
+                "kind": t["kind"],
+                "mode": t.get("mode") or "",
+                "total ms": round(t["total_seconds"] * 1000),
+                "spans ms": ", ".join(f"{k}={v * 1000:.0f}" for k, v in t["spans"].items()),
+                "ttft ms": round(ttft * 1000) if ttft is not None else None,
+                "tokens in/out": f"{t.get('input_tokens', 0)}/{t.get('output_tokens', 0)}",
+                "cache": ", ".join(f"{k}:{v}" for k, v in t.get("cache", {}).items()),
+            })
+        st.dataframe(rows, use_container_width=True)
+        st.caption(f"All traces are appended to {TRACE_FILE}")
+
+
+def render_prompt_sizes(sections: list):
+    rows = [
+        {"section": name, "chars": chars, "~tokens": tokens}
+        for name, chars, tokens in prompt_section_sizes(sections)
+    ]
+    st.caption("Prompt sections (static prefix is shared and cacheable across users)")
+    st.table(rows)
+
+
+def render_selected_chunks(notes_text: str, query: str, token_budget: int):
+    notes_text = clean_notes(notes_text)
+    selected = select_notes_chunks(notes_text, query, token_budget)
+    with st.expander("Notes excerpts used", expanded=False):
+        if not selected:
+            st.caption("Notes fit within the budget — sent in full." if (notes_text or "").strip() else "No notes provided.")
+            return
+        total = len(get_notes_index(notes_text).chunks)
+        st.caption(f"{len(selected)} of {total} excerpts selected")
+        for i, score, text in selected:
+            st.markdown(f"**Excerpt {i + 1}** · score {score:.2f} · ~{estimate_tokens(text)} tokens")
+            st.text(text[:600] + ("…" if len(text) > 600 else ""))
+
+
+def record_run_time(scope: str, seconds: float):
+    """Script time per interaction: the whole app, or just the panel a fragment rerun redrew."""
+    runs = st.session_state.setdefault("run_timings", {}).setdefault(scope, [])
+    runs.append(seconds)
+    del runs[:-RUN_TIMING_HISTORY]
+
+
+def timed_fragment(fn):
+    """st.fragment that also records how long its own reruns take."""
+    def run(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            # Inside a full run the panel's time is already part of "full app"
+            if not st.session_state.get("full_run"):
+                record_run_time(fn.__name__, time.perf_counter() - t0)
+    run.__name__ = fn.__name__
+    return st.fragment(run)
+
+
+def rerun_panel():
+    # scope="fragment" is only allowed while a fragment is rerunning on its own
+    st.rerun(scope="app" if st.session_state.get("full_run") else "fragment")
+
+
+def render_run_timings():
+    timings = st.session_state.get("run_timings") or {}
+    with st.expander("Script time per interaction", expanded=False):
+        if not timings:
+            st.caption("Nothing recorded yet.")
+            return
+        st.table([
+            {
+                "rerun": scope,
+                "runs": len(runs),
+                "last ms": round(runs[-1] * 1000),
+                "median ms": round(statistics.median(runs) * 1000),
+            }
+            for scope, runs in timings.items()
+        ])
+        st.caption("Clicks inside the NGN and chat panels rerun only that panel, not the whole page.")
+
+
+def library_notes_preview(doc_ids: list):
+    """(notes box value, stored-notes sha or None) for the chosen documents; rebuilt only when the choice changes."""
+    key = tuple(doc_ids)
+    cached = st.session_state.get("notes_preview")
+    if cached is None or cached[0] != key:
+        cached = (key, *notes_preview(library.documents_text(student_id, doc_ids)))
+        st.session_state["notes_preview"] = cached
+    return cached[1], cached[2]
+
+
+def render_notes_payload():
+    payload = st.session_state.get("notes_payload")
+    if payload:
+        st.caption(
+            f"Notes box payload this rerun: {payload['widget_bytes'] / 1024:,.1f} KB "
+            f"(notes used in prompts: {payload['notes_bytes'] / 1024:,.0f} KB, kept on the server)"
+        )
+
+
+def render_session_memory():
+    with st.expander("Session memory", expanded=False):
+        rows = session_memory_report(st.session_state)
+        st.table([{"key": key, "KB": round(size / 1024, 1)} for key, size in rows[:12]])
+        chat = st.session_state["chat_messages"]
+        st.caption(
+            f"This session: ~{sum(size for _, size in rows) / 1024:.0f} KB · chat {len(chat)} message(s), "
+            f"{len(chat.texts)} in memory ({chat.resident_bytes / 1024:.1f} KB of a {chat.cap / 1024:.0f} KB cap)"
+        )
+        ss = get_session_stats()
+        st.caption(
+            f"All chats in this server process: {ss['chat_sessions']} · {ss['chat_messages']} message(s), "
+            f"{ss['chat_resident_messages']} resident ({ss['chat_resident_bytes'] / 1024:.0f} KB)"
+        )
+
 st.set_page_config(page_title="NurseThink AI (MVP)", layout="wide")
+if not engine.remote and get_client() and NGN_POOL_SIZE > 0:
+    # Starts the background refill on first run; cached for the life of the server
+    get_ngn_pool()
+if not engine.remote and get_client() and WARMUP_ENABLED:
+    # Template answers computed in the background, off the startup path
+    get_cache_warmer()
 st.title("🩺 NurseThink AI (MVP)")
 st.caption("Turn your notes into nursing-thinking practice (demo version)")
 # Safe defaults to prevent NameError across modes
 notes = ""
 request = ""
 show_prompt = False
+show_chunks = False
+show_debug = False
+notes_budget = NOTES_TOKEN_BUDGET
 generate = False
-ngn_topic = "Post-op respiratory complication"
+ngn_topic = DEFAULT_NGN_TOPIC
 ngn_start = False
 notes_only = False
 label_sources = True
@@ -537,6 +291,7 @@ strict_mode = True
 use_real_ai = False
 mode = "priority"
 difficulty = "medium"
+quiz_count = 1
 
 left, right = st.columns([1, 1])
 
@@ -566,37 +321,203 @@ with left:
 
     # NGN controls (only show in NGN mode)
     if mode == "ngn_case":
-        ngn_topic = st.text_input("NGN Case Topic (optional)", value="Post-op respiratory complication")
+        ngn_topic = st.text_input("NGN Case Topic (optional)", value=DEFAULT_NGN_TOPIC)
         ngn_start = st.button("Start new NGN case")
 
     # Quiz difficulty
     difficulty = st.selectbox("Quiz difficulty", ["easy", "medium", "hard"], index=1)
+    if mode == "quiz":
+        quiz_count = st.number_input("Questions per Generate", min_value=1, max_value=QUIZ_BATCH_MAX, value=1)
 
-    # Upload notes
-    uploaded = st.file_uploader(
+    # Upload notes (each file goes into this user's notes library once)
+    uploads = st.file_uploader(
         "Upload notes (TXT or PDF)",
         type=["txt", "pdf"],
-        accept_multiple_files=False
+        accept_multiple_files=True
     )
 
+    with st.expander("Upload limits", expanded=False):
+        max_upload_mb = st.number_input("Max file size (MB)", min_value=1, max_value=500, value=MAX_UPLOAD_MB)
+        max_pdf_pages = st.number_input(
+            "Max PDF pages to read (0 = all)", min_value=0, max_value=5000, value=0, step=50
+        )
+
     # Extract from upload
-    extracted_notes = ""
-    if uploaded is not None:
-        extracted = extract_text_from_upload(uploaded)
+    ingested = st.session_state["ingested_uploads"]
+    for uploaded in uploads or []:
+        if uploaded.file_id in ingested:
+            # Already handled on an earlier rerun of this session
+            continue
+        if uploaded.size > max_upload_mb * 1024 * 1024:
+            st.warning(f"{uploaded.name} is larger than {max_upload_mb} MB. Raise the limit or upload a smaller file.")
+            continue
+        data = uploaded.getvalue()
+        doc_key = upload_key(uploaded.name, data, int(max_pdf_pages) or None)
+        if library.has_text(doc_key):
+            # Someone (maybe this student, last visit) already uploaded these bytes: no extraction at all
+            doc_id, _ = library.add_document(student_id, uploaded.name, doc_key)
+            ingested[uploaded.file_id] = doc_id
+            st.session_state["library_docs"] = st.session_state["library_docs"] + [doc_id]
+            st.success(f"{uploaded.name} is already in the library — loaded without re-reading it")
+            continue
+
+        upload_trace = start_trace("upload")
+        if uploaded.name.lower().endswith(".pdf"):
+            # Big textbooks aren't read whole: index the outline and pages now, extract the
+            # pages a question needs when it's asked
+            with upload_trace.span("page_index"):
+                lazy_info = page_index.build(doc_key, data, int(max_pdf_pages) or None)
+            if lazy_info:
+                with upload_trace.span("library_index"):
+                    doc_id, _ = library.add_document(
+                        student_id, uploaded.name, doc_key, page_index.document_text(doc_key), lazy_info["pages"]
+                    )
+                upload_trace.set(bytes=uploaded.size, pages=lazy_info["pages"])
+                finish_trace(upload_trace)
+                ingested[uploaded.file_id] = doc_id
+                st.session_state["library_docs"] = st.session_state["library_docs"] + [doc_id]
+                st.success(f"Loaded notes from: {uploaded.name}")
+                st.caption(
+                    f"Indexed {lazy_info['pages']:,} pages ({lazy_info['outline']} bookmarks) in "
+                    f"{lazy_info['seconds']:.2f}s — pages are read when a question needs them"
+                )
+                continue
+
+        progress_bar = st.empty()
+
+        def show_progress(done, total):
+            progress_bar.progress(done / total, text=f"{uploaded.name}: reading page {done}/{total}…")
+
+        with upload_trace.span("extraction"):
+            extracted, extract_info = extract_upload_with_stats(
+                uploaded, max_pages=int(max_pdf_pages) or None, progress=show_progress
+            )
+        upload_trace.cache("extraction", extract_info["source"] != "extracted")
+        upload_trace.set(bytes=uploaded.size, chars=len(extracted))
         if extracted:
+            with upload_trace.span("library_index"):
+                doc_id, _ = library.add_document(
+                    student_id, uploaded.name, doc_key, extracted, extract_info.get("pages", 0)
+                )
+        finish_trace(upload_trace)
+        progress_bar.empty()
+        if extracted:
+            ingested[uploaded.file_id] = doc_id
+            st.session_state["library_docs"] = st.session_state["library_docs"] + [doc_id]
             st.success(f"Loaded notes from: {uploaded.name}")
-            extracted_notes = extracted
+            if extract_info.get("skipped_pages"):
+                st.warning(
+                    f"{extract_info['skipped_pages']} page(s) took too long or failed and were skipped."
+                )
+            if extract_info["source"] == "extracted":
+                st.caption(f"Extracted in {extract_info['seconds']:.2f}s (cache miss)")
+            else:
+                st.caption(
+                    f"Cache hit ({extract_info['source']}) in {extract_info['seconds'] * 1000:.1f} ms — "
+                    f"saved {extract_info['extract_seconds']:.2f}s of extraction"
+                )
         else:
-            st.warning("I couldn’t extract text from that file. Try a .txt export or copy/paste notes.")
-            extracted_notes = ""
+            ingested[uploaded.file_id] = None
+            st.warning(f"I couldn’t extract text from {uploaded.name}. Try a .txt export or copy/paste notes.")
+
+    if uploads:
+        with st.expander("Extraction cache stats", expanded=False):
+            cache_stats = get_extraction_cache().stats
+            st.write(
+                f"Hits: {cache_stats['memory_hits']} memory / {cache_stats['disk_hits']} disk · "
+                f"Misses: {cache_stats['misses']}"
+            )
+            st.write(
+                f"Time spent extracting: {cache_stats['extract_seconds']:.2f}s · "
+                f"Time saved by cache: {cache_stats['saved_seconds']:.2f}s"
+            )
+            page_stats = page_index.stats
+            if page_stats["indexed"] or page_stats["requests"]:
+                st.write(
+                    f"Large PDFs indexed: {page_stats['indexed']} in {page_stats['index_seconds']:.2f}s · "
+                    f"pages read on demand: {page_stats['pages_extracted']} in {page_stats['extract_seconds']:.2f}s "
+                    f"({page_stats['page_hits']} from the page cache)"
+                )
 
-    # Notes box (prefill with extracted notes if available)
-    notes = st.text_area(
+    # Notes library: pick which documents feed the notes box, and search across all of them
+    notes_value, notes_sha = "", None
+    library_docs = library.list_documents(student_id)
+    if library_docs:
+        doc_names = {d["id"]: d["name"] for d in library_docs}
+        st.session_state["library_docs"] = [i for i in st.session_state["library_docs"] if i in doc_names]
+        with st.expander(f"My notes library ({len(library_docs)} document(s))", expanded=False):
+            chosen_docs = st.multiselect(
+                "Use as notes",
+                list(doc_names),
+                format_func=lambda i: doc_names[i],
+                key="library_docs",
+            )
+            library_query = st.text_input("Search my notes")
+            if library_query.strip():
+                t0 = time.perf_counter()
+                hits = library.search(student_id, library_query)
+                st.caption(
+                    f"{len(hits)} passage(s) across {len(library_docs)} document(s) in "
+                    f"{(time.perf_counter() - t0) * 1000:.1f} ms"
+                )
+                for hit in hits:
+                    where = f"p. {hit['page'] + 1}" if hit["page"] is not None else f"passage {hit['chunk'] + 1}"
+                    st.markdown(f"**{hit['name']}** · {where}  \n{hit['snippet']}")
+            remove_doc = st.selectbox(
+                "Remove a document", [None] + list(doc_names), format_func=lambda i: doc_names.get(i, "—")
+            )
+            if remove_doc is not None and st.button("Remove from library"):
+                library.remove_document(student_id, remove_doc)
+                st.rerun()
+            st.caption(
+                "Bookmark this page to find your documents next visit. The link is the only key to "
+                "this library: anyone you share it with can read and remove your documents."
+            )
+        notes_value, notes_sha = library_notes_preview(chosen_docs)
+    from_library = notes_sha is not None
+    if not from_library and st.session_state.get("pasted_notes"):
+        notes_value, notes_sha = st.session_state["pasted_notes"]
+
+    # Notes box (prefill with extracted notes if available). Long notes stay on the server:
+    # the box only holds a preview, so megabytes don't cross the websocket on every rerun
+    notes_box = st.text_area(
         "Notes (paste or upload above)",
-        value=extracted_notes,
+        value=notes_value,
         height=220,
-        placeholder="Paste lecture notes, study guide, etc."
+        placeholder="Paste lecture notes, study guide, etc.",
+        help="Long documents show only their beginning here; the whole text is still used." if notes_sha else None,
+    )
+    notes = resolve_notes(notes_box, notes_sha)
+    if not from_library and len(notes_box) > NOTES_PREVIEW_CHARS and notes == notes_box:
+        # A long paste: store it too, and from the next rerun on the box holds its preview
+        st.session_state["pasted_notes"] = notes_preview(notes_box)
+    st.session_state["notes_payload"] = {
+        "widget_bytes": len(notes_value.encode("utf-8")) + len(notes_box.encode("utf-8")),
+        "notes_bytes": len(notes.encode("utf-8")),
+    }
+
+    notes_budget = st.number_input(
+        "Notes token budget (large notes are searched, not sent whole)",
+        min_value=200,
+        max_value=20000,
+        value=NOTES_TOKEN_BUDGET,
+        step=100,
     )
+    if notes.strip():
+        cleanup = notes_cleanup_stats(notes)
+        removed = cleanup["tokens_before"] - cleanup["tokens_after"]
+        if removed > 0:
+            st.caption(
+                f"Cleanup trimmed ~{removed:,} tokens ({removed / cleanup['tokens_before']:.0%}): "
+                f"{cleanup['boilerplate_lines']} header/footer/page-number line(s), "
+                f"{cleanup['hyphen_joins']} hyphenated word(s) rejoined, "
+                f"{cleanup['duplicate_paragraphs']} duplicate paragraph(s) dropped"
+            )
+        if cleanup["tokens_after"] > notes_budget:
+            st.caption(
+                f"Notes are ~{cleanup['tokens_after']:,} tokens — only the most relevant "
+                f"excerpts (up to ~{notes_budget:,} tokens) will be sent per request."
+            )
 
     # Question / scenario
     request = st.text_area(
@@ -607,221 +528,472 @@ with left:
     )
 
     show_prompt = st.checkbox("Show generated prompt", value=False)
+    show_chunks = st.checkbox("Show selected notes excerpts", value=False)
+    show_debug = st.checkbox("Show debug timing", value=False)
 
     # Main action button (always exists for non-NGN modes)
     generate = st.button("Generate", type="primary")
 
+    if show_debug:
+        render_session_traces()
+        render_run_timings()
+        render_session_memory()
+        render_notes_payload()
+
+    if use_real_ai:
+        with st.expander("Question bank", expanded=False):
+            bs = bank.stats
+            st.write(
+                f"Items stored: {bank.count('quiz')} quiz · {bank.count('ngn_case')} NGN cases · "
+                f"Hit rate: {bank.hit_rate():.0%} ({bs['hits']} served from the bank, {bs['misses']} generated)"
+            )
 
-with right:
-    st.subheader("Output")
-
-    if mode == "ngn_case":
-        # Start a new case
-        if ngn_start:
-            if not use_real_ai:
-                st.error("NGN case generation requires Real AI ON.")
-                st.stop()
-            with st.spinner("Generating NGN case…"):
-                st.session_state["ngn_case_data"] = generate_ngn_case(ngn_topic)
-                st.session_state["ngn_stage"] = 0
-                st.session_state["ngn_history"] = []
-
-        case = st.session_state.get("ngn_case_data")
-
-        if not case:
-            st.info("Click **Start new NGN case** to generate a case progression.")
-        else:
-            st.markdown(f"### {case.get('title','NGN Case')}")
-            patient = case.get("patient", {})
-            st.markdown(
-                f"**Patient:** {patient.get('age','?')}-year-old {patient.get('sex','?')} | "
-                f"**Setting:** {patient.get('setting','?')}"
+    if use_real_ai and not engine.remote:
+        with st.expander("Response cache stats", expanded=False):
+            rc = get_response_cache().summary()
+            st.write(
+                f"Hits: {rc['hits']} · Misses: {rc['misses']} · Stored: {rc['stores']} · "
+                f"Evicted: {rc['evictions']}"
             )
-            if patient.get("history"):
-                st.markdown("**History:**")
-                for h in patient["history"]:
-                    st.markdown(f"- {h}")
-
-            stage_idx = st.session_state["ngn_stage"]
-            stages = case.get("stages", [])
-            if stage_idx >= len(stages):
-                st.success("Case complete ✅")
-                if st.session_state["ngn_history"]:
-                    st.markdown("### Your performance summary")
-                    correct = sum(1 for x in st.session_state["ngn_history"] if x["score"] == 4)
-                    st.write(f"Perfect stages: {correct}/{len(st.session_state['ngn_history'])}")
-                st.stop()
-
-            stage = stages[stage_idx]
-            st.markdown(f"## Stage {stage.get('stage', stage_idx+1)}")
-            st.markdown("**Cues:**")
-            for c in stage.get("cues", []):
-                st.markdown(f"- {c}")
-
-            st.markdown(f"**Prompt:** {stage.get('question','')}")
-
-            opts = stage.get("options", {})
-            best = stage.get("best", {})
-
-            # Student inputs
-            chosen_key_cues = st.multiselect(
-                "Select key cues (choose 2–4)",
-                opts.get("key_cues", []),
-                key=f"kc_{stage_idx}"
+            st.write(f"Entries on disk: {rc['entries']} ({rc['bytes'] / 1024:.0f} KB)")
+            sf = get_single_flight().stats
+            st.write(
+                f"In-flight sharing: {sf['upstream']} upstream call(s) · {sf['coalesced']} identical "
+                f"request(s) attached to one already running · {sf['cross_process_hits']} answered by another worker"
             )
-            chosen_hypothesis = st.radio(
-                "Most likely hypothesis",
-                opts.get("hypotheses", []),
-                key=f"hyp_{stage_idx}"
+            if WARMUP_ENABLED:
+                ws = get_cache_warmer().stats
+                last = time.strftime("%H:%M", time.localtime(ws["last_run"])) if ws["last_run"] else "not yet"
+                st.write(
+                    f"Template warm-up: {ws['prompts']} prompts · {ws['warmed']} answered · {ws['fresh']} already "
+                    f"fresh · {ws['failed']} failed · last pass {last}"
+                )
+        with st.expander("Model service health", expanded=False):
+            up = get_upstream_stats()
+            st.write(
+                f"Circuit breaker: **{get_circuit_breaker().state}** · Calls: {up['calls']} · "
+                f"Retries: {up['retries']} · Fallback answers: {up['fallbacks']}"
             )
-            chosen_action = st.radio(
-                "Priority nursing action",
-                opts.get("actions", []),
-                key=f"act_{stage_idx}"
+            st.write(
+                f"Rate limited: {up['rate_limited']} · Server errors: {up['server_error']} · "
+                f"Timeouts: {up['timeout']} · Connection errors: {up['connection']} · "
+                f"Failed fast: {up['breaker_rejected']}"
             )
-            chosen_outcome = st.radio(
-                "Expected outcome / evaluation",
-                opts.get("outcomes", []),
-                key=f"out_{stage_idx}"
+            sc = get_model_scheduler().stats
+            avg_wait = sc["wait_seconds"] / sc["admitted"] if sc["admitted"] else 0.0
+            st.write(
+                f"Rate limiter: {sc['admitted']} calls admitted ({sc['admitted_background']} background) · "
+                f"{sc['queued']} had to wait · avg wait {avg_wait:.2f}s · max {sc['max_wait_seconds']:.1f}s · "
+                f"{sc['waiting']} in line now"
             )
 
-            submit_stage = st.button("Submit Stage", key=f"submit_{stage_idx}")
-
-            if submit_stage:
-                # Simple scoring: 1 point each component
-                score = 0
-                # key cues scoring: award 1 if majority overlap
-                best_kc = set(best.get("key_cues", []))
-                chosen_kc = set(chosen_key_cues)
-                if best_kc and len(best_kc.intersection(chosen_kc)) >= max(1, len(best_kc)//2):
-                    score += 1
-                if chosen_hypothesis == best.get("hypothesis"):
-                    score += 1
-                if chosen_action == best.get("action"):
-                    score += 1
-                if chosen_outcome == best.get("outcome"):
-                    score += 1
-
-                st.session_state["ngn_history"].append({
-                    "stage": stage.get("stage", stage_idx+1),
-                    "score": score,
-                    "chosen": {
-                        "key_cues": list(chosen_kc),
-                        "hypothesis": chosen_hypothesis,
-                        "action": chosen_action,
-                        "outcome": chosen_outcome
-                    }
-                })
-
-                # Feedback
-                st.markdown("### Feedback")
-                st.write(f"Score: **{score}/4**")
-
-                st.markdown("**Best answers:**")
-                st.write(f"- Key cues: {best.get('key_cues')}")
-                st.write(f"- Hypothesis: {best.get('hypothesis')}")
-                st.write(f"- Action: {best.get('action')}")
-                st.write(f"- Outcome: {best.get('outcome')}")
-
-                st.markdown("**Rationale:**")
-                st.write(stage.get("rationale", ""))
-
-                st.markdown("**Next update:**")
-                st.write(stage.get("next_update", ""))
-
-                if st.button("Continue to next stage"):
-                    st.session_state["ngn_stage"] += 1
-                    st.rerun()
-
-        st.stop()
-    if mode == "study_chat":
-        st.markdown("### Study Chat")
-
-        # Optional: clear chat
-        col_a, col_b = st.columns([1, 1])
-        with col_a:
-            if st.button("Clear chat"):
-                st.session_state["chat_messages"] = []
-                st.rerun()
-
-        # Show conversation
-        for msg in st.session_state["chat_messages"]:
-            if msg["role"] == "user":
-                st.markdown(f"**You:** {msg['content']}")
-            else:
-                st.markdown(f"**NurseThink:** {msg['content']}")
 
-        # Input
-        chat_input = st.text_area(
-            "Type your message",
-            height=100,
-            placeholder="Ask a question, paste a scenario, or say 'quiz me on cardiac meds'..."
+# -------------------------
+# Output panels (fragments: a click inside one reruns only that panel)
+# -------------------------
+# Fragment reruns reuse the arguments from the last full run. That's what we want for
+# the left-column inputs (changing any of them is a full run anyway), but one-shot
+# values like button clicks must be handled outside the fragment.
+@timed_fragment
+def ngn_panel():
+    ngn_stream = st.session_state.get("ngn_case_stream")
+    if ngn_stream is not None:
+        if ngn_stream.header is None and not ngn_stream.done:
+            with st.spinner("Generating NGN case…"):
+                ngn_stream.wait_for_header()
+        if ngn_stream.done and not ngn_stream.error and not ngn_stream.banked:
+            # Finished cases go into the bank for the next student (this one has now seen it)
+            bank.add_ngn_case(ngn_stream.topic, ngn_stream.snapshot(), seen_by=student_id)
+            ngn_stream.banked = True
+        if ngn_stream.error and not ngn_stream.stages:
+            st.error(f"Couldn’t generate the NGN case: {ngn_stream.error}")
+            return
+
+    # Read from the stream each run rather than keeping a second copy of the case in session_state
+    case = ngn_stream.snapshot() if ngn_stream is not None else None
+
+    with st.expander("NGN generation stats", expanded=False):
+        # Counted where the cases are generated; with a remote engine see its /metrics
+        ngn_stats = get_ngn_stats()
+        generated = max(1, ngn_stats["cases"])
+        st.write(
+            f"Cases: {ngn_stats['cases']} · Parse failures: {ngn_stats['parse_failures']} "
+            f"({ngn_stats['parse_failures'] / generated:.0%}) · Invalid: {ngn_stats['invalid_cases']} "
+            f"({ngn_stats['invalid_cases'] / generated:.0%})"
+        )
+        st.write(
+            f"Repaired without full regeneration: {ngn_stats['repaired_cases']} "
+            f"({ngn_stats['repair_requests']} repair requests) · Unrecoverable: {ngn_stats['failed_cases']}"
         )
-        send = st.button("Send")
 
-        if send:
-            if not chat_input.strip():
-                st.warning("Type a message first.")
-                st.stop()
+    if not case:
+        st.info("Click **Start new NGN case** to generate a case progression.")
+        return
 
-            if notes_only and not notes.strip():
-                st.error("Notes-only mode is ON, but no notes were provided. Upload/paste notes or turn Notes-only off.")
-                st.stop()
+    st.markdown(f"### {case.title}")
+    patient = case.patient
+    st.markdown(
+        f"**Patient:** {patient.age}-year-old {patient.sex} | "
+        f"**Setting:** {patient.setting}"
+    )
+    if patient.history:
+        st.markdown("**History:**")
+        for h in patient.history:
+            st.markdown(f"- {h}")
+
+    stage_idx = st.session_state["ngn_stage"]
+    stages = case.stages
+    if stage_idx >= len(stages) and ngn_stream is not None and not ngn_stream.done:
+        # Only wait when the stage we need truly isn't written yet
+        with st.spinner(f"Writing stage {stage_idx + 1}…"):
+            ngn_stream.wait_for_stage(stage_idx)
+        case = ngn_stream.snapshot()
+        stages = case.stages
+    if ngn_stream is not None and not ngn_stream.done:
+        st.caption(f"{len(stages)} stage(s) ready — the rest of the case is still being written…")
+    if stage_idx >= len(stages):
+        st.success("Case complete ✅")
+        history = st.session_state["ngn_history"]
+        if len(history):
+            st.markdown("### Your performance summary")
+            st.write(f"Perfect stages: {history.perfect()}/{len(history)}")
+        return
+
+    stage = stages[stage_idx]
+    st.markdown(f"## Stage {stage.stage}")
+    st.markdown("**Cues:**")
+    for c in stage.cues:
+        st.markdown(f"- {c}")
+
+    st.markdown(f"**Prompt:** {stage.question}")
+
+    opts = stage.options
+    best = stage.best
+
+    # Student inputs
+    chosen_key_cues = st.multiselect(
+        "Select key cues (choose 2–4)",
+        opts.key_cues,
+        key=f"kc_{stage_idx}"
+    )
+    chosen_hypothesis = st.radio(
+        "Most likely hypothesis",
+        opts.hypotheses,
+        key=f"hyp_{stage_idx}"
+    )
+    chosen_action = st.radio(
+        "Priority nursing action",
+        opts.actions,
+        key=f"act_{stage_idx}"
+    )
+    chosen_outcome = st.radio(
+        "Expected outcome / evaluation",
+        opts.outcomes,
+        key=f"out_{stage_idx}"
+    )
 
-            # Add user message
-            st.session_state["chat_messages"].append({"role": "user", "content": chat_input.strip()})
+    submit_stage = st.button("Submit Stage", key=f"submit_{stage_idx}")
+    feedback = st.session_state.get("ngn_feedback")
+
+    if submit_stage:
+        score = score_ngn_stage(stage, chosen_key_cues, chosen_hypothesis, chosen_action, chosen_outcome)
+        chosen_kc = set(chosen_key_cues)
+
+        st.session_state["ngn_history"].add(stage.stage, score, json.dumps({
+            "key_cues": list(chosen_kc),
+            "hypothesis": chosen_hypothesis,
+            "action": chosen_action,
+            "outcome": chosen_outcome
+        }))
+
+        feedback = {"stage_idx": stage_idx, "score": score}
+        st.session_state["ngn_feedback"] = feedback
+
+    # Feedback stays up after Submit so "Continue" survives the rerun its own click causes
+    if feedback and feedback["stage_idx"] == stage_idx:
+        st.markdown("### Feedback")
+        st.write(f"Score: **{feedback['score']}/4**")
+
+        st.markdown("**Best answers:**")
+        st.write(f"- Key cues: {best.key_cues}")
+        st.write(f"- Hypothesis: {best.hypothesis}")
+        st.write(f"- Action: {best.action}")
+        st.write(f"- Outcome: {best.outcome}")
+
+        st.markdown("**Rationale:**")
+        st.write(stage.rationale)
+
+        if stage.next_update:
+            st.markdown("**Next update:**")
+            st.write(stage.next_update)
+
+        if st.button("Continue to next stage"):
+            st.session_state["ngn_stage"] += 1
+            st.session_state["ngn_feedback"] = None
+            rerun_panel()
+
+
+@timed_fragment
+def chat_panel(notes, notes_only, label_sources, strict_mode, use_real_ai, notes_budget, show_debug, show_chunks):
+    st.markdown("### Study Chat")
+    if st.session_state["chat_memory"] is None:
+        st.session_state["chat_memory"] = new_chat_memory()
+
+    # Optional: clear chat
+    col_a, col_b = st.columns([1, 1])
+    with col_a:
+        if st.button("Clear chat"):
+            st.session_state["chat_messages"].clear()
+            st.session_state["chat_memory"] = new_chat_memory()
+            st.session_state["chat_pages"] = 1
+            rerun_panel()
+
+    # Show conversation: the newest page, older pages read back from disk on request
+    chat = st.session_state["chat_messages"]
+    first = max(0, len(chat) - st.session_state["chat_pages"] * CHAT_PAGE_SIZE)
+    if first > 0 and st.button(f"Show earlier messages ({first} more)"):
+        st.session_state["chat_pages"] += 1
+        rerun_panel()
+    for msg in chat.messages(first, len(chat)):
+        if msg["role"] == "user":
+            st.markdown(f"**You:** {msg['content']}")
+        else:
+            st.markdown(f"**NurseThink:** {msg['content']}")
+
+    if show_debug:
+        render_timings(st.session_state.get("last_timings"))
+        prompt_tokens = chat.prompt_tokens
+        if prompt_tokens:
+            memory = st.session_state["chat_memory"]
+            st.caption(
+                f"Last prompt ~{prompt_tokens[-1]:,} tokens · "
+                f"{memory['summarized_upto']} earlier message(s) folded into the summary "
+                f"({memory['summaries']} summary update(s))"
+            )
+            st.line_chart({"prompt tokens per turn": list(prompt_tokens)})
 
-            if not use_real_ai:
-                # Demo response (no API call)
-                demo_reply = "*(DEMO)* Turn on **Use real AI** to chat back-and-forth. You can also upload notes for more accurate coaching."
-                st.session_state["chat_messages"].append({"role": "assistant", "content": demo_reply})
-                st.rerun()
+    if show_chunks and st.session_state["chat_messages"]:
+        render_selected_chunks(notes, latest_user_message(st.session_state["chat_messages"]), notes_budget)
 
-            # Real AI response
-            prompt = build_study_chat_prompt(notes, notes_only, label_sources, strict_mode, st.session_state["chat_messages"])
-            with st.spinner("Thinking…"):
-                reply = get_ai_response(prompt)
+    # Input
+    chat_input = st.text_area(
+        "Type your message",
+        height=100,
+        placeholder="Ask a question, paste a scenario, or say 'quiz me on cardiac meds'..."
+    )
+    send = st.button("Send")
+
+    if not send:
+        return
+    if not chat_input.strip():
+        st.warning("Type a message first.")
+        return
+
+    if notes_only and not notes.strip():
+        st.error("Notes-only mode is ON, but no notes were provided. Upload/paste notes or turn Notes-only off.")
+        return
+
+    # Add user message
+    st.session_state["chat_messages"].append({"role": "user", "content": chat_input.strip()})
+
+    if not use_real_ai:
+        # Demo response (no API call)
+        demo_reply = "*(DEMO)* Turn on **Use real AI** to chat back-and-forth. You can also upload notes for more accurate coaching."
+        st.session_state["chat_messages"].append({"role": "assistant", "content": demo_reply})
+        rerun_panel()
+
+    # Real AI response
+    chat_trace = start_trace("chat", "study_chat")
+    memory = st.session_state["chat_memory"]
+    with chat_trace.span("memory"):
+        slid = update_chat_memory(memory, st.session_state["chat_messages"], summarize=engine.summarize_chat)
+    if slid:
+        st.caption("Summarized earlier turns to keep the prompt small.")
+    with chat_trace.span("prompt_build"):
+        prompt = build_study_chat_prompt(
+            notes, notes_only, label_sources, strict_mode, st.session_state["chat_messages"], notes_budget, memory
+        )
+    st.session_state["chat_messages"].record_prompt_tokens(estimate_tokens(prompt))
+    st.markdown(f"**You:** {chat_input.strip()}")
+    timings = {}
+    reply = render_stream(
+        engine.stream_answer(
+            prompt, mode="study_chat", timings=timings, trace=chat_trace, request=chat_input.strip(), on_queue=queue_notice()
+        ),
+        prefix="NurseThink: ",
+        trace=chat_trace,
+    )
 
-            st.session_state["chat_messages"].append({"role": "assistant", "content": reply})
-            st.rerun()
+    st.session_state["chat_messages"].append({"role": "assistant", "content": reply})
+    st.session_state["last_timings"] = timings
+    finish_trace(chat_trace)
+    rerun_panel()
+
+
+@timed_fragment
+def output_panel(mode, request, notes, difficulty, notes_only, label_sources, strict_mode, notes_budget,
+                 use_real_ai, quiz_count, show_prompt, show_chunks, show_debug, generate):
+    # No widgets of its own, so this only ever runs as part of the full run that Generate starts
+    if not generate:
+        st.info("Choose a mode, paste notes + a scenario, then click Generate.")
+        return
+    if not request.strip():
+        st.warning("Add a question/scenario first.")
+        return
+
+    # Guard: notes-only mode
+    if notes_only and not notes.strip():
+        st.error(
+            "Notes-only mode is ON, but no notes were provided. "
+            "Upload/paste notes or turn Notes-only off."
+        )
+        return
+
+    gen_trace = start_trace("generate", mode)
+    routing = {}
+    with gen_trace.span("prompt_build"):
+        prompt_sections = build_prompt_sections(
+            mode,
+            request,
+            notes,
+            difficulty,
+            notes_only,
+            label_sources,
+            strict_mode,
+            notes_budget,
+            routing
+        )
+        prompt = join_sections(prompt_sections)
+    if routing:
+        gen_trace.set(routed_to=routing["mode"], route_confidence=round(routing["confidence"], 3))
+        if routing["mode"]:
+            st.caption(
+                f"Question type: **{routing['mode'].upper()}** ({routing['confidence']:.0%}, picked locally in "
+                f"{routing['seconds'] * 1000:.2f} ms) — sent the {routing['mode']} prompt "
+                f"(~{routing['routed_tokens']:,} prefix tokens vs ~{routing['mixed_tokens']:,} mixed)"
+            )
+        else:
+            st.caption(
+                f"Question type unclear locally ({routing['label']} at {routing['confidence']:.0%}) — "
+                "the model will pick the engine"
+            )
 
-        st.stop()
+    if show_chunks:
+        render_selected_chunks(notes, request, notes_budget)
+
+    if show_prompt:
+        st.markdown("**Generated Prompt**")
+        render_prompt_sizes(prompt_sections)
+        st.code(prompt, language="text")
+
+    if use_real_ai and mode == "quiz" and quiz_count > 1:
+        st.markdown(f"**Quiz set (Real AI) — {quiz_count} questions**")
+        progress_bar = st.progress(0.0, text="Generating questions…")
+        delivered = 0
+        duplicates = 0
+        gen_trace.kind = "quiz_batch"
+        batch_start = time.perf_counter()
+        variant = bank_variant(notes, notes_only, label_sources, strict_mode)
+        # Unseen banked questions first; only the shortfall goes to the model
+        banked = bank.take(student_id, "quiz", request, difficulty, variant, limit=int(quiz_count))
+        gen_trace.set(from_bank=len(banked))
+        for _, text in banked:
+            delivered += 1
+            with st.expander(f"Question {delivered} · from the question bank", expanded=delivered == 1):
+                st.text(text)
+        progress_bar.progress(min(1.0, delivered / quiz_count), text=f"{delivered}/{quiz_count} ready")
+        remaining = int(quiz_count) - len(banked)
+        batch = engine.quiz_batch(prompt, remaining, user=gen_trace.session_id) if remaining else []
+        for item in batch:
+            gen_trace.add("input_tokens", estimate_tokens(prompt))
+            gen_trace.add("output_tokens", estimate_tokens(item["text"]))
+            gen_trace.add_span("queue_wait", item["queue_wait"])
+            if item["status"] == "duplicate":
+                duplicates += 1
+                continue
+            if item["status"] == "ok":
+                bank.add("quiz", request, item["text"], difficulty, variant, seen_by=student_id)
+            delivered += 1
+            progress_bar.progress(
+                min(1.0, delivered / quiz_count),
+                text=f"{delivered}/{quiz_count} ready · {item['seconds']:.1f}s elapsed",
+            )
+            with st.expander(f"Question {delivered}", expanded=delivered == 1):
+                st.text(item["text"])
+        progress_bar.empty()
+        gen_trace.add_span("model", time.perf_counter() - batch_start)
+        gen_trace.set(questions=delivered, duplicates=duplicates)
+        finish_trace(gen_trace)
+        st.caption(
+            f"{delivered} questions"
+            + (f" · {len(banked)} from the question bank" if banked else "")
+            + (f" · {duplicates} near-duplicate(s) dropped" if duplicates else "")
+        )
+    elif use_real_ai:
+        variant = bank_variant(notes, notes_only, label_sources, strict_mode)
+        banked = bank.take(student_id, "quiz", request, difficulty, variant) if mode == "quiz" else []
+        if banked:
+            gen_trace.cache("question_bank", True)
+            st.markdown("**Response (from the question bank)**")
+            st.text(banked[0][1])
+            finish_trace(gen_trace)
+            return
+        if mode == "quiz":
+            gen_trace.cache("question_bank", False)
+        st.markdown("**Response (Real AI)**")
+        timings = {}
+        answer = render_stream(
+            engine.stream_answer(prompt, mode=mode, timings=timings, trace=gen_trace, request=request, on_queue=queue_notice()),
+            trace=gen_trace,
+        )
+        if mode == "quiz" and answer and not timings.get("error"):
+            bank.add("quiz", request, answer, difficulty, variant, seen_by=student_id)
+        st.session_state["last_timings"] = timings
+        finish_trace(gen_trace)
+        if show_debug:
+            render_timings(timings)
+    else:
+        st.markdown("**Response (Simulated Demo)**")
+        st.text(simulated_response(routing.get("mode") or mode, request))
 
-        # ---- Existing non-NGN output logic below here ----
-    if mode not in ["ngn_case", "study_chat"]:
-        if generate:
-            if not request.strip():
-                st.warning("Add a question/scenario first.")
-            else:
-                # Guard: notes-only mode
-                if notes_only and not notes.strip():
-                    st.error(
-                        "Notes-only mode is ON, but no notes were provided. "
-                        "Upload/paste notes or turn Notes-only off."
-                    )
-                    st.stop()
-
-                prompt = build_prompt(
-                    mode,
-                    request,
-                    notes,
-                    difficulty,
-                    notes_only,
-                    label_sources,
-                    strict_mode
-                )
 
-                if show_prompt:
-                    st.markdown("**Generated Prompt**")
-                    st.code(prompt, language="text")
+with right:
+    st.subheader("Output")
 
-                if use_real_ai:
-                    st.markdown("**Response (Real AI)**")
-                    with st.spinner("Thinking…"):
-                        answer = get_ai_response(prompt)
-                    st.text(answer)
+    if mode == "ngn_case":
+        ngn_ready = True
+        # Start a new case
+        if ngn_start:
+            if not use_real_ai:
+                st.error("NGN case generation requires Real AI ON.")
+                ngn_ready = False
+            else:
+                ngn_trace = start_trace("ngn_case", "ngn_case")
+                banked_case = bank.take_ngn_case(student_id, ngn_topic)
+                ngn_trace.cache("question_bank", banked_case is not None)
+                if banked_case is not None:
+                    ngn_stream = NGNCaseStream.from_case(ngn_topic, banked_case)
+                    ngn_stream.banked = True
+                    finish_trace(ngn_trace)
                 else:
-                    st.markdown("**Response (Simulated Demo)**")
-                    st.text(simulated_response(mode, request))
-        else:
-            st.info("Choose a mode, paste notes + a scenario, then click Generate.")
+                    ngn_stream = engine.start_ngn_case(ngn_topic, ngn_trace, get_tracer())
+                st.session_state["ngn_case_stream"] = ngn_stream
+                st.session_state["ngn_stage"] = 0
+                st.session_state["ngn_history"] = NGNScores(st.session_state["session_id"])
+                st.session_state["ngn_feedback"] = None
+                if banked_case is not None:
+                    st.caption("⚡ Served from the question bank (a case you haven't seen yet)")
+                elif ngn_stream.from_pool:
+                    st.caption("⚡ Served from the pre-generated case pool")
+        if ngn_ready:
+            ngn_panel()
+    elif mode == "study_chat":
+        chat_panel(notes, notes_only, label_sources, strict_mode, use_real_ai, notes_budget, show_debug, show_chunks)
+    else:
+        output_panel(
+            mode, request, notes, difficulty, notes_only, label_sources, strict_mode, notes_budget,
+            use_real_ai, quiz_count, show_prompt, show_chunks, show_debug, generate,
+        )
+
+st.session_state["full_run"] = False
+record_run_time("full app", time.perf_counter() - run_started)
@@ -0,0 +1,24 @@
+"""NurseThink engine: prompts, model calls, caches, chat memory, NGN cases and quiz batches.
+
+Importable without Streamlit. app.py is one client; nursethink.server exposes
+the same engine over HTTP.
+"""
+from .engine import LocalEngine, get_engine
+from .llm import get_ai_response, stream_ai_response
+from .ngn import NGNCase, NGNCaseError, generate_ngn_case, score_ngn_stage, start_ngn_case
+from .prompts import build_ngn_case_prompt, build_prompt, build_study_chat_prompt
+
+__all__ = [
+    "LocalEngine",
+    "NGNCase",
+    "NGNCaseError",
+    "build_ngn_case_prompt",
+    "build_prompt",
+    "build_study_chat_prompt",
+    "generate_ngn_case",
+    "get_ai_response",
+    "get_engine",
+    "score_ngn_stage",
+    "start_ngn_case",
+    "stream_ai_response",
+]
@@ -0,0 +1,152 @@
+"""Question bank: every generated quiz item and NGN case, kept and served again.
+
+Students in a cohort ask for the same topics, so items are stored by kind,
+topic, difficulty, question type and a variant (notes + toggles that shaped
+the prompt), deduplicated by content hash. A request is filled from items
+this student hasn't seen yet; only the shortfall goes to the model.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+from .cleanup import clean_notes
+from .config import CACHE_DIR
+from .ngn import NGNCase, NGNCaseError, ngn_case_from_dict, normalize_topic
+
+_QUESTION_TYPE = re.compile(r"question type\s*:\s*\**\s*([A-Za-z][A-Za-z /&-]{1,40})", re.IGNORECASE)
+
+
+def bank_variant(notes: str = "", notes_only: bool = False, label_sources: bool = True, strict_mode: bool = True) -> str:
+    """Key for everything besides topic/difficulty that changes what a good item looks like."""
+    raw = json.dumps([clean_notes(notes), bool(notes_only), bool(label_sources), bool(strict_mode)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_question_type(text: str) -> str:
+    m = _QUESTION_TYPE.search(text or "")
+    return " ".join(m.group(1).lower().split()) if m else "any"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(" ".join((text or "").lower().split()).encode("utf-8")).hexdigest()
+
+
+class QuestionBank:
+    """Generated items in SQLite plus per-student "already seen" rows, shared by every worker."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self.stats = {"requests": 0, "hits": 0, "misses": 0, "stored": 0, "duplicates": 0}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        db = self._db()
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "id INTEGER PRIMARY KEY, kind TEXT NOT NULL, topic TEXT NOT NULL, difficulty TEXT NOT NULL, "
+            "qtype TEXT NOT NULL, variant TEXT NOT NULL, hash TEXT NOT NULL UNIQUE, content TEXT NOT NULL, "
+            "created REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS items_lookup ON items (kind, topic, difficulty, variant, qtype)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS seen ("
+            "student TEXT NOT NULL, item_id INTEGER NOT NULL, seen_at REAL NOT NULL, PRIMARY KEY (student, item_id))"
+        )
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def take(self, student: str, kind: str, topic: str, difficulty: str = "", variant: str = "",
+             limit: int = 1, qtype: str = None) -> list:
+        """Up to limit items this student hasn't seen, marked seen as they're handed out.
+
+        Returns [(item_id, content)]. Counts one hit per item served and one miss per item short.
+        """
+        params = [kind, normalize_topic(topic), difficulty or "", variant, student]
+        extra = ""
+        if qtype:
+            extra = " AND i.qtype = ?"
+            params.insert(4, qtype)
+        db = self._db()
+        # IMMEDIATE so two tabs of the same student can't both get the same "unseen" item
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = db.execute(
+                "SELECT i.id, i.content FROM items i WHERE i.kind = ? AND i.topic = ? AND i.difficulty = ? "
+                f"AND i.variant = ?{extra} AND NOT EXISTS "
+                "(SELECT 1 FROM seen s WHERE s.student = ? AND s.item_id = i.id) ORDER BY i.id LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+            now = time.time()
+            db.executemany(
+                "INSERT OR IGNORE INTO seen (student, item_id, seen_at) VALUES (?, ?, ?)",
+                [(student, item_id, now) for item_id, _ in rows],
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self.stats["requests"] += 1
+        self.stats["hits"] += len(rows)
+        self.stats["misses"] += limit - len(rows)
+        return rows
+
+    def add(self, kind: str, topic: str, content: str, difficulty: str = "", variant: str = "",
+            qtype: str = None, seen_by: str = None) -> int:
+        """Store a freshly generated item (no-op for a repeat); optionally mark it seen by its first student."""
+        db = self._db()
+        digest = content_hash(content)
+        cur = db.execute(
+            "INSERT OR IGNORE INTO items (kind, topic, difficulty, qtype, variant, hash, content, created) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (kind, normalize_topic(topic), difficulty or "", qtype or parse_question_type(content), variant,
+             digest, content, time.time()),
+        )
+        if cur.rowcount:
+            self.stats["stored"] += 1
+        else:
+            self.stats["duplicates"] += 1
+        item_id = db.execute("SELECT id FROM items WHERE hash = ?", (digest,)).fetchone()[0]
+        if seen_by:
+            db.execute(
+                "INSERT OR IGNORE INTO seen (student, item_id, seen_at) VALUES (?, ?, ?)",
+                (seen_by, item_id, time.time()),
+            )
+        return item_id
+
+    def count(self, kind: str = None) -> int:
+        if kind:
+            return self._db().execute("SELECT COUNT(*) FROM items WHERE kind = ?", (kind,)).fetchone()[0]
+        return self._db().execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def hit_rate(self) -> float:
+        served = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / served if served else 0.0
+
+    # NGN cases are stored as their validated JSON
+    def take_ngn_case(self, student: str, topic: str):
+        rows = self.take(student, "ngn_case", topic)
+        if not rows:
+            return None
+        try:
+            return ngn_case_from_dict(json.loads(rows[0][1]))
+        except (ValueError, NGNCaseError):
+            # Stored before a schema change
+            return None
+
+    def add_ngn_case(self, topic: str, case: NGNCase, seen_by: str = None) -> int:
+        return self.add("ngn_case", topic, json.dumps(case.to_dict()), qtype="ngn", seen_by=seen_by)
+
+
+@lru_cache(maxsize=None)
+def get_question_bank() -> QuestionBank:
+    return QuestionBank(os.path.join(CACHE_DIR, "question_bank.sqlite3"))
@@ -0,0 +1,91 @@
+"""Study chat memory: a token-budgeted verbatim window plus a rolling summary."""
+import re
+
+from .llm import get_ai_response, get_client, is_error_text
+from .notes import estimate_tokens
+
+CHAT_RECENT_TOKEN_BUDGET = 1200
+CHAT_SUMMARY_TOKEN_BUDGET = 300
+
+
+def new_chat_memory() -> dict:
+    # summarized_upto: chat_messages[:summarized_upto] are covered by summary
+    return {"summary": "", "summarized_upto": 0, "summaries": 0}
+
+
+def format_chat_turns(messages: list) -> str:
+    return "\n".join(f"{m['role'].upper()}: {m['content']}" for m in messages)
+
+
+def recent_window_start(messages: list, token_budget: int, floor: int = 0) -> int:
+    """Index where the newest run of messages fitting token_budget starts (the last message always fits)."""
+    start = len(messages)
+    used = 0
+    while start > floor:
+        cost = estimate_tokens(messages[start - 1]["content"]) + 2
+        if used + cost > token_budget and start < len(messages):
+            break
+        used += cost
+        start -= 1
+    return start
+
+
+def summarize_chat_turns(previous_summary: str, turns: list) -> str:
+    """Fold turns into the running summary with the model; falls back to a local extract."""
+    prompt = f"""
+You maintain a running summary of a nursing student's tutoring session with NurseThink AI.
+
+Update the summary with the NEW TURNS. Keep it under {CHAT_SUMMARY_TOKEN_BUDGET * 3 // 4} words, as short bullets:
+- topics covered and key rules/answers given
+- the student's misconceptions or weak areas
+- anything the student asked to come back to
+
+CURRENT SUMMARY:
+{previous_summary or "(empty)"}
+
+NEW TURNS:
+{format_chat_turns(turns)}
+
+Return only the updated summary.
+""".strip()
+    if get_client():
+        text = get_ai_response(prompt, mode="chat_summary")
+        if text and not is_error_text(text):
+            return text.strip()
+    return extract_chat_summary(previous_summary, turns)
+
+
+def extract_chat_summary(previous_summary: str, turns: list) -> str:
+    lines = [l for l in (previous_summary or "").splitlines() if l.strip()]
+    for m in turns:
+        first = re.split(r"(?<=[.?!])\s", m["content"].strip(), maxsplit=1)[0]
+        lines.append(f"- {m['role']}: {first[:160]}")
+    # Keep the newest lines that fit
+    kept = []
+    used = 0
+    for line in reversed(lines):
+        used += estimate_tokens(line) + 1
+        if used > CHAT_SUMMARY_TOKEN_BUDGET:
+            break
+        kept.append(line)
+    return "\n".join(reversed(kept))
+
+
+def update_chat_memory(memory: dict, messages: list, summarize=summarize_chat_turns, token_budget: int = CHAT_RECENT_TOKEN_BUDGET) -> bool:
+    """Slide the verbatim window once the unsummarized turns exceed token_budget. Returns True if it slid.
+
+    The window slides down to half the budget so the summary is only rebuilt
+    every few turns, not on every message.
+    """
+    if memory["summarized_upto"] > len(messages):
+        memory.update(new_chat_memory())
+    unsummarized = messages[memory["summarized_upto"]:]
+    if sum(estimate_tokens(m["content"]) + 2 for m in unsummarized) <= token_budget:
+        return False
+    keep_from = recent_window_start(messages, token_budget // 2, floor=memory["summarized_upto"])
+    if keep_from <= memory["summarized_upto"]:
+        return False
+    memory["summary"] = summarize(memory["summary"], messages[memory["summarized_upto"]:keep_from])
+    memory["summarized_upto"] = keep_from
+    memory["summaries"] += 1
+    return True
@@ -0,0 +1,159 @@
+"""Local question-type classifier for mixed_drill.
+
+The mixed drill prompt asks the model to work out PRIORITY / DELEGATION /
+THERAPEUTIC first and then explain which engine it picked. Most stems give
+the answer away ("first", "delegate to the UAP", "best response"), so a
+regex cue table plus a small logistic regression over the stem's words
+picks the engine here in well under a millisecond. The prompt then goes out
+as the specialised mode. Low-confidence stems keep the mixed prompt.
+"""
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+
+from .notes import tokenize
+
+QUESTION_TYPES = ("priority", "delegation", "therapeutic")
+CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("NURSETHINK_CLASSIFIER_MIN_CONFIDENCE", "0.7"))
+CLASSIFIER_EPOCHS = 30
+CLASSIFIER_LEARNING_RATE = 0.5
+# Keeps weights small so a stem with no familiar words stays close to uniform (low confidence)
+CLASSIFIER_L2 = 0.01
+
+# Hand-written cues; each hit is a feature the model weighs, not a hard rule
+CUE_PATTERNS = {
+    "priority": [
+        r"\bfirst\b", r"\bpriority\b", r"\bprioriti[sz]e", r"\bimmediate(ly)?\b", r"\bmost urgent\b",
+        r"\bunstable\b", r"\bsee (first|next)\b", r"\bsp ?o2\b|\bo2 sat", r"\brequires? immediate\b",
+        r"\bmost concern", r"\bpost-?op\b",
+    ],
+    "delegation": [
+        r"\bdelegat", r"\bassign", r"\buap\b|\bunlicensed\b|\bnursing assistant\b|\bcna\b",
+        r"\blpn\b|\blvn\b|\bpractical nurse\b", r"\bcharge nurse\b", r"\bappropriate (task|to)\b",
+        r"\bscope\b", r"\bsupervis",
+    ],
+    "therapeutic": [
+        r"\bbest response\b", r"\brespon(d|se)\b", r"[“\"]", r"\btherapeutic\b",
+        r"\b(says|states|tells|asks|cries)\b", r"\b(scared|afraid|anxious|worried|upset|angry|die|dying)\b",
+        r"\bcommunicat", r"\bhow should the nurse reply\b",
+    ],
+}
+_CUES = [(label, i, re.compile(p, re.IGNORECASE)) for label, pats in CUE_PATTERNS.items() for i, p in enumerate(pats)]
+
+# Labelled stems the linear model is fitted on at first use (a few ms)
+TRAINING_STEMS = [
+    ("Post-op patient with new shortness of breath and O2 sat 88%. What is the nurse's priority?", "priority"),
+    ("Client reports chest tightness. Which action should the nurse take first?", "priority"),
+    ("Which client should the nurse see first after receiving report?", "priority"),
+    ("A client with a tracheostomy has stridor. What is the immediate nursing action?", "priority"),
+    ("Four clients call at once. Which one does the nurse assess first?", "priority"),
+    ("The client becomes suddenly confused and restless. What is the priority assessment?", "priority"),
+    ("Which finding requires immediate intervention in a client with heart failure?", "priority"),
+    ("A client on heparin has blood in the urine. What should the nurse do first?", "priority"),
+    ("Which client is the most unstable and needs attention right away?", "priority"),
+    ("After a fall the client has a new headache and vomiting. Which action is the priority?", "priority"),
+    ("Which client finding is of most concern to the nurse?", "priority"),
+    ("Which task is appropriate to delegate to the UAP on a stable med-surg unit?", "delegation"),
+    ("Which task can the RN assign to the LPN?", "delegation"),
+    ("The charge nurse is making assignments. Which client should go to the LPN?", "delegation"),
+    ("Which activity can be delegated to unlicensed assistive personnel?", "delegation"),
+    ("What task should the nurse not delegate to the nursing assistant?", "delegation"),
+    ("Which client is appropriate to assign to the float nurse from pediatrics?", "delegation"),
+    ("The RN is working with an LVN and a UAP. Which task belongs to the UAP?", "delegation"),
+    ("Which task is within the scope of practice of the practical nurse?", "delegation"),
+    ("Who should perform the initial admission assessment and teaching?", "delegation"),
+    ("The nurse supervises a CNA. Which task should the nurse keep?", "delegation"),
+    ("Patient says: I'm scared my diagnosis means I'm going to die. Best nurse response?", "therapeutic"),
+    ("A client states she is worried about going home. What is the best response by the nurse?", "therapeutic"),
+    ("The client cries and says nobody cares. How should the nurse respond?", "therapeutic"),
+    ("Which statement by the nurse is therapeutic?", "therapeutic"),
+    ("A teenager tells the nurse he is angry at his parents. Which reply is most appropriate?", "therapeutic"),
+    ("The family member asks if the patient is dying. What should the nurse say?", "therapeutic"),
+    ("Which response demonstrates therapeutic communication with an anxious client?", "therapeutic"),
+    ("A client says she doesn't want to live anymore. What is the nurse's best response?", "therapeutic"),
+    ("The client is upset about the diagnosis and asks why this happened. Best reply?", "therapeutic"),
+    ("How should the nurse communicate with a client who is grieving?", "therapeutic"),
+]
+
+
+def question_features(text: str) -> Counter:
+    features = Counter(f"w:{w}" for w in tokenize(text))
+    for label, i, pattern in _CUES:
+        if pattern.search(text or ""):
+            features[f"cue:{label}:{i}"] += 1
+    features["bias"] = 1
+    return features
+
+
+class QuestionClassifier:
+    """Multinomial logistic regression over question_features()."""
+
+    def __init__(self, labels=QUESTION_TYPES):
+        self.labels = labels
+        self.weights = {label: Counter() for label in labels}
+
+    def probabilities(self, features: Counter) -> dict:
+        scores = {label: sum(w[f] * v for f, v in features.items()) for label, w in self.weights.items()}
+        top = max(scores.values())
+        exp = {label: math.exp(s - top) for label, s in scores.items()}
+        total = sum(exp.values())
+        return {label: e / total for label, e in exp.items()}
+
+    def fit(self, examples, epochs: int = CLASSIFIER_EPOCHS, learning_rate: float = CLASSIFIER_LEARNING_RATE,
+            l2: float = CLASSIFIER_L2):
+        data = [(question_features(text), label) for text, label in examples]
+        for epoch in range(epochs):
+            rate = learning_rate / (1 + epoch * 0.1)
+            for features, label in data:
+                probs = self.probabilities(features)
+                for lbl in self.labels:
+                    weights = self.weights[lbl]
+                    grad = (1.0 if lbl == label else 0.0) - probs[lbl]
+                    for f, v in features.items():
+                        weights[f] += rate * (grad * v - l2 * weights[f])
+        return self
+
+    def predict(self, text: str):
+        """(label, confidence) for the most likely question type."""
+        probs = self.probabilities(question_features(text))
+        label = max(probs, key=probs.get)
+        return label, probs[label]
+
+
+@lru_cache(maxsize=None)
+def get_question_classifier() -> QuestionClassifier:
+    return QuestionClassifier().fit(TRAINING_STEMS)
+
+
+_stats_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def get_classifier_stats() -> dict:
+    # Process-wide, exported on /metrics with the other stats
+    stats = {"classified": 0, "fallbacks": 0, "seconds": 0.0}
+    stats.update({f"routed_{label}": 0 for label in QUESTION_TYPES})
+    return stats
+
+
+def classify_question(text: str, min_confidence: float = CLASSIFIER_MIN_CONFIDENCE) -> dict:
+    """Pick the mixed_drill engine locally.
+
+    Returns {"mode": "priority"|"delegation"|"therapeutic" or None (keep the mixed prompt),
+    "label", "confidence", "seconds"}.
+    """
+    classifier = get_question_classifier()
+    t0 = time.perf_counter()
+    label, confidence = classifier.predict(text)
+    seconds = time.perf_counter() - t0
+    mode = label if confidence >= min_confidence else None
+    stats = get_classifier_stats()
+    with _stats_lock:
+        stats["classified"] += 1
+        stats["seconds"] += seconds
+        stats[f"routed_{mode}" if mode else "fallbacks"] += 1
+    return {"mode": mode, "label": label, "confidence": confidence, "seconds": seconds}
@@ -0,0 +1,218 @@
+"""Notes cleanup before anything reaches a prompt.
+
+PDF text comes with a page header, footer and page number on every page,
+words hyphenated across line breaks, ragged whitespace and whole slides
+repeated. Each of those is a generator stage below; clean_notes() chains
+them and remembers the result per notes document.
+"""
+import re
+import time
+import zlib
+from collections import Counter
+from functools import lru_cache
+
+# A short line at the top/bottom of this many pages is a running header/footer, not content
+BOILERPLATE_MIN_REPEATS = 3
+BOILERPLATE_MAX_CHARS = 80
+BOILERPLATE_EDGE_LINES = 2
+# Near-duplicate paragraphs: word shingles, one-permutation MinHash, LSH bands
+SHINGLE_WORDS = 4
+MINHASH_BINS = 32
+LSH_BANDS = 8
+DUPLICATE_THRESHOLD = 0.8
+# Shorter paragraphs ("Notify the provider.") are kept even when repeated
+DUPLICATE_MIN_WORDS = 12
+
+# Extraction puts a form feed between PDF pages; only those page blocks can have a header/footer
+PAGE_BREAK = "\f"
+# "page 12", "12 of 300", "3/10", "- 12 -" at the end of a header/footer line
+_TRAILING_PAGE_NUMBER = re.compile(r"(\d{1,4}(\s*(of|/)\s*\d{1,4})?|-\s*\d{1,4}\s*-)$", re.IGNORECASE)
+_SPACES = re.compile(r"[ \t\u00a0\u200b]+")
+_HYPHENATED = re.compile(r"[A-Za-z]-$")
+_EMPTY_BIN = 0xFFFFFFFF
+
+
+def _line_key(line: str) -> str:
+    # "Unit 4 · Cardiac — page 12" and "... page 13" are the same footer; other digits are content
+    return _TRAILING_PAGE_NUMBER.sub("#", _SPACES.sub(" ", line).strip().lower())
+
+
+def _edge_lines(lines: list) -> list:
+    """Indexes of the first and last few non-blank lines of a page."""
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    if len(filled) <= 2 * BOILERPLATE_EDGE_LINES:
+        return filled
+    return filled[:BOILERPLATE_EDGE_LINES] + filled[-BOILERPLATE_EDGE_LINES:]
+
+
+def find_boilerplate(text: str) -> set:
+    """Keys of short lines that open or close many pages (PAGE_BREAK separated)."""
+    counts = Counter()
+    for page in text.split(PAGE_BREAK):
+        lines = page.splitlines()
+        counts.update({
+            _line_key(lines[i]) for i in _edge_lines(lines)
+            # Labels like "Interventions:" repeat on purpose
+            if len(lines[i].strip()) <= BOILERPLATE_MAX_CHARS and not lines[i].strip().endswith(":")
+        })
+    return {key for key, n in counts.items() if n >= BOILERPLATE_MIN_REPEATS}
+
+
+def strip_boilerplate(text: str, boilerplate: set, stats: dict):
+    """Lines of text without the boilerplate at page edges; the body of a page is never touched."""
+    for n, page in enumerate(text.split(PAGE_BREAK)):
+        lines = page.splitlines()
+        edges = set(_edge_lines(lines)) if boilerplate else ()
+        if n:
+            yield ""
+        for i, line in enumerate(lines):
+            if i in edges and _line_key(line) in boilerplate:
+                stats["boilerplate_lines"] += 1
+                continue
+            yield line
+
+
+def join_hyphenation(lines, stats: dict):
+    """'hypo-' + 'glycemia' -> 'hypoglycemia' (only when the next line starts lowercase)."""
+    pending = None
+    for line in lines:
+        if pending is not None:
+            stripped = line.lstrip()
+            if stripped[:1].islower():
+                stats["hyphen_joins"] += 1
+                line = pending[:-1] + stripped
+            else:
+                yield pending
+            pending = None
+        if _HYPHENATED.search(line.rstrip()):
+            pending = line.rstrip()
+            continue
+        yield line
+    if pending is not None:
+        yield pending
+
+
+def collapse_whitespace(lines):
+    """Normalise spaces inside lines and keep at most one blank line in a row."""
+    blank = True
+    for line in lines:
+        line = _SPACES.sub(" ", line).strip()
+        if not line:
+            if not blank:
+                yield ""
+            blank = True
+            continue
+        blank = False
+        yield line
+
+
+def paragraphs(lines):
+    current = []
+    for line in lines:
+        if line:
+            current.append(line)
+        elif current:
+            yield "\n".join(current)
+            current = []
+    if current:
+        yield "\n".join(current)
+
+
+def minhash(words: list) -> tuple:
+    """One-permutation MinHash signature of a paragraph's word shingles."""
+    signature = [_EMPTY_BIN] * MINHASH_BINS
+    for i in range(max(1, len(words) - SHINGLE_WORDS + 1)):
+        h = zlib.crc32(" ".join(words[i:i + SHINGLE_WORDS]).encode("utf-8"))
+        b = h % MINHASH_BINS
+        if h < signature[b]:
+            signature[b] = h
+    return tuple(signature)
+
+
+def _similarity(a: tuple, b: tuple) -> float:
+    filled = [(x, y) for x, y in zip(a, b) if x != _EMPTY_BIN or y != _EMPTY_BIN]
+    return sum(1 for x, y in filled if x == y) / len(filled) if filled else 1.0
+
+
+def drop_near_duplicates(paras, stats: dict, threshold: float = DUPLICATE_THRESHOLD):
+    """Yield paragraphs, skipping ones that (nearly) repeat an earlier paragraph."""
+    rows = MINHASH_BINS // LSH_BANDS
+    buckets = {}
+    signatures = []
+    exact = set()
+    for para in paras:
+        words = re.findall(r"\w+", para.lower())
+        if len(words) < DUPLICATE_MIN_WORDS:
+            yield para
+            continue
+        key = " ".join(words)
+        if key in exact:
+            stats["duplicate_paragraphs"] += 1
+            continue
+
+        signature = minhash(words)
+        bands = [(band, signature[band * rows:(band + 1) * rows]) for band in range(LSH_BANDS)]
+        candidates = {i for band in bands for i in buckets.get(band, ())}
+        if any(_similarity(signature, signatures[i]) >= threshold for i in candidates):
+            stats["duplicate_paragraphs"] += 1
+            continue
+
+        exact.add(key)
+        idx = len(signatures)
+        signatures.append(signature)
+        for band in bands:
+            buckets.setdefault(band, []).append(idx)
+        yield para
+
+
+def clean_notes_with_stats(text: str):
+    """Return (cleaned_text, stats); stats has tokens_before/after, what was removed and seconds."""
+    # Imported here: notes.py runs every notes document through clean_notes()
+    from .notes import estimate_tokens
+
+    t0 = time.perf_counter()
+    stats = {"boilerplate_lines": 0, "hyphen_joins": 0, "duplicate_paragraphs": 0}
+    text = text or ""
+    boilerplate = find_boilerplate(text)
+    lines = strip_boilerplate(text, boilerplate, stats)
+    lines = collapse_whitespace(join_hyphenation(lines, stats))
+    cleaned = "\n\n".join(drop_near_duplicates(paragraphs(lines), stats))
+    stats.update(
+        tokens_before=estimate_tokens(text),
+        tokens_after=estimate_tokens(cleaned),
+        seconds=time.perf_counter() - t0,
+    )
+    return cleaned, stats
+
+
+@lru_cache(maxsize=None)
+def get_cleanup_stats() -> dict:
+    # Process-wide totals over every distinct notes document cleaned, exported on /metrics
+    return {
+        "documents": 0,
+        "tokens_before": 0,
+        "tokens_after": 0,
+        "boilerplate_lines": 0,
+        "hyphen_joins": 0,
+        "duplicate_paragraphs": 0,
+        "seconds": 0.0,
+    }
+
+
+@lru_cache(maxsize=16)
+def _clean_notes_cached(text: str):
+    cleaned, stats = clean_notes_with_stats(text)
+    totals = get_cleanup_stats()
+    totals["documents"] += 1
+    for key, value in stats.items():
+        totals[key] += value
+    return cleaned, stats
+
+
+def clean_notes(text: str) -> str:
+    # Cached per notes document, like its search index: every prompt built from it pays once
+    return _clean_notes_cached((text or "").strip())[0]
+
+
+def notes_cleanup_stats(text: str) -> dict:
+    return _clean_notes_cached((text or "").strip())[1]
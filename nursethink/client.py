@@ -0,0 +1,170 @@
+"""HTTP client for a remote engine (python -m nursethink.server).
+
+Mirrors LocalEngine in engine.py so the Streamlit UI doesn't care where the
+model calls, caches and NGN generation actually run.
+"""
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from .ngn import NGNCaseStream, ngn_partial_case_from_dict
+
+REQUEST_TIMEOUT_SECONDS = 120
+
+
+class EngineError(RuntimeError):
+    pass
+
+
+class RemoteEngine:
+    remote = True
+
+    def __init__(self, base_url: str, timeout: float = REQUEST_TIMEOUT_SECONDS):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _open(self, method: str, path: str, payload: dict = None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        if body is not None:
+            req.add_header("Content-Type", "application/json")
+        try:
+            return urllib.request.urlopen(req, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error")
+            except Exception:
+                message = e.reason
+            raise EngineError(f"{method} {path}: {e.code} {message}") from None
+        except OSError as e:
+            raise EngineError(f"Engine unreachable at {self.base_url}: {e}") from None
+
+    def call(self, method: str, path: str, payload: dict = None) -> dict:
+        with self._open(method, path, payload) as resp:
+            return json.loads(resp.read())
+
+    def iter_events(self, path: str, payload: dict):
+        """Yield the NDJSON events of a streaming endpoint."""
+        with self._open("POST", path, payload) as resp:
+            for line in resp:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if "error" in event:
+                    raise EngineError(event["error"])
+                yield event
+
+    # Same surface as LocalEngine
+    def stream_answer(self, prompt: str, mode: str = None, use_cache: bool = True, timings: dict = None, trace=None, request: str = None,
+                      on_queue=None):
+        # The engine queues the call on its side; on_queue is only told about that through the timings at the end
+        t0 = time.perf_counter()
+        timings = timings if timings is not None else {}
+        timings.update({"ttft": None, "total": None, "chars": 0, "cached": False, "error": None, "queue_wait": 0.0})
+        chars = 0
+        payload = {
+            "prompt": prompt, "mode": mode, "use_cache": use_cache, "stream": True, "request": request,
+            "session_id": trace.session_id if trace else None,
+        }
+        try:
+            for event in self.iter_events("/v1/generate", payload):
+                if "delta" in event:
+                    if timings["ttft"] is None:
+                        timings["ttft"] = time.perf_counter() - t0
+                    chars += len(event["delta"])
+                    yield event["delta"]
+                elif event.get("done"):
+                    timings["cached"] = bool(event.get("timings", {}).get("cached"))
+                    timings["error"] = event.get("timings", {}).get("error")
+                    timings["queue_wait"] = event.get("timings", {}).get("queue_wait") or 0.0
+                    if trace:
+                        trace.set(engine_trace=event.get("trace"))
+        except EngineError as e:
+            msg = f"AI error: {e}"
+            chars += len(msg)
+            timings["error"] = "EngineError"
+            yield msg
+        timings["total"] = time.perf_counter() - t0
+        timings["chars"] = chars
+        if trace:
+            trace.add_span("model", timings["total"])
+            trace.set(ttft_seconds=timings["ttft"])
+
+    def complete(self, prompt: str, mode: str = None, use_cache: bool = True, trace=None, request: str = None) -> str:
+        t0 = time.perf_counter()
+        payload = {
+            "prompt": prompt, "mode": mode, "use_cache": use_cache, "request": request,
+            "session_id": trace.session_id if trace else None,
+        }
+        try:
+            result = self.call("POST", "/v1/generate", payload)
+        except EngineError as e:
+            return f"AI error: {e}"
+        finally:
+            if trace:
+                trace.add_span("model", time.perf_counter() - t0)
+        return result["text"]
+
+    def quiz_batch(self, base_prompt: str, count: int, user: str = None):
+        try:
+            yield from self.iter_events("/v1/quiz/batch", {"prompt": base_prompt, "count": count, "session_id": user})
+        except EngineError as e:
+            yield {"index": 0, "text": f"AI error: {e}", "status": "error", "seconds": 0.0, "queue_wait": 0.0}
+
+    def summarize_chat(self, previous_summary: str, turns: list) -> str:
+        return self.call("POST", "/v1/chat/summary", {"summary": previous_summary, "turns": turns})["summary"]
+
+    def start_ngn_case(self, topic: str, trace=None, tracer=None) -> "RemoteNGNCase":
+        result = self.call("POST", "/v1/ngn/cases", {"topic": topic})
+        if trace:
+            trace.cache("ngn_pool", result["from_pool"])
+            trace.set(engine_case=result["case_id"])
+            if tracer:
+                tracer.record(trace)
+        return RemoteNGNCase(self, result["case_id"], topic, result["from_pool"])
+
+
+class RemoteNGNCase(NGNCaseStream):
+    """An NGNCaseStream whose stages are long-polled from the engine instead of generated here."""
+
+    def __init__(self, engine: RemoteEngine, case_id: str, topic: str, from_pool: bool):
+        super().__init__(topic)
+        self.engine = engine
+        self.case_id = case_id
+        self.from_pool = from_pool
+        self._poll_lock = threading.Lock()
+
+    def _poll(self, wait_stage: int = None, timeout: float = 0):
+        query = f"?wait_stage={wait_stage}&timeout={timeout}" if wait_stage is not None else ""
+        with self._poll_lock:
+            try:
+                state = self.engine.call("GET", f"/v1/ngn/cases/{self.case_id}{query}")
+            except EngineError as e:
+                with self._cond:
+                    self.error = str(e)
+                    self.done = True
+                return
+            case = ngn_partial_case_from_dict(state["case"]) if state["case"] else None
+            with self._cond:
+                if case is not None:
+                    self.header = (case.title, case.patient)
+                    self.stages = list(case.stages)
+                self.done = state["done"]
+                self.error = state["error"]
+
+    def wait_for_stage(self, idx: int, timeout: float = 120) -> bool:
+        deadline = time.monotonic() + timeout
+        while len(self.stages) <= idx and not self.done and time.monotonic() < deadline:
+            self._poll(idx, min(30, max(1, deadline - time.monotonic())))
+        return len(self.stages) > idx
+
+    def wait_for_header(self, timeout: float = 120) -> bool:
+        return self.wait_for_stage(0, timeout) or self.header is not None
+
+    def snapshot(self):
+        if not self.done:
+            # Cheap refresh so later stages show up without anyone waiting on them
+            self._poll()
+        return super().snapshot()
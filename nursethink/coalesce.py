@@ -0,0 +1,127 @@
+"""Single-flight for model calls: identical prompts in flight share one upstream request.
+
+When a lecturer has a room click the same template at once, the first
+caller (the leader) makes the call and everyone else with the same prompt
+key follows it, streaming the leader's text as it arrives. Across worker
+processes an optional lock file per key makes the other processes wait for
+the leader's answer to land in the shared response cache.
+"""
+import os
+import threading
+import time
+from functools import lru_cache
+
+try:
+    import fcntl
+except ImportError:  # Unix only; without it coalescing stays within the process
+    fcntl = None
+
+from .config import CACHE_DIR
+
+COALESCE_ACROSS_PROCESSES = os.getenv("NURSETHINK_COALESCE_ACROSS_PROCESSES", "") == "1"
+CROSS_PROCESS_POLL_SECONDS = 0.05
+
+
+class InFlightCall:
+    """Text of one upstream call as it arrives, for its followers to replay."""
+
+    def __init__(self):
+        self.parts = []
+        self.done = False
+        self.error = None
+        self._cond = threading.Condition()
+
+    def publish(self, delta: str):
+        with self._cond:
+            self.parts.append(delta)
+            self._cond.notify_all()
+
+    def finish(self, error: str = None):
+        with self._cond:
+            self.error = error
+            self.done = True
+            self._cond.notify_all()
+
+    def follow(self):
+        """Yield the leader's text from the start, blocking for the rest; ends when the leader does."""
+        sent = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self.parts) > sent or self.done)
+                new = self.parts[sent:]
+                finished = self.done
+            sent += len(new)
+            yield from new
+            if finished and sent == len(self.parts):
+                return
+
+
+class SingleFlight:
+    def __init__(self, lock_dir: str = None):
+        self.lock_dir = lock_dir
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {"upstream": 0, "coalesced": 0, "cross_process_waits": 0, "cross_process_hits": 0}
+
+    def join(self, key: str):
+        """(call, is_leader). The leader must call done(key, call) when it's finished, even on error."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.stats["coalesced"] += 1
+                return call, False
+            call = InFlightCall()
+            self._calls[key] = call
+            self.stats["upstream"] += 1
+            return call, True
+
+    def done(self, key: str, call: InFlightCall, error: str = None):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.finish(error)
+
+    def process_lock(self, key: str, timeout: float):
+        """Hold the cross-process lock for key; returns (lock or None, waited).
+
+        waited is True when another process held it first: its answer may now be in the
+        response cache, so check there before calling upstream.
+        """
+        if not (COALESCE_ACROSS_PROCESSES and fcntl and self.lock_dir):
+            return None, False
+        os.makedirs(self.lock_dir, exist_ok=True)
+        path = os.path.join(self.lock_dir, f"{key}.lock")
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        waited = False
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return (fd, path), waited
+            except BlockingIOError:
+                if not waited:
+                    self.stats["cross_process_waits"] += 1
+                waited = True
+                if time.monotonic() >= deadline:
+                    # The other process is stuck; go ahead without the lock
+                    os.close(fd)
+                    return None, waited
+                time.sleep(CROSS_PROCESS_POLL_SECONDS)
+
+    def release(self, lock):
+        if lock is None:
+            return
+        fd, path = lock
+        # Unlink before unlocking: a process that opens the path afterwards starts a fresh
+        # lock, and at worst makes one extra call instead of waiting on a finished one
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+@lru_cache(maxsize=None)
+def get_single_flight() -> SingleFlight:
+    return SingleFlight(os.path.join(CACHE_DIR, "inflight"))
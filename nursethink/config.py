@@ -0,0 +1,14 @@
+"""Process-wide settings read from the environment."""
+import os
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+MODEL_NAME = os.getenv("NURSETHINK_MODEL", "gpt-4.1-mini")
+
+# Local on-disk caches shared by every session/worker on this server
+CACHE_DIR = os.getenv(
+    "NURSETHINK_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".nursethink_cache"),
+)
+
+# Signs student links; when unset a random key is kept in CACHE_DIR
+SECRET_KEY = os.getenv("NURSETHINK_SECRET")
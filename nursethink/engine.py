@@ -0,0 +1,45 @@
+"""Where the UI's model work runs: in this process, or on a remote engine server.
+
+Set NURSETHINK_ENGINE_URL (e.g. http://127.0.0.1:8600) to point the UI at
+`python -m nursethink.server`; otherwise everything runs in-process.
+"""
+import os
+from functools import lru_cache
+
+from .chat import summarize_chat_turns
+from .llm import get_ai_response, stream_ai_response
+from .ngn import start_ngn_case
+from .quiz import iter_quiz_batch
+
+ENGINE_URL = os.getenv("NURSETHINK_ENGINE_URL", "").strip()
+
+
+class LocalEngine:
+    remote = False
+
+    def stream_answer(self, prompt: str, mode: str = None, use_cache: bool = True, timings: dict = None, trace=None, request: str = None,
+                      on_queue=None):
+        return stream_ai_response(
+            prompt, mode=mode, use_cache=use_cache, timings=timings, trace=trace, request=request, on_queue=on_queue
+        )
+
+    def complete(self, prompt: str, mode: str = None, use_cache: bool = True, trace=None, request: str = None) -> str:
+        return get_ai_response(prompt, mode=mode, use_cache=use_cache, trace=trace, request=request)
+
+    def quiz_batch(self, base_prompt: str, count: int, user: str = None):
+        return iter_quiz_batch(base_prompt, count, user=user)
+
+    def summarize_chat(self, previous_summary: str, turns: list) -> str:
+        return summarize_chat_turns(previous_summary, turns)
+
+    def start_ngn_case(self, topic: str, trace=None, tracer=None):
+        return start_ngn_case(topic, trace, tracer)
+
+
+@lru_cache(maxsize=None)
+def get_engine():
+    if ENGINE_URL:
+        from .client import RemoteEngine
+
+        return RemoteEngine(ENGINE_URL)
+    return LocalEngine()
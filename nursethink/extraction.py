@@ -0,0 +1,172 @@
+"""Upload text extraction with a content-addressed cache (in-process LRU + disk)."""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from .cleanup import PAGE_BREAK
+from .config import CACHE_DIR
+from .pdf import iter_pdf_pages
+
+MAX_UPLOAD_MB = int(os.getenv("NURSETHINK_MAX_UPLOAD_MB", "50"))
+
+
+class ExtractionCache:
+    """Extracted text keyed by sha256 of the file bytes: in-process LRU + on-disk store."""
+
+    def __init__(self, cache_dir: str, max_entries: int = 64):
+        self.dir = os.path.join(cache_dir, "extract")
+        self.max_entries = max_entries
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "extract_seconds": 0.0, "saved_seconds": 0.0}
+
+    def _paths(self, key: str):
+        base = os.path.join(self.dir, key[:2], key)
+        return base + ".txt", base + ".json"
+
+    def get(self, key: str):
+        """Return (text, meta, source) or None. source is "memory" or "disk"."""
+        with self._lock:
+            if key in self._mem:
+                self._mem.move_to_end(key)
+                text, meta = self._mem[key]
+                self.stats["memory_hits"] += 1
+                self.stats["saved_seconds"] += meta.get("seconds", 0.0)
+                return text, meta, "memory"
+
+        text_path, meta_path = self._paths(key)
+        try:
+            with open(text_path, "r", encoding="utf-8") as f:
+                text = f.read()
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            except Exception:
+                meta = {}
+        except OSError:
+            return None
+
+        with self._lock:
+            self._remember(key, text, meta)
+            self.stats["disk_hits"] += 1
+            self.stats["saved_seconds"] += meta.get("seconds", 0.0)
+        return text, meta, "disk"
+
+    def put(self, key: str, text: str, meta: dict, persist: bool = True):
+        with self._lock:
+            self._remember(key, text, meta)
+            self.stats["misses"] += 1
+            self.stats["extract_seconds"] += meta.get("seconds", 0.0)
+        if not text or not persist:
+            # Don't persist failures; a fixed parser should get another try
+            return
+        text_path, meta_path = self._paths(key)
+        try:
+            os.makedirs(os.path.dirname(text_path), exist_ok=True)
+            # Write-then-rename so concurrent workers never read a partial file
+            for path, payload in ((meta_path, json.dumps(meta)), (text_path, text)):
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(payload)
+                os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def _remember(self, key: str, text: str, meta: dict):
+        self._mem[key] = (text, meta)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+
+@lru_cache(maxsize=None)
+def get_extraction_cache() -> ExtractionCache:
+    return ExtractionCache(CACHE_DIR)
+
+
+def extract_upload_with_stats(uploaded_file, max_pages: int = None, progress=None):
+    """Return (text, info) for an upload, using the extraction cache.
+
+    info has: key, source ("memory", "disk" or "extracted"), seconds (time spent now),
+    extract_seconds (original parse time), pages and skipped_pages.
+    progress(done, total) is called while a PDF is being parsed.
+    """
+    if uploaded_file is None:
+        return "", None
+    return extract_bytes(uploaded_file.name, uploaded_file.getvalue(), max_pages, progress)
+
+
+def upload_key(filename: str, data: bytes, max_pages: int = None) -> str:
+    """Content key for an upload: sha256 of the bytes plus whatever changes what we extract."""
+    ext = os.path.splitext(filename.lower())[1]
+    key = hashlib.sha256(data).hexdigest() + ext.replace(".", "_")
+    if max_pages and ext == ".pdf":
+        key += f"_p{int(max_pages)}"
+    return key
+
+
+def extract_bytes(filename: str, data: bytes, max_pages: int = None, progress=None):
+    """Same as extract_upload_with_stats, for raw bytes (API uploads)."""
+    filename = filename.lower()
+    key = upload_key(filename, data, max_pages)
+
+    cache = get_extraction_cache()
+    t0 = time.perf_counter()
+    hit = cache.get(key)
+    if hit is not None:
+        text, meta, source = hit
+        return text, {
+            "key": key,
+            "source": source,
+            "seconds": time.perf_counter() - t0,
+            "extract_seconds": meta.get("seconds", 0.0),
+            "pages": meta.get("pages", 0),
+            "skipped_pages": meta.get("skipped_pages", 0),
+        }
+
+    text, details = _extract_text(filename, data, max_pages, progress)
+    elapsed = time.perf_counter() - t0
+    meta = {"seconds": elapsed, "chars": len(text), "bytes": len(data), **details}
+    # Partial PDFs (pages timed out) stay in memory only: reruns don't re-hit the
+    # slow pages, but a restart gets another go at them
+    cache.put(key, text, meta, persist=not details.get("skipped_pages"))
+    return text, {"key": key, "source": "extracted", "seconds": elapsed, "extract_seconds": elapsed, **details}
+
+
+def extract_text_from_upload(uploaded_file) -> str:
+    """Return extracted text from .txt or .pdf upload. Safe MVP extraction."""
+    text, _ = extract_upload_with_stats(uploaded_file)
+    return text
+
+
+def _extract_text(filename: str, data: bytes, max_pages: int = None, progress=None):
+    """Return (text, details) where details has pages / skipped_pages."""
+    # TXT
+    if filename.endswith(".txt"):
+        try:
+            return data.decode("utf-8", errors="ignore"), {}
+        except Exception:
+            return "", {}
+
+    # PDF
+    if filename.endswith(".pdf"):
+        pages_text = []
+        skipped = 0
+        try:
+            for page in iter_pdf_pages(data, max_pages=max_pages):
+                pages_text.append(page["text"])
+                if page["status"] != "ok":
+                    skipped += 1
+                if progress:
+                    progress(page["page"] + 1, page["total"])
+        except Exception:
+            pass
+        # A page break on its own line: cleanup finds running headers/footers per page and
+        # still sees a repeated slide as one paragraph
+        return f"\n{PAGE_BREAK}\n".join(pages_text).strip(), {"pages": len(pages_text), "skipped_pages": skipped}
+
+    return "", {}
@@ -0,0 +1,257 @@
+"""Per-user notes library: uploaded documents kept in SQLite with an FTS5 index.
+
+Text and index rows are stored once per file hash, so the same PDF uploaded by
+many students (or by one student every visit) is extracted and indexed once.
+"""
+import hashlib
+import hmac
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+from .config import CACHE_DIR, SECRET_KEY
+from .cleanup import clean_notes
+from .notes import chunk_notes, tokenize
+
+LIBRARY_SEARCH_LIMIT = 20
+
+
+# -------------------------
+# Student links
+# -------------------------
+# A library belongs to whoever holds its link: the token is "<student id>.<signature>",
+# so the bare id (which shows up in the bank and traces) can't be turned into a link
+
+@lru_cache(maxsize=None)
+def _secret_key() -> bytes:
+    if SECRET_KEY:
+        return SECRET_KEY.encode()
+    path = os.path.join(CACHE_DIR, "secret.key")
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, "rb") as f:
+            return f.read()
+    key = secrets.token_bytes(32)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+def _sign(student_id: str) -> str:
+    return hmac.new(_secret_key(), student_id.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def new_student_token() -> str:
+    student_id = secrets.token_hex(8)
+    return f"{student_id}.{_sign(student_id)}"
+
+
+def student_from_token(token: str):
+    """The student id a link token was issued for, or None if it wasn't issued here."""
+    student_id, _, signature = (token or "").partition(".")
+    if not student_id or not hmac.compare_digest(signature, _sign(student_id)):
+        return None
+    return student_id
+
+
+def _has_fts5(db: sqlite3.Connection) -> bool:
+    try:
+        db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(x)")
+        db.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+class NotesLibrary:
+    """Documents per user over a shared, hash-keyed text store and passage index."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        db = self._db()
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS texts ("
+            "sha TEXT PRIMARY KEY, text TEXT NOT NULL, chars INTEGER NOT NULL, pages INTEGER NOT NULL)"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id INTEGER PRIMARY KEY, user TEXT NOT NULL, sha TEXT NOT NULL, name TEXT NOT NULL, "
+            "added REAL NOT NULL, UNIQUE (user, sha))"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS documents_sha ON documents (sha)")
+        # Without FTS5 in this SQLite build, search falls back to a LIKE scan
+        self.fts = _has_fts5(db)
+        if self.fts:
+            db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5("
+                "text, sha UNINDEXED, chunk UNINDEXED, page UNINDEXED, tokenize = 'porter unicode61')"
+            )
+        else:
+            db.execute("CREATE TABLE IF NOT EXISTS passages (text TEXT, sha TEXT, chunk INTEGER, page INTEGER)")
+            db.execute("CREATE INDEX IF NOT EXISTS passages_sha ON passages (sha)")
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def has_document(self, user: str, sha: str) -> bool:
+        return self._db().execute(
+            "SELECT 1 FROM documents WHERE user = ? AND sha = ?", (user, sha)
+        ).fetchone() is not None
+
+    def has_text(self, sha: str) -> bool:
+        return self._db().execute("SELECT 1 FROM texts WHERE sha = ?", (sha,)).fetchone() is not None
+
+    def add_document(self, user: str, name: str, sha: str, text: str = None, pages: int = 0):
+        """Add a document to user's library; returns (doc_id, indexed_now).
+
+        text may be None when has_text(sha) is already true: nothing is re-indexed then.
+        """
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            indexed = False
+            if db.execute("SELECT 1 FROM texts WHERE sha = ?", (sha,)).fetchone() is None:
+                if not text:
+                    raise ValueError("text is required for a document that isn't in the library yet")
+                db.execute(
+                    "INSERT INTO texts (sha, text, chars, pages) VALUES (?, ?, ?, ?)",
+                    (sha, text, len(text), pages or 0),
+                )
+                db.executemany(
+                    "INSERT INTO passages (text, sha, chunk) VALUES (?, ?, ?)",
+                    [(chunk, sha, i) for i, chunk in enumerate(chunk_notes(clean_notes(text)))],
+                )
+                indexed = True
+            db.execute(
+                "INSERT OR IGNORE INTO documents (user, sha, name, added) VALUES (?, ?, ?, ?)",
+                (user, sha, name, time.time()),
+            )
+            doc_id = db.execute(
+                "SELECT id FROM documents WHERE user = ? AND sha = ?", (user, sha)
+            ).fetchone()[0]
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return doc_id, indexed
+
+    def add_passages(self, sha: str, passages: list):
+        """Index more text of a stored document: [(page, text)], e.g. pages of a PDF read lazily.
+
+        Chunks carry on numbering after the document's existing ones; page is kept alongside.
+        """
+        rows = [(chunk, page) for page, text in passages for chunk in chunk_notes(clean_notes(text))]
+        if not rows:
+            return
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            start = db.execute("SELECT COALESCE(MAX(chunk) + 1, 0) FROM passages WHERE sha = ?", (sha,)).fetchone()[0]
+            db.executemany(
+                "INSERT INTO passages (text, sha, chunk, page) VALUES (?, ?, ?, ?)",
+                [(chunk, sha, start + i, page) for i, (chunk, page) in enumerate(rows)],
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def list_documents(self, user: str) -> list:
+        rows = self._db().execute(
+            "SELECT d.id, d.name, d.added, t.chars, t.pages FROM documents d JOIN texts t ON t.sha = d.sha "
+            "WHERE d.user = ? ORDER BY d.added DESC",
+            (user,),
+        ).fetchall()
+        return [{"id": r[0], "name": r[1], "added": r[2], "chars": r[3], "pages": r[4]} for r in rows]
+
+    def remove_document(self, user: str, doc_id: int) -> bool:
+        db = self._db()
+        dropped = None
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT sha FROM documents WHERE id = ? AND user = ?", (doc_id, user)).fetchone()
+            if row is not None:
+                db.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+                if db.execute("SELECT 1 FROM documents WHERE sha = ?", (row[0],)).fetchone() is None:
+                    # Last reference: drop the shared text and its passages too
+                    db.execute("DELETE FROM texts WHERE sha = ?", (row[0],))
+                    db.execute("DELETE FROM passages WHERE sha = ?", (row[0],))
+                    dropped = row[0]
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        if dropped:
+            # A lazily read PDF also has its page index and kept copy
+            from .page_index import get_page_index
+
+            get_page_index().drop(dropped)
+        return row is not None
+
+    def documents_text(self, user: str, doc_ids: list) -> str:
+        """Full text of the chosen documents, in the given order, as one notes document."""
+        if not doc_ids:
+            return ""
+        marks = ",".join("?" * len(doc_ids))
+        rows = self._db().execute(
+            f"SELECT d.id, d.name, t.text FROM documents d JOIN texts t ON t.sha = d.sha "
+            f"WHERE d.user = ? AND d.id IN ({marks})",
+            (user, *doc_ids),
+        ).fetchall()
+        by_id = {r[0]: (r[1], r[2]) for r in rows}
+        if len(by_id) == 1:
+            return next(iter(by_id.values()))[1]
+        return "\n\n".join(f"# {by_id[i][0]}\n\n{by_id[i][1]}" for i in doc_ids if i in by_id)
+
+    def search(self, user: str, query: str, doc_ids: list = None, limit: int = LIBRARY_SEARCH_LIMIT) -> list:
+        """Best-matching passages across user's documents (or just doc_ids).
+
+        Returns [{"doc_id", "name", "chunk", "page", "snippet", "score"}], best first; page is
+        the 0-based PDF page for passages added by add_passages(), else None.
+        """
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        filters = ""
+        params = [user]
+        if doc_ids:
+            filters = f" AND d.id IN ({','.join('?' * len(doc_ids))})"
+            params.extend(doc_ids)
+        if self.fts:
+            # Quote each term so user punctuation can't break the MATCH syntax
+            match = " OR ".join(f'"{t}"' for t in terms)
+            rows = self._db().execute(
+                "SELECT d.id, d.name, p.chunk, p.page, snippet(passages, 0, '**', '**', '…', 16), rank "
+                "FROM passages p JOIN documents d ON d.sha = p.sha "
+                f"WHERE passages MATCH ? AND d.user = ?{filters} ORDER BY rank LIMIT ?",
+                (match, *params, limit),
+            ).fetchall()
+        else:
+            like = " OR ".join("p.text LIKE ?" for _ in terms)
+            rows = self._db().execute(
+                "SELECT d.id, d.name, p.chunk, p.page, substr(p.text, 1, 200), 0 "
+                "FROM passages p JOIN documents d ON d.sha = p.sha "
+                f"WHERE ({like}) AND d.user = ?{filters} LIMIT ?",
+                (*[f"%{t}%" for t in terms], *params, limit),
+            ).fetchall()
+        return [
+            {"doc_id": r[0], "name": r[1], "chunk": r[2], "page": r[3], "snippet": r[4], "score": -r[5]}
+            for r in rows
+        ]
+
+
+@lru_cache(maxsize=None)
+def get_notes_library() -> NotesLibrary:
+    return NotesLibrary(os.path.join(CACHE_DIR, "notes_library.sqlite3"))
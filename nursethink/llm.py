@@ -0,0 +1,430 @@
+"""Model calls: blocking and streaming, behind the shared SQLite response cache."""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+
+from .coalesce import get_single_flight
+from .config import CACHE_DIR, MODEL_NAME, OPENAI_API_KEY
+from .notes import estimate_tokens
+from .scheduler import OUTPUT_TOKEN_ALLOWANCE, get_model_scheduler
+from .tracing import RequestTrace
+from .upstream import (
+    UpstreamUnavailable,
+    call_with_retries,
+    failure_kind,
+    get_upstream_stats,
+    model_timeout,
+    model_timeout_seconds,
+    pooled_http_client,
+    record_upstream_failure,
+)
+
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("NURSETHINK_RESPONSE_CACHE_MB", "200")) * 1024 * 1024
+RESPONSE_CACHE_DEFAULT_TTL = 7 * 24 * 3600
+# Per-mode TTL in seconds; 0 = never cache (modes that should give a fresh answer each time)
+RESPONSE_CACHE_TTLS = {
+    "mnemonics": 30 * 24 * 3600,
+    "explain": 30 * 24 * 3600,
+    "study_chat": 24 * 3600,
+    "quiz": 0,
+    "ngn_case": 0,
+}
+# Modes where a canned practice answer beats an error while the model service is down
+FALLBACK_MODES = {"explain", "mixed_drill", "priority", "quiz", "mnemonics", "therapeutic", "delegation", "study_chat"}
+LEADER_CANCELLED = "the shared request for this prompt was cancelled; please try again"
+# What get_ai_response returns instead of an answer when there is no key or the call failed
+ERROR_PREFIXES = ("AI error:", "❌")
+DEGRADED_NOTICE = "⚠️ The AI service is overloaded right now, so this is a practice example instead. Try again in a minute."
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    """Shared OpenAI client (one keep-alive pool per process), or None when no API key is configured (demo mode)."""
+    if not OPENAI_API_KEY:
+        return None
+    # Imported here so demo mode (no key) never pays for loading the SDK
+    from openai import OpenAI
+
+    # Retries are ours (upstream.call_with_retries) so they share the circuit breaker
+    return OpenAI(api_key=OPENAI_API_KEY, max_retries=0, timeout=model_timeout(), http_client=pooled_http_client())
+
+
+def is_error_text(text: str) -> bool:
+    return (text or "").lstrip().startswith(ERROR_PREFIXES)
+
+
+def response_cache_key(prompt: str, model: str = MODEL_NAME) -> str:
+    # Whitespace differences shouldn't cause a miss
+    normalized = " ".join((prompt or "").split())
+    return hashlib.sha256(f"{model}\0{normalized}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed prompt -> answer cache with TTLs and size-based LRU eviction."""
+
+    def __init__(self, path: str, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        db = self._db()
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                mode TEXT,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                expires REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+
+    def _db(self) -> sqlite3.Connection:
+        # sqlite connections can't be shared across threads; Streamlit runs each session in its own
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, key: str):
+        db = self._db()
+        now = time.time()
+        row = db.execute("SELECT response, expires FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < now:
+            if row is not None:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.stats["misses"] += 1
+            return None
+        db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        self.stats["hits"] += 1
+        return row[0]
+
+    def expires_in(self, key: str):
+        """Seconds until key's entry expires (negative once it has), or None if absent. Not counted as a hit/miss."""
+        row = self._db().execute("SELECT expires FROM responses WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0] - time.time()
+
+    def put(self, key: str, response: str, ttl: float, model: str = MODEL_NAME, mode: str = None):
+        if ttl <= 0:
+            return
+        db = self._db()
+        now = time.time()
+        db.execute(
+            "INSERT OR REPLACE INTO responses (key, model, mode, response, size, created, expires, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, model, mode, response, len(response.encode("utf-8")), now, now + ttl, now),
+        )
+        self.stats["stores"] += 1
+        self._evict(now)
+
+    def _evict(self, now: float):
+        db = self._db()
+        db.execute("DELETE FROM responses WHERE expires < ?", (now,))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Trim to 90% so we aren't evicting on every single insert
+        target = int(self.max_bytes * 0.9)
+        victims = []
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            if total <= target:
+                break
+            victims.append((key,))
+            total -= size
+        db.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self.stats["evictions"] += len(victims)
+
+    def summary(self) -> dict:
+        count, size = self._db().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {**self.stats, "entries": count, "bytes": size}
+
+
+@lru_cache(maxsize=None)
+def get_response_cache() -> ResponseCache:
+    return ResponseCache(os.path.join(CACHE_DIR, "responses.sqlite3"))
+
+
+def response_ttl(mode: str = None) -> float:
+    return RESPONSE_CACHE_TTLS.get((mode or "").lower().strip(), RESPONSE_CACHE_DEFAULT_TTL)
+
+
+def usage_tokens(response, prompt: str, answer: str):
+    """(input_tokens, output_tokens) from the API's usage block, estimated where it's missing."""
+    usage = getattr(response, "usage", None)
+    input_tokens = getattr(usage, "input_tokens", None) if usage else None
+    output_tokens = getattr(usage, "output_tokens", None) if usage else None
+    return (
+        input_tokens if input_tokens is not None else estimate_tokens(prompt),
+        output_tokens if output_tokens is not None else estimate_tokens(answer),
+    )
+
+
+def record_usage(trace: RequestTrace, response, prompt: str, answer: str, reserved: int = 0):
+    """Add token counts to the trace and true up the scheduler's token reservation for the call."""
+    input_tokens, output_tokens = usage_tokens(response, prompt, answer)
+    if reserved:
+        get_model_scheduler().settle(reserved, input_tokens + output_tokens)
+    if trace is None:
+        return
+    trace.add("input_tokens", input_tokens)
+    trace.add("output_tokens", output_tokens)
+
+
+def reserved_tokens(prompt: str) -> int:
+    # What the rate limiter holds for a call until its usage is known
+    return estimate_tokens(prompt) + OUTPUT_TOKEN_ALLOWANCE
+
+
+def degraded_response(mode: str, request: str, error: Exception, trace: RequestTrace = None):
+    """simulated_response() with a notice when the failure was the upstream's; None if there's no fallback."""
+    if (mode or "") not in FALLBACK_MODES:
+        return None
+    if not isinstance(error, UpstreamUnavailable) and failure_kind(error) is None:
+        return None
+    from .prompts import simulated_response  # prompts -> chat -> llm
+
+    get_upstream_stats()["fallbacks"] += 1
+    if trace:
+        trace.set(fallback=True)
+    return f"{DEGRADED_NOTICE}\n\n{simulated_response(mode, request or '')}"
+
+
+def _cross_process_hit(flight, cache, key: str, mode: str, call):
+    """Take the cross-process lock for key. If another worker had it, return its cached answer instead.
+
+    Returns (lock, cached_answer_or_None).
+    """
+    lock, waited = flight.process_lock(key, model_timeout_seconds(mode))
+    if not waited:
+        return lock, None
+    cached = cache.get(key)
+    if cached is not None:
+        flight.stats["cross_process_hits"] += 1
+        call.publish(cached)
+    return lock, cached
+
+
+def get_ai_response(prompt: str, mode: str = None, use_cache: bool = True, trace: RequestTrace = None, request: str = None,
+                    refresh: bool = False) -> str:
+    """Answer prompt. request (the student's own text) is only used for the degraded-mode fallback.
+
+    refresh=True skips the cache lookup but still stores the new answer (the warm-up job).
+    """
+    client = get_client()
+    if not client:
+        return "❌ OpenAI API key not found. Please set OPENAI_API_KEY."
+
+    ttl = response_ttl(mode) if use_cache else 0
+    cache = get_response_cache() if ttl > 0 else None
+    key = response_cache_key(prompt) if cache else None
+    if cache and not refresh:
+        cached = cache.get(key)
+        if trace:
+            trace.cache("response", cached is not None)
+        if cached is not None:
+            return cached
+
+    # Shareable answers are shared while in flight too; fresh-per-call modes (ttl 0) never coalesce
+    flight = get_single_flight()
+    call = None
+    if cache:
+        call, leader = flight.join(key)
+        if trace:
+            trace.cache("coalesced", not leader)
+        if not leader:
+            return "".join(call.follow()).strip() or f"AI error: {LEADER_CANCELLED}"
+
+    lock = None
+    try:
+        if cache:
+            lock, cached = _cross_process_hit(flight, cache, key, mode, call)
+            if cached is not None:
+                return cached
+        t0 = time.perf_counter()
+        reserved = reserved_tokens(prompt)
+        response = None
+        try:
+            response = call_with_retries(
+                lambda: client.responses.create(model=MODEL_NAME, input=prompt, timeout=model_timeout(mode)),
+                trace=trace,
+                tokens=reserved,
+            )
+            answer = response.output_text.strip()
+        except Exception as e:
+            if response is not None:
+                # The call went through but its text couldn't be read: it still used its tokens
+                record_usage(trace, response, prompt, "", reserved)
+            if trace:
+                trace.add_span("model", time.perf_counter() - t0)
+                trace.set(error=type(e).__name__)
+            # Errors and fallbacks are returned to the UI but never cached
+            answer = degraded_response(mode, request, e, trace) or f"AI error: {type(e).__name__}: {e}"
+            if call:
+                call.publish(answer)
+            return answer
+        if trace:
+            trace.add_span("model", time.perf_counter() - t0)
+        record_usage(trace, response, prompt, answer, reserved)
+
+        if cache and answer:
+            cache.put(key, answer, ttl, mode=mode)
+        if call:
+            call.publish(answer)
+        return answer
+    finally:
+        if call:
+            flight.release(lock)
+            flight.done(key, call)
+
+
+def stream_ai_response(prompt: str, mode: str = None, use_cache: bool = True, timings: dict = None, trace: RequestTrace = None, request: str = None,
+                       on_queue=None):
+    """Yield answer text as it arrives from the model.
+
+    Shares the response cache with get_ai_response(). If a timings dict is
+    passed it gets ttft (seconds to first text), total, chars, cached, error
+    (exception name when the text is an error/fallback message, else None) and
+    queue_wait (seconds waiting for the rate limiter). on_queue(position) is
+    called while the call waits its turn, then with 0.
+    """
+    t0 = time.perf_counter()
+    timings = timings if timings is not None else {}
+    timings.update({"ttft": None, "total": None, "chars": 0, "cached": False, "error": None, "queue_wait": 0.0})
+
+    def _done(text_len: int):
+        timings["total"] = time.perf_counter() - t0
+        timings["chars"] = text_len
+        if trace:
+            trace.add_span("model", timings["total"])
+            trace.set(ttft_seconds=timings["ttft"])
+
+    client = get_client()
+    if not client:
+        msg = "❌ OpenAI API key not found. Please set OPENAI_API_KEY."
+        timings["ttft"] = time.perf_counter() - t0
+        timings["error"] = "NoAPIKey"
+        yield msg
+        _done(len(msg))
+        return
+
+    ttl = response_ttl(mode) if use_cache else 0
+    cache = get_response_cache() if ttl > 0 else None
+    key = response_cache_key(prompt) if cache else None
+    if cache:
+        cached = cache.get(key)
+        if trace:
+            trace.cache("response", cached is not None)
+        if cached is not None:
+            timings["ttft"] = time.perf_counter() - t0
+            timings["cached"] = True
+            yield cached
+            _done(len(cached))
+            return
+
+    flight = get_single_flight()
+    call = None
+    if cache:
+        call, leader = flight.join(key)
+        if trace:
+            trace.cache("coalesced", not leader)
+        if not leader:
+            # Replay the leader's stream: earlier text at once, the rest as it arrives
+            text_len = 0
+            for delta in call.follow():
+                if timings["ttft"] is None:
+                    timings["ttft"] = time.perf_counter() - t0
+                text_len += len(delta)
+                yield delta
+            if call.error:
+                timings["error"] = call.error
+                if call.error == LEADER_CANCELLED:
+                    msg = f"\n\nAI error: {LEADER_CANCELLED}"
+                    text_len += len(msg)
+                    yield msg
+            _done(text_len)
+            return
+
+    parts = []
+    completed = None
+    stream = None
+    charged = False
+    lock = None
+    finished = False
+    try:
+        if cache:
+            lock, cached = _cross_process_hit(flight, cache, key, mode, call)
+            if cached is not None:
+                timings["ttft"] = time.perf_counter() - t0
+                timings["cached"] = True
+                finished = True
+                yield cached
+                _done(len(cached))
+                return
+        reserved = reserved_tokens(prompt)
+        try:
+            # Retries only cover opening the stream; once text has been shown it can't be taken back
+            stream = call_with_retries(
+                lambda: client.responses.create(model=MODEL_NAME, input=prompt, timeout=model_timeout(mode), stream=True),
+                trace=trace,
+                tokens=reserved,
+                on_wait=on_queue,
+                timings=timings,
+            )
+            for event in stream:
+                if event.type == "response.completed":
+                    completed = getattr(event, "response", None)
+                    continue
+                if event.type != "response.output_text.delta" or not event.delta:
+                    continue
+                if timings["ttft"] is None:
+                    timings["ttft"] = time.perf_counter() - t0
+                parts.append(event.delta)
+                if call:
+                    call.publish(event.delta)
+                yield event.delta
+        except Exception as e:
+            if stream is not None:
+                record_upstream_failure(e)
+            # Errors and fallbacks are shown but never cached
+            err = (None if parts else degraded_response(mode, request, e, trace)) or f"AI error: {type(e).__name__}: {e}"
+            timings["error"] = type(e).__name__
+            if trace:
+                trace.set(error=type(e).__name__)
+            if timings["ttft"] is None:
+                timings["ttft"] = time.perf_counter() - t0
+            err = ("\n\n" if parts else "") + err
+            if call:
+                call.publish(err)
+            finished = True
+            yield err
+            _done(sum(len(p) for p in parts) + len(err))
+            return
+
+        finished = True
+        answer = "".join(parts).strip()
+        _done(len(answer))
+        record_usage(trace, completed, prompt, answer, reserved)
+        charged = True
+        if cache and answer:
+            cache.put(key, answer, ttl, mode=mode)
+    finally:
+        if stream is not None and not charged:
+            # Cut off by an error or a reader that went away: charge what the call used so far
+            get_model_scheduler().settle(reserved, estimate_tokens(prompt) + estimate_tokens("".join(parts)))
+        if call:
+            flight.release(lock)
+            # A leader whose reader went away mid-stream leaves its followers with a partial answer
+            flight.done(key, call, timings["error"] or (None if finished else LEADER_CANCELLED))
@@ -0,0 +1,741 @@
+"""NGN case generation: typed model, validation/repair, streaming parse and the warm pool."""
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+
+from .config import CACHE_DIR
+from .llm import get_ai_response, get_client, is_error_text, stream_ai_response
+from .prompts import build_ngn_case_prompt
+from .scheduler import background_calls
+from .tracing import RequestTrace, Tracer
+
+
+def parse_ngn_case_json(text: str) -> dict:
+    try:
+        return json.loads(text)
+    except Exception:
+        start = text.find("{")
+        end = text.rfind("}")
+        if start != -1 and end != -1 and end > start:
+            return json.loads(text[start:end + 1])
+        raise ValueError("Could not parse NGN case JSON")
+
+
+def generate_ngn_case(topic: str) -> "NGNCase":
+    prompt = build_ngn_case_prompt(topic)
+    text = get_ai_response(prompt, mode="ngn_case")
+    return finalize_ngn_case(topic, text)
+
+
+# -------------------------
+# NGN case model (validation + targeted repair)
+# -------------------------
+
+NGN_STAGE_COUNT = 3
+NGN_REPAIR_ATTEMPTS = 2
+
+
+class NGNCaseError(ValueError):
+    """Raised when a case can't be validated (or repaired). problems lists paths like stages[1].best.action."""
+
+    def __init__(self, message: str, problems: list = None):
+        super().__init__(message)
+        self.problems = problems or []
+
+
+@dataclass(slots=True)
+class NGNPatient:
+    age: int
+    sex: str
+    setting: str
+    history: list
+
+
+@dataclass(slots=True)
+class NGNOptions:
+    key_cues: list
+    hypotheses: list
+    actions: list
+    outcomes: list
+
+
+@dataclass(slots=True)
+class NGNBest:
+    key_cues: list
+    hypothesis: str
+    action: str
+    outcome: str
+
+
+@dataclass(slots=True)
+class NGNStage:
+    stage: int
+    cues: list
+    question: str
+    options: NGNOptions
+    best: NGNBest
+    rationale: str
+    next_update: str
+
+
+@dataclass(slots=True)
+class NGNCase:
+    title: str
+    patient: NGNPatient
+    stages: list
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _str(raw: dict, key: str, path: str, problems: list) -> str:
+    value = raw.get(key) if isinstance(raw, dict) else None
+    if not isinstance(value, str) or not value.strip():
+        problems.append(f"{path}.{key}: expected non-empty string")
+        return ""
+    return value.strip()
+
+
+def _str_list(raw: dict, key: str, path: str, problems: list, allow_empty: bool = False) -> list:
+    value = raw.get(key) if isinstance(raw, dict) else None
+    if not isinstance(value, list) or any(not isinstance(v, str) or not v.strip() for v in value):
+        problems.append(f"{path}.{key}: expected list of strings")
+        return []
+    if not value and not allow_empty:
+        problems.append(f"{path}.{key}: must not be empty")
+    return [v.strip() for v in value]
+
+
+def _int(raw: dict, key: str, path: str, problems: list) -> int:
+    value = raw.get(key) if isinstance(raw, dict) else None
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value.strip())
+    if not isinstance(value, int) or isinstance(value, bool):
+        problems.append(f"{path}.{key}: expected integer")
+        return 0
+    return value
+
+
+def parse_ngn_header(raw: dict, problems: list):
+    """Return (title, NGNPatient); appends to problems on anything invalid."""
+    if not isinstance(raw, dict):
+        problems.append("case: expected object")
+        raw = {}
+    title = _str(raw, "title", "case", problems)
+    p = raw.get("patient")
+    if not isinstance(p, dict):
+        problems.append("case.patient: expected object")
+        p = {}
+    patient = NGNPatient(
+        age=_int(p, "age", "patient", problems),
+        sex=_str(p, "sex", "patient", problems),
+        setting=_str(p, "setting", "patient", problems),
+        history=_str_list(p, "history", "patient", problems, allow_empty=True),
+    )
+    return title, patient
+
+
+def parse_ngn_stage(raw: dict, number: int, problems: list) -> NGNStage:
+    path = f"stages[{number - 1}]"
+    if not isinstance(raw, dict):
+        problems.append(f"{path}: expected object")
+        raw = {}
+    o = raw.get("options") if isinstance(raw.get("options"), dict) else {}
+    b = raw.get("best") if isinstance(raw.get("best"), dict) else {}
+    if not o:
+        problems.append(f"{path}.options: expected object")
+    if not b:
+        problems.append(f"{path}.best: expected object")
+    options = NGNOptions(
+        key_cues=_str_list(o, "key_cues", f"{path}.options", problems),
+        hypotheses=_str_list(o, "hypotheses", f"{path}.options", problems),
+        actions=_str_list(o, "actions", f"{path}.options", problems),
+        outcomes=_str_list(o, "outcomes", f"{path}.options", problems),
+    )
+    best = NGNBest(
+        key_cues=_str_list(b, "key_cues", f"{path}.best", problems),
+        hypothesis=_str(b, "hypothesis", f"{path}.best", problems),
+        action=_str(b, "action", f"{path}.best", problems),
+        outcome=_str(b, "outcome", f"{path}.best", problems),
+    )
+    # Scoring compares exact strings, so "best" must be one of the offered options
+    if best.hypothesis and best.hypothesis not in options.hypotheses:
+        problems.append(f"{path}.best.hypothesis: not one of options.hypotheses")
+    if best.action and best.action not in options.actions:
+        problems.append(f"{path}.best.action: not one of options.actions")
+    if best.outcome and best.outcome not in options.outcomes:
+        problems.append(f"{path}.best.outcome: not one of options.outcomes")
+    if any(kc not in options.key_cues for kc in best.key_cues):
+        problems.append(f"{path}.best.key_cues: not a subset of options.key_cues")
+    if number < NGN_STAGE_COUNT:
+        next_update = _str(raw, "next_update", path, problems)
+    else:
+        # The final stage has nothing left to lead into
+        next_update = str(raw.get("next_update") or "").strip()
+    return NGNStage(
+        stage=number,
+        cues=_str_list(raw, "cues", path, problems),
+        question=_str(raw, "question", path, problems),
+        options=options,
+        best=best,
+        rationale=_str(raw, "rationale", path, problems),
+        next_update=next_update,
+    )
+
+
+def try_parse_ngn_stage(raw: dict, number: int):
+    """Return (NGNStage or None, problems)."""
+    problems = []
+    stage = parse_ngn_stage(raw, number, problems)
+    return (None if problems else stage), problems
+
+
+def ngn_case_from_dict(raw: dict) -> NGNCase:
+    """Strictly validate a case dict; raises NGNCaseError listing every problem."""
+    problems = []
+    title, patient = parse_ngn_header(raw, problems)
+    raw_stages = raw.get("stages") if isinstance(raw, dict) else None
+    if not isinstance(raw_stages, list) or len(raw_stages) != NGN_STAGE_COUNT:
+        problems.append(f"case.stages: expected {NGN_STAGE_COUNT} stages")
+        raw_stages = raw_stages if isinstance(raw_stages, list) else []
+    stages = [parse_ngn_stage(s, i + 1, problems) for i, s in enumerate(raw_stages[:NGN_STAGE_COUNT])]
+    if problems:
+        raise NGNCaseError("Invalid NGN case", problems)
+    return NGNCase(title=title, patient=patient, stages=stages)
+
+
+def ngn_partial_case_from_dict(raw: dict) -> NGNCase:
+    """Like ngn_case_from_dict for a case still being written: any number of (already validated) stages."""
+    problems = []
+    title, patient = parse_ngn_header(raw, problems)
+    stages = [parse_ngn_stage(s, i + 1, problems) for i, s in enumerate((raw.get("stages") or [])[:NGN_STAGE_COUNT])]
+    if problems:
+        raise NGNCaseError("Invalid NGN case", problems)
+    return NGNCase(title=title, patient=patient, stages=stages)
+
+
+def score_ngn_stage(stage: NGNStage, key_cues, hypothesis: str, action: str, outcome: str) -> int:
+    """Simple scoring: 1 point each component (key cues count when at least half the best ones are picked)."""
+    score = 0
+    best = stage.best
+    best_kc = set(best.key_cues)
+    if best_kc and len(best_kc.intersection(set(key_cues or []))) >= max(1, len(best_kc) // 2):
+        score += 1
+    if hypothesis == best.hypothesis:
+        score += 1
+    if action == best.action:
+        score += 1
+    if outcome == best.outcome:
+        score += 1
+    return score
+
+
+@lru_cache(maxsize=None)
+def get_ngn_stats() -> dict:
+    # Process-wide counters: how often output was broken and how often a repair saved a full regeneration
+    return {
+        "cases": 0,
+        "parse_failures": 0,
+        "invalid_cases": 0,
+        "repair_requests": 0,
+        "repaired_cases": 0,
+        "failed_cases": 0,
+    }
+
+
+def salvage_ngn_json(text: str) -> dict:
+    """Pull the header and any complete stages out of truncated/malformed JSON."""
+    parser = NGNStreamParser()
+    raw = {"stages": []}
+    for kind, obj in parser.feed(text or ""):
+        if kind == "header":
+            raw.update(obj)
+        else:
+            raw["stages"].append(obj)
+    return raw
+
+
+NGN_STAGE_SCHEMA = """
+{
+  "stage": 1,
+  "cues": ["string"],
+  "question": "string",
+  "options": {
+    "key_cues": ["string"],
+    "hypotheses": ["string"],
+    "actions": ["string"],
+    "outcomes": ["string"]
+  },
+  "best": {
+    "key_cues": ["string"],
+    "hypothesis": "string",
+    "action": "string",
+    "outcome": "string"
+  },
+  "rationale": "string",
+  "next_update": "string"
+}
+""".strip()
+
+NGN_HEADER_SCHEMA = """
+{
+  "title": "string",
+  "patient": {
+    "age": 0,
+    "sex": "string",
+    "setting": "string",
+    "history": ["string"]
+  }
+}
+""".strip()
+
+
+def build_ngn_repair_prompt(topic: str, part: str, schema: str, context: dict, problems: list) -> str:
+    problem_lines = "\n".join(f"- {p}" for p in problems) or "- (missing)"
+    return f"""
+You are NurseThink AI repairing part of an NGN-style case for nursing students.
+
+Return ONLY the {part} as one JSON object with this schema (STRICT JSON, NO EXTRA TEXT):
+{schema}
+
+RULES:
+- NCLEX-safe, nursing scope only, no medical diagnosis or prescribing.
+- Every "best" value must be copied exactly from the matching "options" list.
+- Stay consistent with the case so far.
+
+PROBLEMS TO FIX:
+{problem_lines}
+
+TOPIC:
+{topic}
+
+CASE SO FAR:
+{json.dumps(context, ensure_ascii=False)}
+""".strip()
+
+
+def _repair_part(prompt: str, parse):
+    """Ask the model for one part until parse() accepts it; returns the parsed part or None.
+
+    Raises NGNCaseError if the model call itself fails: another attempt would fail the same way.
+    """
+    stats = get_ngn_stats()
+    for _ in range(NGN_REPAIR_ATTEMPTS):
+        stats["repair_requests"] += 1
+        text = get_ai_response(prompt, mode="ngn_case")
+        if is_error_text(text):
+            raise NGNCaseError(f"NGN case repair failed: {text.strip()}", ["model"])
+        try:
+            raw = parse_ngn_case_json(text)
+        except ValueError:
+            continue
+        part = parse(raw)
+        if part is not None:
+            return part
+    return None
+
+
+def finalize_ngn_case(topic: str, text: str, header=None, stages: list = None, error: str = None) -> NGNCase:
+    """Validate model output and re-request only the header/stages that are missing or invalid.
+
+    header/stages may be passed in when they were already validated while streaming. error is
+    the failure from the generating call, if any (stream_ai_response's timings["error"]).
+    """
+    stats = get_ngn_stats()
+    stats["cases"] += 1
+    if error or is_error_text(text):
+        # No key, breaker open or the call failed: nothing to repair, and repair calls would fail too
+        stats["failed_cases"] += 1
+        raise NGNCaseError(f"NGN case generation failed: {error or text.strip()}", ["model"])
+    try:
+        raw = parse_ngn_case_json(text)
+    except ValueError:
+        stats["parse_failures"] += 1
+        raw = salvage_ngn_json(text)
+    if not isinstance(raw, dict):
+        raw = {}
+
+    header_problems = []
+    if header is None:
+        parsed_header = parse_ngn_header(raw, header_problems)
+        header = None if header_problems else parsed_header
+
+    raw_stages = raw.get("stages") if isinstance(raw.get("stages"), list) else []
+    stages = list(stages or [])
+    stage_problems = {}
+    for i in range(len(stages), NGN_STAGE_COUNT):
+        stage, problems = try_parse_ngn_stage(raw_stages[i], i + 1) if i < len(raw_stages) else (None, ["missing"])
+        stages.append(stage)
+        if stage is None:
+            stage_problems[i] = problems
+
+    if header is None or stage_problems:
+        stats["invalid_cases"] += 1
+
+    try:
+        if header is None:
+            prompt = build_ngn_repair_prompt(topic, "case title and patient", NGN_HEADER_SCHEMA, {}, header_problems)
+
+            def _header(raw_header):
+                problems = []
+                parsed = parse_ngn_header(raw_header, problems)
+                return None if problems else parsed
+
+            header = _repair_part(prompt, _header)
+
+        for i in sorted(stage_problems):
+            if header is None:
+                break
+            context = {
+                "title": header[0],
+                "patient": asdict(header[1]),
+                "stages": [asdict(s) for s in stages[:i] if s is not None],
+            }
+            prompt = build_ngn_repair_prompt(
+                topic, f"stage {i + 1} of {NGN_STAGE_COUNT}", NGN_STAGE_SCHEMA, context, stage_problems[i]
+            )
+            stages[i] = _repair_part(prompt, lambda raw_stage, n=i + 1: try_parse_ngn_stage(raw_stage, n)[0])
+    except NGNCaseError:
+        stats["failed_cases"] += 1
+        raise
+
+    if header is None or any(s is None for s in stages):
+        stats["failed_cases"] += 1
+        missing = ["header"] if header is None else []
+        missing += [f"stage {i + 1}" for i, s in enumerate(stages) if s is None]
+        raise NGNCaseError(f"Could not repair NGN case ({', '.join(missing)})", missing)
+
+    if header_problems or stage_problems:
+        stats["repaired_cases"] += 1
+    return NGNCase(title=header[0], patient=header[1], stages=stages)
+
+
+# -------------------------
+# NGN incremental generation
+# -------------------------
+
+class NGNStreamParser:
+    """Scans streamed NGN case JSON and emits pieces as soon as they are complete.
+
+    feed() returns a list of ("header", {...title/patient...}) and ("stage", {...})
+    events. Only the characters added since the last call are scanned.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.obj_start = None
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.str_start = None
+        self.last_key = None
+        self.last_key_pos = None
+        self.current_key = None
+        self.current_key_pos = None
+        self.in_stages = False
+        self.stage_start = None
+        self.header_sent = False
+        self.finished = False
+
+    def feed(self, chunk: str) -> list:
+        self.text += chunk
+        events = []
+        text = self.text
+        for i in range(self.pos, len(text)):
+            if self.finished:
+                break
+            c = text[i]
+            if self.obj_start is None:
+                # Skip any preamble such as ```json
+                if c == "{":
+                    self.obj_start = i
+                    self.stack.append(c)
+                continue
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    if len(self.stack) == 1:
+                        self.last_key = text[self.str_start + 1:i]
+                        self.last_key_pos = self.str_start
+                continue
+            if c == '"':
+                self.in_string = True
+                self.str_start = i
+            elif c == ":" and len(self.stack) == 1:
+                self.current_key, self.current_key_pos = self.last_key, self.last_key_pos
+            elif c in "{[":
+                if c == "[" and len(self.stack) == 1 and self.current_key == "stages":
+                    self.in_stages = True
+                    header = self._parse_header(self.current_key_pos)
+                    if header is not None:
+                        events.append(("header", header))
+                elif c == "{" and self.in_stages and len(self.stack) == 2:
+                    self.stage_start = i
+                self.stack.append(c)
+            elif c in "}]":
+                if self.stack:
+                    self.stack.pop()
+                if c == "}" and self.in_stages and len(self.stack) == 2 and self.stage_start is not None:
+                    try:
+                        events.append(("stage", json.loads(text[self.stage_start:i + 1])))
+                    except ValueError:
+                        pass
+                    self.stage_start = None
+                elif c == "]" and self.in_stages and len(self.stack) == 1:
+                    self.in_stages = False
+                if not self.stack:
+                    self.finished = True
+        self.pos = len(text)
+        return events
+
+    def _parse_header(self, stages_key_pos: int):
+        # Everything before "stages" is the title/patient part of the object
+        if self.header_sent:
+            return None
+        head = self.text[self.obj_start:stages_key_pos].rstrip().rstrip(",") + "}"
+        try:
+            header = json.loads(head)
+        except ValueError:
+            return None
+        self.header_sent = True
+        return header
+
+
+class NGNCaseStream:
+    """An NGN case that may still be arriving. Stages become playable as soon as they validate."""
+
+    def __init__(self, topic: str):
+        self.topic = topic
+        self.header = None  # (title, NGNPatient)
+        self.stages = []  # validated NGNStage prefix
+        self.done = False
+        self.error = None
+        self.from_pool = False
+        # Set once the finished case has been stored in (or came from) the question bank
+        self.banked = False
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_case(cls, topic: str, case: NGNCase) -> "NGNCaseStream":
+        stream = cls(topic)
+        stream._finish(case)
+        stream.from_pool = True
+        return stream
+
+    @classmethod
+    def generate(cls, topic: str, trace: RequestTrace = None, tracer: Tracer = None) -> "NGNCaseStream":
+        stream = cls(topic)
+        threading.Thread(target=stream._run, args=(trace, tracer), name="ngn-case-stream", daemon=True).start()
+        return stream
+
+    def _run(self, trace: RequestTrace = None, tracer: Tracer = None):
+        parser = NGNStreamParser()
+        parts = []
+        seen_stages = 0
+        timings = {}
+        t0 = time.perf_counter()
+        try:
+            for delta in stream_ai_response(build_ngn_case_prompt(self.topic), mode="ngn_case", timings=timings, trace=trace):
+                parts.append(delta)
+                for kind, obj in parser.feed(delta):
+                    if kind == "header":
+                        problems = []
+                        header = parse_ngn_header(obj, problems)
+                        if not problems:
+                            with self._cond:
+                                self.header = header
+                                self._cond.notify_all()
+                        continue
+                    seen_stages += 1
+                    stage, _ = try_parse_ngn_stage(obj, seen_stages)
+                    # Only extend an unbroken prefix; anything after a bad stage waits for repair
+                    if stage is not None and len(self.stages) == seen_stages - 1:
+                        if trace and not self.stages:
+                            trace.set(first_stage_seconds=time.perf_counter() - t0)
+                        with self._cond:
+                            self.stages.append(stage)
+                            self._cond.notify_all()
+            self._finish(finalize_ngn_case(self.topic, "".join(parts), self.header, self.stages, timings.get("error")))
+        except Exception as e:
+            if trace:
+                trace.set(error=type(e).__name__)
+            with self._cond:
+                self.error = f"{type(e).__name__}: {e}"
+                self.done = True
+                self._cond.notify_all()
+        finally:
+            # Runs off the script thread, so record straight to the tracer (no session_state here)
+            if trace and tracer:
+                tracer.record(trace)
+
+    def _finish(self, case: NGNCase):
+        with self._cond:
+            self.header = (case.title, case.patient)
+            self.stages = list(case.stages)
+            self.done = True
+            self._cond.notify_all()
+
+    def snapshot(self):
+        """The case with whatever stages exist so far, or None before the header arrives."""
+        with self._cond:
+            if self.header is None:
+                return None
+            return NGNCase(title=self.header[0], patient=self.header[1], stages=list(self.stages))
+
+    def wait_for_stage(self, idx: int, timeout: float = 120) -> bool:
+        """Block until stage idx (0-based) exists or generation ends. True if it's available."""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self.stages) > idx or self.done, timeout=timeout)
+            return len(self.stages) > idx
+
+    def wait_for_header(self, timeout: float = 120) -> bool:
+        with self._cond:
+            self._cond.wait_for(lambda: self.header is not None or self.done, timeout=timeout)
+            return self.header is not None
+
+
+# -------------------------
+# NGN warm pool (pre-generated cases)
+# -------------------------
+
+DEFAULT_NGN_TOPIC = "Post-op respiratory complication"
+NGN_POOL_SIZE = int(os.getenv("NURSETHINK_NGN_POOL_SIZE", "3"))
+# Topics kept warm; comma-separated override via env
+NGN_POOL_TOPICS = [
+    t.strip() for t in os.getenv("NURSETHINK_NGN_POOL_TOPICS", DEFAULT_NGN_TOPIC).split(",") if t.strip()
+]
+
+def normalize_topic(topic: str) -> str:
+    return " ".join((topic or "").lower().split())
+
+
+class NGNCasePool:
+    """Keeps NGN_POOL_SIZE validated cases per warm topic in SQLite, refilled by a background thread."""
+
+    def __init__(self, path: str, topics: list, size: int = NGN_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self.topics = {normalize_topic(t): t for t in topics}
+        self.stats = {"hits": 0, "misses": 0, "generated": 0, "failed": 0}
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db().execute(
+            "CREATE TABLE IF NOT EXISTS ngn_pool ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, topic TEXT NOT NULL, case_json TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._worker = threading.Thread(target=self._run, name="ngn-pool-refill", daemon=True)
+        self._worker.start()
+        for topic in self.topics.values():
+            self.request_refill(topic)
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def count(self, topic: str) -> int:
+        return self._db().execute(
+            "SELECT COUNT(*) FROM ngn_pool WHERE topic = ?", (normalize_topic(topic),)
+        ).fetchone()[0]
+
+    def pop(self, topic: str):
+        """Return a ready case for topic (and schedule a refill), or None on a miss."""
+        key = normalize_topic(topic)
+        db = self._db()
+        # IMMEDIATE so two workers can't hand out the same case
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute(
+                "SELECT id, case_json FROM ngn_pool WHERE topic = ? ORDER BY id LIMIT 1", (key,)
+            ).fetchone()
+            if row:
+                db.execute("DELETE FROM ngn_pool WHERE id = ?", (row[0],))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        if key in self.topics:
+            self.request_refill(self.topics[key])
+        if not row:
+            self.stats["misses"] += 1
+            return None
+        try:
+            case = ngn_case_from_dict(json.loads(row[1]))
+        except (ValueError, NGNCaseError):
+            # Stored before a schema change; drop it and treat as a miss
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return case
+
+    def add(self, topic: str, case: NGNCase):
+        self._db().execute(
+            "INSERT INTO ngn_pool (topic, case_json, created) VALUES (?, ?, ?)",
+            (normalize_topic(topic), json.dumps(case.to_dict()), time.time()),
+        )
+
+    def request_refill(self, topic: str):
+        key = normalize_topic(topic)
+        with self._lock:
+            if key in self._queued:
+                return
+            self._queued.add(key)
+        self._queue.put(topic)
+
+    def _run(self):
+        while True:
+            topic = self._queue.get()
+            try:
+                # Refills wait behind students' own calls in the model scheduler
+                with background_calls():
+                    self._refill(topic)
+            finally:
+                with self._lock:
+                    self._queued.discard(normalize_topic(topic))
+
+    def _refill(self, topic: str):
+        if not get_client():
+            return
+        failures = 0
+        while self.count(topic) < self.size and failures < 3:
+            try:
+                case = generate_ngn_case(topic)
+            except Exception:
+                failures += 1
+                self.stats["failed"] += 1
+                continue
+            self.add(topic, case)
+            self.stats["generated"] += 1
+
+
+@lru_cache(maxsize=None)
+def get_ngn_pool() -> NGNCasePool:
+    return NGNCasePool(os.path.join(CACHE_DIR, "ngn_pool.sqlite3"), NGN_POOL_TOPICS)
+
+
+def start_ngn_case(topic: str, trace: RequestTrace = None, tracer: Tracer = None) -> NGNCaseStream:
+    """Pop a warm case if one is ready, else start streaming a live one."""
+    case = get_ngn_pool().pop(topic)
+    if trace:
+        trace.cache("ngn_pool", case is not None)
+    if case is not None:
+        if tracer and trace:
+            tracer.record(trace)
+        return NGNCaseStream.from_case(topic, case)
+    return NGNCaseStream.generate(topic, trace, tracer)
@@ -0,0 +1,138 @@
+"""Notes retrieval: BM25 over chunks so only relevant excerpts reach the prompt."""
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+
+from .cleanup import clean_notes
+
+# Rough size of the notes section sent to the model. Notes that fit are sent
+# whole; bigger notes are chunked and only the best-matching chunks go in.
+NOTES_TOKEN_BUDGET = 1500
+NOTES_CHUNK_TOKENS = 200
+NOTES_TOP_K = 8
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "he", "in", "is",
+    "it", "its", "of", "on", "or", "she", "that", "the", "this", "to", "was", "were", "which",
+    "will", "with", "what", "who", "should", "nurse", "client", "patient",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate (~4 chars per token)."""
+    return (len(text or "") + 3) // 4
+
+
+def tokenize(text: str) -> list:
+    return [w for w in re.findall(r"[a-z0-9]+", (text or "").lower()) if w not in _STOPWORDS]
+
+
+def chunk_notes(notes_text: str, chunk_tokens: int = NOTES_CHUNK_TOKENS) -> list:
+    """Split notes into ~chunk_tokens pieces, keeping paragraphs together where possible."""
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", notes_text or "") if p.strip()]
+    chunks = []
+    current = []
+    current_tokens = 0
+    for para in paragraphs:
+        para_tokens = estimate_tokens(para)
+        # Very long paragraphs (typical for PDF extraction) get split on lines/words
+        if para_tokens > chunk_tokens:
+            if current:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            words = para.split()
+            step = max(1, chunk_tokens * 3 // 4)  # ~0.75 words per token
+            for i in range(0, len(words), step):
+                chunks.append(" ".join(words[i:i + step]))
+            continue
+        if current and current_tokens + para_tokens > chunk_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(para)
+        current_tokens += para_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+class NotesIndex:
+    """BM25 index over the chunks of one notes document."""
+
+    def __init__(self, notes_text: str, chunk_tokens: int = NOTES_CHUNK_TOKENS, k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunk_notes(notes_text, chunk_tokens)
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(c)) for c in self.chunks]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_len = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        df = Counter()
+        for tf in self.term_freqs:
+            df.update(tf.keys())
+        n = len(self.chunks)
+        self.idf = {t: math.log(1 + (n - d + 0.5) / (d + 0.5)) for t, d in df.items()}
+
+    def score(self, query: str) -> list:
+        terms = set(tokenize(query))
+        scores = []
+        for i, tf in enumerate(self.term_freqs):
+            s = 0.0
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / (self.avg_len or 1))
+            for t in terms:
+                f = tf.get(t)
+                if f:
+                    s += self.idf[t] * f * (self.k1 + 1) / (f + norm)
+            scores.append(s)
+        return scores
+
+    def search(self, query: str, top_k: int = NOTES_TOP_K, token_budget: int = NOTES_TOKEN_BUDGET) -> list:
+        """Return [(chunk_idx, score)] for the best chunks that fit in token_budget, in document order."""
+        scores = self.score(query)
+        if any(scores):
+            ranked = sorted(range(len(self.chunks)), key=lambda i: scores[i], reverse=True)
+            ranked = [i for i in ranked if scores[i] > 0][:top_k]
+        else:
+            # No usable query terms: fall back to the start of the notes
+            ranked = list(range(len(self.chunks)))
+
+        picked = []
+        used = 0
+        for i in ranked:
+            cost = estimate_tokens(self.chunks[i])
+            if used + cost > token_budget:
+                continue
+            picked.append(i)
+            used += cost
+        return [(i, scores[i]) for i in sorted(picked)]
+
+
+@lru_cache(maxsize=16)
+def get_notes_index(notes_text: str) -> NotesIndex:
+    # Built once per notes document and shared across reruns/sessions
+    return NotesIndex(notes_text)
+
+
+def select_notes_chunks(notes_text: str, query: str = "", token_budget: int = NOTES_TOKEN_BUDGET) -> list:
+    """Return [(chunk_idx, score, chunk_text)] to send for this query. Empty list means send notes whole.
+
+    notes_text is already through clean_notes(): cleaning it again would count it as another document.
+    """
+    if not notes_text or estimate_tokens(notes_text) <= token_budget:
+        return []
+    index = get_notes_index(notes_text)
+    return [(i, s, index.chunks[i]) for i, s in index.search(query, token_budget=token_budget)]
+
+
+def build_context(notes_text: str, query: str = "", token_budget: int = NOTES_TOKEN_BUDGET) -> str:
+    # Headers/footers, broken hyphenation and repeated slides never reach the model
+    notes_text = clean_notes(notes_text)
+    if not notes_text:
+        return "(none provided)"
+    selected = select_notes_chunks(notes_text, query, token_budget)
+    if not selected:
+        return notes_text
+    parts = [f"[Excerpt {i + 1}]\n{text}" for i, _, text in selected]
+    return (
+        "(Relevant excerpts retrieved from a longer notes document.)\n\n"
+        + "\n\n".join(parts)
+    )
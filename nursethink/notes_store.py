@@ -0,0 +1,147 @@
+"""Notes by reference: large notes live server-side under their content hash.
+
+A 300-page guide is megabytes of text. As the value of the notes text area
+it went to the browser and back on every rerun. Now the widget holds only a
+preview of the first NOTES_PREVIEW_CHARS; the full text is stored here once,
+and the app and prompt builders resolve the reference to it.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from .config import CACHE_DIR
+
+NOTES_PREVIEW_CHARS = int(os.getenv("NURSETHINK_NOTES_PREVIEW_CHARS", "6000"))
+# Full texts kept in memory; the same str object is handed back so per-text caches don't rehash it
+NOTES_MEMORY_ITEMS = 8
+NOTES_RETENTION_DAYS = 30
+NOTES_REF_PREFIX = "notes-ref:"
+# Marks where the preview stops; everything after it in the stored text is still used
+PREVIEW_MARKER = "[… {more:,} more characters of these notes are used but not shown here. Edit above this line.]"
+
+
+def notes_digest(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def preview_marker(more: int) -> str:
+    return PREVIEW_MARKER.format(more=more)
+
+
+class NotesStore:
+    """sha256 -> notes text in SQLite, with a small in-memory LRU in front."""
+
+    def __init__(self, path: str, memory_items: int = NOTES_MEMORY_ITEMS):
+        self.path = path
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {"stored": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        db = self._db()
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS notes (sha TEXT PRIMARY KEY, text TEXT NOT NULL, used REAL NOT NULL)"
+        )
+        db.execute("DELETE FROM notes WHERE used < ?", (time.time() - NOTES_RETENTION_DAYS * 86400,))
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def _remember(self, sha: str, text: str):
+        with self._lock:
+            self._memory[sha] = text
+            self._memory.move_to_end(sha)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def put(self, text: str, sha: str = None) -> str:
+        """Store text (no-op if it's already there); returns its sha."""
+        sha = sha or notes_digest(text)
+        with self._lock:
+            known = sha in self._memory
+        if not known:
+            cur = self._db().execute(
+                "INSERT OR IGNORE INTO notes (sha, text, used) VALUES (?, ?, ?)", (sha, text, time.time())
+            )
+            if cur.rowcount:
+                self.stats["stored"] += 1
+        self._remember(sha, text)
+        return sha
+
+    def get(self, sha: str):
+        with self._lock:
+            text = self._memory.get(sha)
+            if text is not None:
+                self._memory.move_to_end(sha)
+        if text is not None:
+            self.stats["memory_hits"] += 1
+            return text
+        db = self._db()
+        row = db.execute("SELECT text FROM notes WHERE sha = ?", (sha,)).fetchone()
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+        db.execute("UPDATE notes SET used = ? WHERE sha = ?", (time.time(), sha))
+        self.stats["disk_hits"] += 1
+        self._remember(sha, row[0])
+        return row[0]
+
+
+@lru_cache(maxsize=None)
+def get_notes_store() -> NotesStore:
+    return NotesStore(os.path.join(CACHE_DIR, "notes_store.sqlite3"))
+
+
+def notes_preview(text: str, limit: int = NOTES_PREVIEW_CHARS):
+    """(widget_value, sha or None). Short notes go in the widget whole; long ones as a stored reference."""
+    text = text or ""
+    if len(text) <= limit:
+        return text, None
+    # Cut at a paragraph or line break so the preview doesn't end mid-sentence
+    cut = max(text.rfind("\n\n", 0, limit), text.rfind("\n", 0, limit))
+    cut = cut if cut > limit // 2 else limit
+    sha = get_notes_store().put(text)
+    return f"{text[:cut].rstrip()}\n\n{preview_marker(len(text) - cut)}", sha
+
+
+def resolve_notes(value: str, sha: str = None) -> str:
+    """Full notes for a widget value from notes_preview(), or for a "notes-ref:<sha>" string.
+
+    An unchanged preview gives the stored text. If the student edited above the marker line, their
+    edit replaces the preview part and the rest of the stored text follows. Deleting the marker line
+    drops the rest. Plain text without a reference comes back unchanged.
+    """
+    value = value or ""
+    if not sha and value.startswith(NOTES_REF_PREFIX):
+        sha, value = value[len(NOTES_REF_PREFIX):].strip(), None
+    if not sha:
+        return value
+    full = get_notes_store().get(sha)
+    if full is None:
+        # Pruned or from another server's store: use what the widget has
+        return value or ""
+    if value is None:
+        return full
+    head, marker, _ = value.rpartition("\n\n[… ")
+    if not marker:
+        return value
+    preview, _ = notes_preview(full)
+    preview_head = preview.rpartition("\n\n[… ")[0]
+    if head == preview_head:
+        return full
+    return head.rstrip() + "\n" + full[len(preview_head):]
+
+
+def notes_ref(sha: str) -> str:
+    """A notes value that prompt builders and the engine API resolve to the stored text."""
+    return f"{NOTES_REF_PREFIX}{sha}"
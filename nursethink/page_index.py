@@ -0,0 +1,376 @@
+"""Lazy reading of large PDFs: an outline and page index at upload, pages extracted on demand.
+
+Extracting every page of a 1,000-page textbook takes minutes, and a prompt
+only ever uses a few of them. For PDFs of LAZY_PDF_MIN_PAGES pages or more,
+upload records the outline (bookmarks) and a cheap signature per page: a
+digest and the most frequent words of its content stream, read without
+layout analysis. The document's notes text is the outline plus a
+"[pdf-pages:<key>]" line; prompt builders swap that line for the pages that
+match the request, which are extracted then and cached per page.
+"""
+import hashlib
+import io
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import lru_cache
+
+from .cleanup import PAGE_BREAK
+from .config import CACHE_DIR
+from .notes import tokenize
+
+# 0 turns lazy reading off: every PDF is extracted whole at upload
+LAZY_PDF_MIN_PAGES = int(os.getenv("NURSETHINK_LAZY_PDF_PAGES", "150"))
+# Pages inserted into one prompt, shared between the lazily read documents in the notes
+PAGES_PER_REQUEST = int(os.getenv("NURSETHINK_PAGES_PER_REQUEST", "12"))
+# Words kept per page signature
+SIGNATURE_TERMS = 40
+# A request word in a bookmark title counts this much more than on a page
+OUTLINE_TITLE_WEIGHT = 3.0
+# Open PdfReaders kept for on-demand extraction (parsing a big file's xref isn't free)
+OPEN_READERS = 2
+PAGE_REF_RE = re.compile(r"^\[pdf-pages:([0-9a-z_]+)\]$", re.M)
+
+# Kerning between pieces of one word in a TJ array, e.g. "(he) -20 (art)": under 100 (thousandths
+# of an em). Bigger adjustments such as "(Heart) -250 (failure)" are word gaps; they don't match,
+# so the two strings stay separate words
+_KERN = re.compile(rb"(?<!\\)\)\s*-?(?:\d{1,2}(?:\.\d*)?|\.\d+)\s*\(")
+_LITERAL = re.compile(rb"\(((?:[^\\)]|\\.)*)\)", re.S)
+_ESCAPE = re.compile(rb"\\(.)", re.S)
+
+
+def page_ref(key: str) -> str:
+    return f"[pdf-pages:{key}]"
+
+
+def content_words(stream: bytes) -> str:
+    """Rough text of a page content stream: the literal strings it shows, no layout or font decoding.
+
+    Good enough to tell what a page is about; fonts with custom encodings just give no words.
+    """
+    strings = _LITERAL.findall(_KERN.sub(b"", stream))
+    return _ESCAPE.sub(rb"\1", b" ".join(strings)).decode("latin-1")
+
+
+def page_signature(stream: bytes):
+    """(digest, terms) of a page's content: a short hash and its most frequent words."""
+    digest = hashlib.blake2b(stream, digest_size=8).hexdigest()
+    counts = Counter(w for w in tokenize(content_words(stream)) if len(w) > 2 and not w.isdigit())
+    return digest, [w for w, _ in counts.most_common(SIGNATURE_TERMS)]
+
+
+def _page_stream(page) -> bytes:
+    try:
+        contents = page.get_contents()
+        return contents.get_data() if contents is not None else b""
+    except Exception:
+        return b""
+
+
+def read_outline(reader, total: int) -> list:
+    """[(title, level, start, end)] for the PDF's bookmarks, in order; pages are 0-based, end exclusive."""
+    flat = []
+
+    def walk(items, level):
+        for item in items:
+            if isinstance(item, list):
+                walk(item, level + 1)
+                continue
+            try:
+                start = reader.get_destination_page_number(item)
+                title = str(item.title or "").strip()
+            except Exception:
+                continue
+            if title and 0 <= start < total:
+                flat.append([title, level, start, total])
+
+    try:
+        walk(reader.outline, 0)
+    except Exception:
+        return []
+    # A bookmark runs until the next one at its level or above
+    open_items = []
+    for item in flat:
+        while open_items and open_items[-1][1] >= item[1]:
+            open_items.pop()[3] = item[2]
+        open_items.append(item)
+    return [(title, level, start, max(end, start + 1)) for title, level, start, end in flat]
+
+
+class PageIndex:
+    """Outline, page signatures and extracted pages of lazily read PDFs, keyed by upload_key()."""
+
+    def __init__(self, path: str, pdf_dir: str):
+        self.path = path
+        self.pdf_dir = pdf_dir
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._readers = OrderedDict()
+        self._indexes = OrderedDict()
+        self.stats = {
+            "indexed": 0,
+            "index_seconds": 0.0,
+            "requests": 0,
+            "page_hits": 0,
+            "pages_extracted": 0,
+            "extract_seconds": 0.0,
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        db = self._db()
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS pdfs (key TEXT PRIMARY KEY, pages INTEGER NOT NULL, outline TEXT NOT NULL, "
+            "seconds REAL NOT NULL)"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS page_signatures (key TEXT NOT NULL, page INTEGER NOT NULL, "
+            "digest TEXT NOT NULL, terms TEXT NOT NULL, PRIMARY KEY (key, page))"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS page_text (key TEXT NOT NULL, page INTEGER NOT NULL, text TEXT NOT NULL, "
+            "PRIMARY KEY (key, page))"
+        )
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def _pdf_path(self, key: str) -> str:
+        return os.path.join(self.pdf_dir, key[:2], key + ".pdf")
+
+    def has(self, key: str) -> bool:
+        return self._db().execute("SELECT 1 FROM pdfs WHERE key = ?", (key,)).fetchone() is not None
+
+    def build(self, key: str, data: bytes, max_pages: int = None, min_pages: int = LAZY_PDF_MIN_PAGES):
+        """Index a PDF for lazy reading; returns {"pages", "outline", "seconds"}, or None below min_pages.
+
+        Keeps a copy of the file so pages can be extracted later, in this or another process.
+        """
+        from PyPDF2 import PdfReader
+
+        t0 = time.perf_counter()
+        if not min_pages:
+            return None
+        try:
+            reader = PdfReader(io.BytesIO(data))
+            total = len(reader.pages)
+        except Exception:
+            return None
+        if max_pages:
+            total = min(total, max_pages)
+        if total < min_pages:
+            return None
+
+        outline = read_outline(reader, total)
+        signatures = []
+        for i in range(total):
+            digest, terms = page_signature(_page_stream(reader.pages[i]))
+            signatures.append((key, i, digest, " ".join(terms)))
+
+        path = self._pdf_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        seconds = time.perf_counter() - t0
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute(
+                "INSERT OR REPLACE INTO pdfs (key, pages, outline, seconds) VALUES (?, ?, ?, ?)",
+                (key, total, json.dumps(outline), seconds),
+            )
+            db.execute("DELETE FROM page_signatures WHERE key = ?", (key,))
+            db.executemany(
+                "INSERT INTO page_signatures (key, page, digest, terms) VALUES (?, ?, ?, ?)", signatures
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self._indexes.pop(key, None)
+            self._readers.pop(key, None)
+        self.stats["indexed"] += 1
+        self.stats["index_seconds"] += seconds
+        return {"pages": total, "outline": len(outline), "seconds": seconds}
+
+    def _index(self, key: str):
+        """(pages, outline, [set of terms per page], [digest per page]) or None; a few kept in memory."""
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+        db = self._db()
+        row = db.execute("SELECT pages, outline FROM pdfs WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        pages, outline = row[0], [tuple(item) for item in json.loads(row[1])]
+        terms = [frozenset()] * pages
+        digests = [""] * pages
+        for page, digest, words in db.execute(
+            "SELECT page, digest, terms FROM page_signatures WHERE key = ?", (key,)
+        ):
+            if page < pages:
+                terms[page] = frozenset(words.split())
+                digests[page] = digest
+        index = (pages, outline, terms, digests)
+        with self._lock:
+            self._indexes[key] = index
+            while len(self._indexes) > 4:
+                self._indexes.popitem(last=False)
+        return index
+
+    def document_text(self, key: str) -> str:
+        """Notes text for a lazily read PDF: its outline, then the line prompts expand into pages."""
+        index = self._index(key)
+        if index is None:
+            return ""
+        pages, outline = index[0], index[1]
+        lines = [f"A {pages:,}-page PDF; the pages a question needs are read when it's asked."]
+        if outline:
+            lines.append("Contents:")
+            lines.extend(
+                f"{'  ' * level}- {heading} (p. {start + 1}–{end})" for heading, level, start, end in outline
+            )
+        return "\n".join(lines) + "\n\n" + page_ref(key)
+
+    def select_pages(self, key: str, query: str, limit: int = PAGES_PER_REQUEST) -> list:
+        """0-based page numbers most relevant to query, in page order; the first pages when nothing matches."""
+        index = self._index(key)
+        if index is None:
+            return []
+        pages, outline, page_terms, digests = index
+        terms = set(tokenize(query))
+        scores = [0.0] * pages
+        if terms:
+            # Rarer words say more about where the answer is
+            weight = {t: math.log(1 + pages / (1 + sum(1 for s in page_terms if t in s))) for t in terms}
+            for page, words in enumerate(page_terms):
+                hit = terms & words
+                if hit:
+                    scores[page] = sum(weight[t] for t in hit)
+            for heading, _, start, end in outline:
+                hit = terms & set(tokenize(heading))
+                if hit:
+                    bonus = OUTLINE_TITLE_WEIGHT * sum(weight[t] for t in hit)
+                    for page in range(start, min(end, pages)):
+                        scores[page] += bonus
+        ranked = sorted((p for p in range(pages) if scores[p] > 0), key=lambda p: (-scores[p], p))
+        if not ranked:
+            ranked = range(pages)
+        chosen = []
+        seen = set()
+        for page in ranked:
+            # The same slide or handout page repeated: send it once
+            if digests[page] and digests[page] in seen:
+                continue
+            seen.add(digests[page])
+            chosen.append(page)
+            if len(chosen) >= limit:
+                break
+        return sorted(chosen)
+
+    def _reader(self, key: str):
+        # Caller holds self._lock
+        reader = self._readers.get(key)
+        if reader is None:
+            from PyPDF2 import PdfReader
+
+            with open(self._pdf_path(key), "rb") as f:
+                reader = PdfReader(io.BytesIO(f.read()))
+            self._readers[key] = reader
+            while len(self._readers) > OPEN_READERS:
+                self._readers.popitem(last=False)
+        self._readers.move_to_end(key)
+        return reader
+
+    def pages(self, key: str, pages: list):
+        """({page: text}, [pages newly stored]) for the given pages, extracting only uncached ones."""
+        if not pages:
+            return {}, []
+        db = self._db()
+        marks = ",".join("?" * len(pages))
+        texts = dict(db.execute(
+            f"SELECT page, text FROM page_text WHERE key = ? AND page IN ({marks})", (key, *pages)
+        ).fetchall())
+        self.stats["page_hits"] += len(texts)
+        missing = [p for p in pages if p not in texts]
+        if not missing:
+            return texts, []
+        t0 = time.perf_counter()
+        extracted = []
+        # PdfReader isn't thread-safe; pages are few per request, so one at a time is fine
+        with self._lock:
+            try:
+                reader = self._reader(key)
+            except OSError:
+                # The kept copy is gone (cache dir cleared): the outline is all there is
+                return texts, []
+            for page in missing:
+                try:
+                    text = reader.pages[page].extract_text() or ""
+                except Exception:
+                    text = ""
+                texts[page] = text
+                extracted.append((key, page, text))
+        # Another session may have read the same page meanwhile; only the first one to store it reports it new
+        new = [
+            row[1] for row in extracted
+            if db.execute("INSERT OR IGNORE INTO page_text (key, page, text) VALUES (?, ?, ?)", row).rowcount
+        ]
+        self.stats["pages_extracted"] += len(extracted)
+        self.stats["extract_seconds"] += time.perf_counter() - t0
+        return texts, new
+
+    def relevant_text(self, key: str, query: str, limit: int = PAGES_PER_REQUEST) -> str:
+        """The pages of the PDF that best match query, extracted (or from cache), each labelled with its page."""
+        self.stats["requests"] += 1
+        chosen = self.select_pages(key, query, limit)
+        texts, new = self.pages(key, chosen)
+        if new:
+            # Library search finds these pages from now on
+            from .library import get_notes_library
+
+            get_notes_library().add_passages(key, [(p, texts[p]) for p in new if texts[p].strip()])
+        return f"\n{PAGE_BREAK}\n".join(f"[Page {p + 1}]\n{texts[p].strip()}" for p in chosen if texts.get(p, "").strip())
+
+    def drop(self, key: str):
+        db = self._db()
+        for table in ("pdfs", "page_signatures", "page_text"):
+            db.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+        with self._lock:
+            self._indexes.pop(key, None)
+            self._readers.pop(key, None)
+        try:
+            os.remove(self._pdf_path(key))
+        except OSError:
+            pass
+
+
+@lru_cache(maxsize=None)
+def get_page_index() -> PageIndex:
+    return PageIndex(os.path.join(CACHE_DIR, "page_index.sqlite3"), os.path.join(CACHE_DIR, "pdf"))
+
+
+def expand_page_refs(notes: str, query: str, limit: int = PAGES_PER_REQUEST) -> str:
+    """Replace each "[pdf-pages:<key>]" line in notes with that PDF's pages relevant to query."""
+    if not notes or "[pdf-pages:" not in notes:
+        return notes
+    keys = PAGE_REF_RE.findall(notes)
+    if not keys:
+        return notes
+    per_doc = max(2, limit // len(keys))
+    index = get_page_index()
+    return PAGE_REF_RE.sub(lambda m: index.relevant_text(m.group(1), query, per_doc), notes)
@@ -0,0 +1,160 @@
+"""PDF text extraction for NurseThink.
+
+Lives outside app.py so process-pool workers can import it (Streamlit runs
+app.py as a script, which child processes can't pickle functions from).
+"""
+import io
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+
+# Below this many pages they're read in this process: worker processes cost more to start than they save
+PARALLEL_MIN_PAGES = 16
+PAGES_PER_TASK = 8
+PAGE_TIMEOUT_SECONDS = 10.0
+
+
+def count_pdf_pages(data: bytes) -> int:
+    from PyPDF2 import PdfReader  # heavy; only load it once a PDF actually arrives
+
+    return len(PdfReader(io.BytesIO(data)).pages)
+
+
+# Each worker's parsed PDF, set up once by _init_worker
+_reader = None
+
+
+def _init_worker(data: bytes):
+    """Pool initializer: the bytes cross to each worker once and are parsed once there."""
+    global _reader
+    from PyPDF2 import PdfReader
+
+    try:
+        _reader = PdfReader(io.BytesIO(data))
+    except Exception:
+        _reader = None
+
+
+def _extract_page_range(start: int, end: int) -> list:
+    """Worker: return [(page_idx, text, status)] for pages [start, end)."""
+    out = []
+    for i in range(start, end):
+        try:
+            out.append((i, _reader.pages[i].extract_text() or "", "ok"))
+        except Exception:
+            out.append((i, "", "error"))
+    return out
+
+
+def _read_pages(data: bytes, start: int, end: int, out: queue.Queue, stop: threading.Event):
+    """Thread: put (page_idx, text, status) for pages [start, end) on out until stop is set."""
+    from PyPDF2 import PdfReader
+
+    # Its own reader: one left behind on a stuck page can't be shared with the next thread
+    try:
+        reader = PdfReader(io.BytesIO(data))
+    except Exception:
+        reader = None
+    for i in range(start, end):
+        if stop.is_set():
+            return
+        try:
+            out.put((i, reader.pages[i].extract_text() or "", "ok"))
+        except Exception:
+            out.put((i, "", "error"))
+
+
+def _iter_pages_in_process(data: bytes, total: int, page_timeout: float):
+    """Short documents: yield (page_idx, text, status) read on a thread here, no worker process.
+
+    A thread can't be killed, so one stuck past page_timeout is told to stop after that page
+    and a fresh thread (and reader) carries on from the next one.
+    """
+    page = 0
+    while page < total:
+        out = queue.Queue()
+        stop = threading.Event()
+        threading.Thread(target=_read_pages, args=(data, page, total, out, stop), name="pdf-pages", daemon=True).start()
+        try:
+            while page < total:
+                try:
+                    item = out.get(timeout=page_timeout)
+                except queue.Empty:
+                    yield page, "", "timeout"
+                    page += 1
+                    break
+                yield item
+                page += 1
+        finally:
+            # Stuck, or the caller stopped reading: the thread quits after its current page
+            stop.set()
+
+
+def _page_ranges(total: int, pages_per_task: int):
+    for start in range(0, total, pages_per_task):
+        yield start, min(total, start + pages_per_task)
+
+
+def _start_pool(data: bytes, workers: int, ranges: list):
+    """(pool, [(start, end, async_result)]) with every range submitted."""
+    # spawn: forking a process that runs Streamlit's threads is not safe
+    pool = multiprocessing.get_context("spawn").Pool(processes=workers, initializer=_init_worker, initargs=(data,))
+    return pool, [(start, end, pool.apply_async(_extract_page_range, (start, end))) for start, end in ranges]
+
+
+def iter_pdf_pages(
+    data: bytes,
+    max_pages: int = None,
+    workers: int = None,
+    pages_per_task: int = PAGES_PER_TASK,
+    page_timeout: float = PAGE_TIMEOUT_SECONDS,
+):
+    """Yield {"page", "text", "status", "total"} dicts in page order as pages are extracted.
+
+    Pages are read in worker processes, split into page ranges; a range that
+    takes longer than page_timeout per page is given up on (status "timeout")
+    instead of blocking the whole extraction. Short documents are read in this
+    process, with the same timeout per page.
+    """
+    total = count_pdf_pages(data)
+    if max_pages:
+        total = min(total, max_pages)
+    if total == 0:
+        return
+
+    if total < PARALLEL_MIN_PAGES:
+        for i, text, status in _iter_pages_in_process(data, total, page_timeout):
+            yield {"page": i, "text": text, "status": status, "total": total}
+        return
+
+    workers = workers or min(os.cpu_count() or 2, 8)
+    pool, tasks = _start_pool(data, workers, list(_page_ranges(total, pages_per_task)))
+    try:
+        for n in range(len(tasks)):
+            start, end, task = tasks[n]
+            # Budget counts from when we start waiting on this range, so
+            # ranges queued behind a slow one aren't penalised for it
+            deadline = time.monotonic() + page_timeout * (end - start)
+            try:
+                pages = task.get(timeout=max(0.0, deadline - time.monotonic()))
+            except multiprocessing.TimeoutError:
+                pages = [(i, "", "timeout") for i in range(start, end)]
+                # Its worker is still stuck on that page: replace the pool, keeping ranges already read
+                # and resubmitting the rest, so they don't queue behind it
+                pending = [(s, e) for s, e, t in tasks[n + 1:] if not t.ready()]
+                done = [(s, e, t) for s, e, t in tasks[n + 1:] if t.ready()]
+                pool.terminate()
+                pool.join()
+                pool, resubmitted = _start_pool(data, workers, pending)
+                tasks[n + 1:] = sorted(done + resubmitted, key=lambda item: item[0])
+            except Exception:
+                pages = [(i, "", "error") for i in range(start, end)]
+            for i, text, status in pages:
+                yield {"page": i, "text": text, "status": status, "total": total}
+    finally:
+        # terminate (not close) so a worker stuck on a pathological page dies with us
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,168 @@
+"""Batch quiz generation: N questions concurrently with near-duplicate filtering."""
+import asyncio
+import os
+import re
+import time
+
+
+from .config import MODEL_NAME, OPENAI_API_KEY
+from .notes import estimate_tokens, tokenize
+from .scheduler import OUTPUT_TOKEN_ALLOWANCE, get_model_scheduler
+from .upstream import acall_with_retries, model_timeout
+
+QUIZ_BATCH_MAX = 50
+QUIZ_BATCH_CONCURRENCY = int(os.getenv("NURSETHINK_QUIZ_CONCURRENCY", "6"))
+QUIZ_BATCH_RPM = int(os.getenv("NURSETHINK_QUIZ_RPM", "120"))
+QUIZ_DUPLICATE_THRESHOLD = 0.6
+
+# Rotated through the batch so parallel calls don't all write the same question
+QUIZ_ANGLES = [
+    "priority / first action",
+    "assessment finding to report",
+    "client teaching (needs further teaching)",
+    "delegation / assignment",
+    "safety and infection control",
+    "medication administration and monitoring",
+    "select-all-that-apply (SATA)",
+    "expected vs unexpected finding",
+    "therapeutic communication",
+    "complication recognition",
+]
+
+
+def build_quiz_batch_prompt(base_prompt: str, index: int, total: int) -> str:
+    angle = QUIZ_ANGLES[index % len(QUIZ_ANGLES)]
+    return (
+        f"{base_prompt}\n\n"
+        f"BATCH: This is question {index + 1} of {total} in a review set.\n"
+        f"- Focus this question on: {angle}.\n"
+        f"- Use a different client scenario than a generic textbook example."
+    )
+
+
+def quiz_stem(text: str) -> str:
+    """The question stem: everything before the first answer option line."""
+    lines = []
+    for line in (text or "").splitlines():
+        if re.match(r"^\s*(\(?[A-Ha-h1-8][\).:]|[-•*]\s*\(?[A-Ha-h][\).:])\s+", line) and lines:
+            break
+        lines.append(line)
+    return " ".join(lines)
+
+
+def shingles(text: str, n: int = 3) -> set:
+    words = tokenize(text)
+    if len(words) < n:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class AsyncRateLimiter:
+    """Token bucket: at most rate_per_minute acquisitions per minute, with small bursts."""
+
+    def __init__(self, rate_per_minute: int, burst: int = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1, rate_per_minute // 20)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def aiter_quiz_batch(base_prompt: str, count: int, concurrency: int = QUIZ_BATCH_CONCURRENCY, rpm: int = QUIZ_BATCH_RPM,
+                           user: str = None):
+    """Async generator: yield {"index", "text", "status", "seconds", "queue_wait"} as each question completes.
+
+    user is who the batch is for, so the process-wide scheduler can queue it fairly against other students.
+    """
+    from openai import AsyncOpenAI
+
+    # One client per batch: async clients are tied to the event loop that iter_quiz_batch creates
+    aclient = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+    sem = asyncio.Semaphore(concurrency)
+    limiter = AsyncRateLimiter(rpm)
+    t0 = time.perf_counter()
+
+    async def one(i: int):
+        queued = time.perf_counter()
+        async with sem:
+            await limiter.acquire()
+            waited = time.perf_counter() - queued
+            prompt = build_quiz_batch_prompt(base_prompt, i, count)
+            reserved = estimate_tokens(prompt) + OUTPUT_TOKEN_ALLOWANCE
+            timings = {"queue_wait": 0.0}
+            try:
+                r = await acall_with_retries(
+                    lambda: aclient.responses.create(model=MODEL_NAME, input=prompt, timeout=model_timeout("quiz")),
+                    user=user,
+                    tokens=reserved,
+                    timings=timings,
+                )
+                text = r.output_text.strip()
+                usage = getattr(r, "usage", None)
+                used = getattr(usage, "total_tokens", None) if usage else None
+                get_model_scheduler().settle(reserved, used if used is not None else estimate_tokens(prompt + text))
+                # The batch's own limiter wait plus the shared queue's
+                return i, text, None, waited + timings["queue_wait"]
+            except Exception as e:
+                return i, "", f"AI error: {type(e).__name__}: {e}", waited + timings["queue_wait"]
+
+    # Replacements for dropped duplicates, capped so a narrow topic can't loop forever
+    max_attempts = count + max(2, count // 2)
+    next_index = count
+    accepted = []
+    pending = {asyncio.ensure_future(one(i)) for i in range(count)}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                i, text, err, waited = task.result()
+                elapsed = time.perf_counter() - t0
+                if err:
+                    yield {"index": i, "text": err, "status": "error", "seconds": elapsed, "queue_wait": waited}
+                    continue
+                stem = shingles(quiz_stem(text))
+                if any(jaccard(stem, other) >= QUIZ_DUPLICATE_THRESHOLD for other in accepted):
+                    yield {"index": i, "text": text, "status": "duplicate", "seconds": elapsed, "queue_wait": waited}
+                    if next_index < max_attempts:
+                        pending.add(asyncio.ensure_future(one(next_index)))
+                        next_index += 1
+                    continue
+                accepted.append(stem)
+                yield {"index": i, "text": text, "status": "ok", "seconds": elapsed, "queue_wait": waited}
+    finally:
+        for task in pending:
+            task.cancel()
+        await aclient.close()
+
+
+def iter_quiz_batch(base_prompt: str, count: int, concurrency: int = QUIZ_BATCH_CONCURRENCY, rpm: int = QUIZ_BATCH_RPM,
+                    user: str = None):
+    """Sync wrapper so the Streamlit script can render each question as soon as it lands."""
+    loop = asyncio.new_event_loop()
+    agen = aiter_quiz_batch(base_prompt, count, concurrency, rpm, user)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(agen.aclose())
+        loop.close()
@@ -0,0 +1,206 @@
+"""Process-wide admission for model calls: rate limits, fair queuing and priorities.
+
+Every upstream request takes a ticket here first. Token buckets keep the
+process under the API's requests- and tokens-per-minute limits, so a class
+burst waits in line instead of turning into 429s. Waiting tickets are served
+by priority (a student's Generate or chat turn before background warm-up and
+pool refills), then by start-time fair queuing across users: someone who
+queued ten quiz questions doesn't hold up the next student's single question.
+"""
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+# 0 disables a limit; set these a little under the account's real limits
+MODEL_RPM_LIMIT = int(os.getenv("NURSETHINK_MODEL_RPM", "450"))
+MODEL_TPM_LIMIT = int(os.getenv("NURSETHINK_MODEL_TPM", "180000"))
+# Largest burst, as seconds of the per-minute rate
+BUCKET_BURST_SECONDS = 10
+# Reserved for the answer on admission; settle() trues it up once usage is known
+OUTPUT_TOKEN_ALLOWANCE = 800
+# Background calls only go while the buckets are at least this full, leaving the rest for students
+BACKGROUND_HEADROOM = 0.5
+QUEUE_POLL_SECONDS = 0.25
+BACKGROUND_USER = "background"
+
+
+class TokenBucket:
+    """rate_per_minute refill with a BUCKET_BURST_SECONDS burst; rate 0 means unlimited."""
+
+    def __init__(self, rate_per_minute: int, burst_seconds: float = BUCKET_BURST_SECONDS):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float, headroom: float = 0.0) -> float:
+        """Seconds until amount can be taken (0 = now). A request bigger than the burst waits for a full bucket."""
+        if not self.rate:
+            return 0.0
+        needed = min(amount, self.capacity) + headroom * self.capacity
+        return max(0.0, (min(needed, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float):
+        # May go negative: an oversized request is paid back before the next one goes
+        if self.rate:
+            self.level -= amount
+
+    def give_back(self, amount: float):
+        if self.rate:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class _Ticket:
+    __slots__ = ("priority", "start", "finish", "seq", "user", "tokens")
+
+    def __init__(self, priority: int, start: float, finish: float, seq: int, user: str, tokens: int):
+        self.priority = priority
+        self.start = start
+        self.finish = finish
+        self.seq = seq
+        self.user = user
+        self.tokens = tokens
+
+    def order(self):
+        return self.priority, self.finish, self.seq
+
+
+_context = threading.local()
+
+
+@contextmanager
+def background_calls():
+    """Model calls made on this thread inside the block queue as background work."""
+    previous = getattr(_context, "priority", None)
+    _context.priority = PRIORITY_BACKGROUND
+    try:
+        yield
+    finally:
+        _context.priority = previous
+
+
+def current_priority() -> int:
+    priority = getattr(_context, "priority", None)
+    return PRIORITY_INTERACTIVE if priority is None else priority
+
+
+class ModelScheduler:
+    def __init__(self, rpm: int = MODEL_RPM_LIMIT, tpm: int = MODEL_TPM_LIMIT):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._seq = itertools.count()
+        # Start-time fair queuing: each user's tickets are tagged after their previous ones
+        self._vtime = 0.0
+        self._user_finish = {}
+        self.stats = {
+            "admitted": 0,
+            "admitted_background": 0,
+            "queued": 0,
+            "waiting": 0,
+            "wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "tokens_reserved": 0,
+            "tokens_used": 0,
+        }
+
+    def _delay(self, ticket: _Ticket) -> float:
+        headroom = BACKGROUND_HEADROOM if ticket.priority >= PRIORITY_BACKGROUND else 0.0
+        return max(self.requests.wait_for(1, headroom), self.tokens.wait_for(ticket.tokens, headroom))
+
+    def position(self, ticket: _Ticket) -> int:
+        """1-based place in line among the waiting tickets."""
+        key = ticket.order()
+        return 1 + sum(1 for t in self._waiting if t.order() < key)
+
+    def acquire(self, user: str = None, tokens: int = 0, priority: int = None, on_wait=None) -> float:
+        """Block until this call may go upstream; returns the seconds spent waiting.
+
+        on_wait(position) is called (outside the lock) whenever the caller's place in line changes,
+        and with 0 once it's admitted after having waited.
+        """
+        priority = current_priority() if priority is None else priority
+        user = user or (BACKGROUND_USER if priority >= PRIORITY_BACKGROUND else "anonymous")
+        t0 = time.monotonic()
+        with self._cond:
+            start = max(self._vtime, self._user_finish.get(user, 0.0))
+            ticket = _Ticket(priority, start, start + max(1, tokens), next(self._seq), user, tokens)
+            self._user_finish[user] = ticket.finish
+            self._waiting.append(ticket)
+            self.stats["waiting"] = len(self._waiting)
+        admitted = False
+        queued = False
+        reported = None
+        try:
+            while True:
+                with self._cond:
+                    now = time.monotonic()
+                    self.requests.refill(now)
+                    self.tokens.refill(now)
+                    head = min(self._waiting, key=_Ticket.order)
+                    delay = self._delay(ticket) if head is ticket else QUEUE_POLL_SECONDS
+                    if head is ticket and delay <= 0:
+                        self._admit(ticket)
+                        admitted = True
+                        break
+                    place = self.position(ticket)
+                queued = True
+                if on_wait and place != reported:
+                    on_wait(place)
+                    reported = place
+                with self._cond:
+                    self._cond.wait(min(delay, QUEUE_POLL_SECONDS))
+        finally:
+            if not admitted:
+                with self._cond:
+                    self._waiting.remove(ticket)
+                    self.stats["waiting"] = len(self._waiting)
+                    self._cond.notify_all()
+        waited = time.monotonic() - t0
+        self.stats["wait_seconds"] += waited
+        self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], waited)
+        if queued:
+            self.stats["queued"] += 1
+        if reported is not None:
+            on_wait(0)
+        return waited
+
+    def _admit(self, ticket: _Ticket):
+        self._waiting.remove(ticket)
+        self._vtime = max(self._vtime, ticket.start)
+        if len(self._user_finish) > 1000:
+            # Users whose tags are behind the clock start from it anyway
+            self._user_finish = {u: f for u, f in self._user_finish.items() if f > self._vtime}
+        self.requests.take(1)
+        self.tokens.take(ticket.tokens)
+        self.stats["waiting"] = len(self._waiting)
+        self.stats["admitted"] += 1
+        self.stats["tokens_reserved"] += ticket.tokens
+        if ticket.priority >= PRIORITY_BACKGROUND:
+            self.stats["admitted_background"] += 1
+        self._cond.notify_all()
+
+    def settle(self, reserved: int, used: int):
+        """Correct the token bucket once the call's real usage is known."""
+        with self._cond:
+            self.stats["tokens_used"] += used
+            if used < reserved:
+                self.tokens.give_back(reserved - used)
+            else:
+                self.tokens.take(used - reserved)
+            self._cond.notify_all()
+
+
+@lru_cache(maxsize=None)
+def get_model_scheduler() -> ModelScheduler:
+    return ModelScheduler()
@@ -0,0 +1,739 @@
+"""Asyncio HTTP API for the NurseThink engine.
+
+    python -m nursethink.server --host 0.0.0.0 --port 8600 --workers 4
+
+JSON in, JSON out. Answers can stream as NDJSON (one JSON object per line)
+over chunked transfer encoding. Model calls and other blocking work run on a
+thread pool so a worker keeps serving other students while they wait. Chat
+sessions and NGN cases live in SQLite, so any worker behind the shared port
+can take the next request for them.
+
+Endpoints:
+    GET    /health
+    GET    /metrics                              Prometheus text (this worker)
+    POST   /v1/prompt                            build a mode prompt, no model call
+    POST   /v1/generate                          any mode; {"stream": true} for NDJSON
+    POST   /v1/quiz/batch                        NDJSON, one line per question
+    POST   /v1/chat/summary                      fold chat turns into a rolling summary
+    POST   /v1/chat/sessions                     create a chat session
+    GET    /v1/chat/sessions/<id>
+    DELETE /v1/chat/sessions/<id>
+    POST   /v1/chat/sessions/<id>/messages       one chat turn
+    POST   /v1/ngn/cases                         start a case for a topic
+    GET    /v1/ngn/cases/<id>?wait_stage=N       long-polls until stage N (0-based) exists
+    POST   /v1/ngn/cases/<id>/stages/<N>         submit answers for stage N, returns score
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import signal
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import parse_qs, urlsplit
+
+from .chat import new_chat_memory, summarize_chat_turns, update_chat_memory
+from .config import CACHE_DIR
+from .llm import get_ai_response, get_client, stream_ai_response
+from .ngn import NGN_POOL_SIZE, get_ngn_pool, ngn_partial_case_from_dict, score_ngn_stage, start_ngn_case
+from .notes import NOTES_TOKEN_BUDGET
+from .prompts import (
+    MODE_BLOCKS,
+    build_prompt_sections,
+    build_study_chat_prompt,
+    join_sections,
+    prompt_section_sizes,
+    simulated_response,
+)
+from .quiz import QUIZ_BATCH_MAX, aiter_quiz_batch
+from .tracing import RequestTrace, get_tracer
+from .warmup import WARMUP_ENABLED, get_cache_warmer
+
+DEFAULT_PORT = 8600
+MAX_BODY_BYTES = 16 * 1024 * 1024
+KEEPALIVE_SECONDS = 30
+ENGINE_THREADS = int(os.getenv("NURSETHINK_ENGINE_THREADS", "32"))
+NGN_WAIT_MAX_SECONDS = 30
+NGN_POLL_SECONDS = 0.25
+
+STATUS_TEXT = {
+    200: "OK",
+    201: "Created",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+    __slots__ = ("method", "path", "query", "headers", "body")
+
+    def __init__(self, method: str, target: str, headers: dict, body: bytes):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path.rstrip("/") or "/"
+        self.query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        self.headers = headers
+        self.body = body
+
+    def json(self) -> dict:
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body)
+        except ValueError:
+            raise HTTPError(400, "Body is not valid JSON")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "Body must be a JSON object")
+        return data
+
+
+class Text:
+    """A plain (non-JSON) response body."""
+
+    def __init__(self, body: str, content_type: str = "text/plain; charset=utf-8"):
+        self.body = body
+        self.content_type = content_type
+
+
+# -------------------------
+# Threads <-> event loop
+# -------------------------
+async def run_blocking(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(None, partial(fn, *args, **kwargs))
+
+
+async def iter_in_thread(make_iter):
+    """Drive a blocking iterator on its own thread and yield its items on the event loop."""
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+    end = object()
+
+    def pump():
+        try:
+            for item in make_iter():
+                loop.call_soon_threadsafe(items.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(items.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(items.put_nowait, end)
+
+    threading.Thread(target=pump, name="engine-stream", daemon=True).start()
+    while True:
+        item = await items.get()
+        if item is end:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+# -------------------------
+# Session store (chat sessions + NGN cases)
+# -------------------------
+class SessionStore:
+    """Chat sessions and NGN case state in SQLite, shared by every worker process."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        db = self._db()
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS chat_sessions ("
+            "id TEXT PRIMARY KEY, messages TEXT NOT NULL, memory TEXT NOT NULL, updated REAL NOT NULL, "
+            "version INTEGER NOT NULL DEFAULT 0)"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS ngn_cases ("
+            "id TEXT PRIMARY KEY, topic TEXT NOT NULL, case_json TEXT, done INTEGER NOT NULL, "
+            "error TEXT, from_pool INTEGER NOT NULL, answers TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    # Chat
+    def create_chat(self) -> str:
+        session_id = uuid.uuid4().hex[:12]
+        self._db().execute(
+            "INSERT INTO chat_sessions (id, messages, memory, updated) VALUES (?, ?, ?, ?)",
+            (session_id, "[]", json.dumps(new_chat_memory()), time.time()),
+        )
+        return session_id
+
+    def load_chat(self, session_id: str):
+        """(messages, memory, version); pass the version back to save_chat()."""
+        row = self._db().execute(
+            "SELECT messages, memory, version FROM chat_sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            raise HTTPError(404, f"No chat session {session_id}")
+        return json.loads(row[0]), json.loads(row[1]), row[2]
+
+    def save_chat(self, session_id: str, messages: list, memory: dict, version: int):
+        """Save if nobody saved since this version was loaded (a turn on another worker); else 409."""
+        saved = self._db().execute(
+            "UPDATE chat_sessions SET messages = ?, memory = ?, updated = ?, version = version + 1 "
+            "WHERE id = ? AND version = ?",
+            (json.dumps(messages), json.dumps(memory), time.time(), session_id, version),
+        ).rowcount
+        if not saved:
+            raise HTTPError(409, f"Chat session {session_id} changed during this turn; send it again")
+
+    def delete_chat(self, session_id: str) -> bool:
+        return self._db().execute("DELETE FROM chat_sessions WHERE id = ?", (session_id,)).rowcount > 0
+
+    # NGN
+    def create_ngn_case(self, case_id: str, topic: str, from_pool: bool):
+        self._db().execute(
+            "INSERT INTO ngn_cases (id, topic, case_json, done, error, from_pool, answers, updated) "
+            "VALUES (?, ?, NULL, 0, NULL, ?, '[]', ?)",
+            (case_id, topic, int(from_pool), time.time()),
+        )
+
+    def save_ngn_progress(self, case_id: str, case, done: bool, error: str = None):
+        self._db().execute(
+            "UPDATE ngn_cases SET case_json = ?, done = ?, error = ?, updated = ? WHERE id = ?",
+            (json.dumps(case.to_dict()) if case else None, int(done), error, time.time(), case_id),
+        )
+
+    def load_ngn_case(self, case_id: str) -> dict:
+        row = self._db().execute(
+            "SELECT topic, case_json, done, error, from_pool, answers FROM ngn_cases WHERE id = ?", (case_id,)
+        ).fetchone()
+        if row is None:
+            raise HTTPError(404, f"No NGN case {case_id}")
+        topic, case_json, done, error, from_pool, answers = row
+        return {
+            "id": case_id,
+            "topic": topic,
+            "case": json.loads(case_json) if case_json else None,
+            "done": bool(done),
+            "error": error,
+            "from_pool": bool(from_pool),
+            "answers": json.loads(answers),
+        }
+
+    def add_ngn_answer(self, case_id: str, answer: dict):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT answers FROM ngn_cases WHERE id = ?", (case_id,)).fetchone()
+            answers = json.loads(row[0]) if row else []
+            answers.append(answer)
+            db.execute("UPDATE ngn_cases SET answers = ?, updated = ? WHERE id = ?", (json.dumps(answers), time.time(), case_id))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+
+# -------------------------
+# Engine API
+# -------------------------
+def _flag(data: dict, key: str, default: bool = False) -> bool:
+    value = data.get(key, default)
+    return value if isinstance(value, bool) else str(value).lower() in ("1", "true", "yes", "on")
+
+
+def _int_arg(data: dict, key: str, default: int) -> int:
+    try:
+        return int(data.get(key, default))
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"{key} must be an integer")
+
+
+def _float_arg(data: dict, key: str, default: float) -> float:
+    try:
+        return float(data.get(key, default))
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"{key} must be a number")
+
+
+def _chat_turns(data: dict) -> list:
+    turns = data.get("turns") or []
+    if not isinstance(turns, list) or not all(
+        isinstance(t, dict) and t.get("role") in ("user", "assistant") and isinstance(t.get("content"), str)
+        for t in turns
+    ):
+        raise HTTPError(400, "turns must be a list of {role: user|assistant, content: string}")
+    return turns
+
+
+def _mode_prompt(data: dict, routing: dict = None):
+    """(mode, prompt, sections) for a structured request; a raw "prompt" is passed through."""
+    mode = data.get("mode") or "explain"
+    if data.get("prompt"):
+        return mode, str(data["prompt"]), None
+    if mode not in MODE_BLOCKS:
+        raise HTTPError(400, f"Unknown mode {mode!r}; expected one of {sorted(MODE_BLOCKS)}")
+    sections = build_prompt_sections(
+        mode,
+        str(data.get("request") or ""),
+        str(data.get("notes") or ""),
+        # Same defaults as the UI's controls
+        str(data.get("difficulty") or "medium").strip().lower(),
+        _flag(data, "notes_only", False),
+        _flag(data, "label_sources", True),
+        _flag(data, "strict_mode", True),
+        _int_arg(data, "notes_budget", NOTES_TOKEN_BUDGET),
+        routing,
+    )
+    return mode, join_sections(sections), sections
+
+
+def _ndjson_answer(chunks, trace: RequestTrace, timings: dict, on_done=None):
+    """Wrap text chunks as NDJSON events: {"delta": …} lines, then {"done": true, …}."""
+
+    async def events():
+        parts = []
+        try:
+            async for delta in chunks:
+                parts.append(delta)
+                yield {"delta": delta}
+            text = "".join(parts)
+            if on_done:
+                await on_done(text)
+            yield {"done": True, "timings": timings, "trace": trace.id}
+        finally:
+            get_tracer().record(trace)
+
+    return events()
+
+
+class EngineAPI:
+    def __init__(self, store: SessionStore):
+        self.store = store
+        self.ngn_streams = {}  # case_id -> NGNCaseStream generating in this worker
+        # session_id -> lock held for a whole chat turn, while anyone holds it
+        self.chat_locks = weakref.WeakValueDictionary()
+        self.routes = [
+            ("GET", r"/health", self.health),
+            ("GET", r"/metrics", self.metrics),
+            ("POST", r"/v1/prompt", self.prompt),
+            ("POST", r"/v1/generate", self.generate),
+            ("POST", r"/v1/quiz/batch", self.quiz_batch),
+            ("POST", r"/v1/chat/summary", self.chat_summary),
+            ("POST", r"/v1/chat/sessions", self.create_chat),
+            ("GET", r"/v1/chat/sessions/(?P<session_id>\w+)", self.get_chat),
+            ("DELETE", r"/v1/chat/sessions/(?P<session_id>\w+)", self.delete_chat),
+            ("POST", r"/v1/chat/sessions/(?P<session_id>\w+)/messages", self.chat_message),
+            ("POST", r"/v1/ngn/cases", self.create_ngn_case),
+            ("GET", r"/v1/ngn/cases/(?P<case_id>\w+)", self.get_ngn_case),
+            ("POST", r"/v1/ngn/cases/(?P<case_id>\w+)/stages/(?P<stage>\d+)", self.answer_ngn_stage),
+        ]
+        self.routes = [(method, re.compile(pattern + "$"), handler) for method, pattern, handler in self.routes]
+
+    async def dispatch(self, req: Request):
+        allowed = False
+        for method, pattern, handler in self.routes:
+            match = pattern.match(req.path)
+            if not match:
+                continue
+            if method != req.method:
+                allowed = True
+                continue
+            return await handler(req, **match.groupdict())
+        raise HTTPError(405 if allowed else 404, f"{req.method} {req.path} not found")
+
+    async def health(self, req: Request):
+        return {"ok": True, "pid": os.getpid(), "ai": get_client() is not None}
+
+    async def metrics(self, req: Request):
+        return Text(get_tracer().render_prometheus(), "text/plain; version=0.0.4")
+
+    async def prompt(self, req: Request):
+        routing = {}
+        mode, prompt, sections = _mode_prompt(req.json(), routing)
+        return {
+            "mode": mode,
+            # mixed_drill only: the locally picked engine (mode None = kept the mixed prompt)
+            "routing": routing or None,
+            "prompt": prompt,
+            "sections": [
+                {"name": n, "chars": c, "tokens": t} for n, c, t in prompt_section_sizes(sections)
+            ] if sections else [],
+        }
+
+    async def generate(self, req: Request):
+        data = req.json()
+        mode, prompt, _ = _mode_prompt(data)
+        trace = RequestTrace("api_generate", mode, data.get("session_id"))
+        use_cache = _flag(data, "use_cache", True)
+        request = str(data.get("request") or "")
+
+        if _flag(data, "simulate"):
+            text = simulated_response(mode, request)
+            if _flag(data, "stream"):
+                async def once():
+                    yield text
+                return _ndjson_answer(once(), trace, {"cached": False})
+            get_tracer().record(trace)
+            return {"text": text, "trace": trace.id}
+
+        if _flag(data, "stream"):
+            timings = {}
+            chunks = iter_in_thread(lambda: stream_ai_response(prompt, mode=mode, use_cache=use_cache, timings=timings, trace=trace, request=request))
+            return _ndjson_answer(chunks, trace, timings)
+
+        try:
+            text = await run_blocking(get_ai_response, prompt, mode=mode, use_cache=use_cache, trace=trace, request=request)
+        finally:
+            get_tracer().record(trace)
+        return {"text": text, "trace": trace.id}
+
+    async def quiz_batch(self, req: Request):
+        data = req.json()
+        data.setdefault("mode", "quiz")
+        _, prompt, _ = _mode_prompt(data)
+        count = max(1, min(QUIZ_BATCH_MAX, _int_arg(data, "count", 5)))
+        trace = RequestTrace("api_quiz_batch", "quiz", data.get("session_id"))
+
+        async def events():
+            ok = 0
+            t0 = time.perf_counter()
+            try:
+                async for item in aiter_quiz_batch(prompt, count, user=data.get("session_id")):
+                    ok += item["status"] == "ok"
+                    yield item
+                    if ok >= count:
+                        break
+            finally:
+                trace.add_span("model", time.perf_counter() - t0)
+                trace.set(questions=ok)
+                get_tracer().record(trace)
+
+        return events()
+
+    async def chat_summary(self, req: Request):
+        data = req.json()
+        turns = _chat_turns(data)
+        summary = await run_blocking(summarize_chat_turns, str(data.get("summary") or ""), turns)
+        return {"summary": summary}
+
+    async def create_chat(self, req: Request):
+        return {"session_id": await run_blocking(self.store.create_chat)}
+
+    async def get_chat(self, req: Request, session_id: str):
+        messages, memory, _ = await run_blocking(self.store.load_chat, session_id)
+        return {"session_id": session_id, "messages": messages, "memory": memory}
+
+    async def delete_chat(self, req: Request, session_id: str):
+        if not await run_blocking(self.store.delete_chat, session_id):
+            raise HTTPError(404, f"No chat session {session_id}")
+        return {"deleted": session_id}
+
+    def _chat_lock(self, session_id: str) -> asyncio.Lock:
+        # Turns of one session run one after another in this worker; save_chat's version check
+        # catches a turn running on another worker at the same time
+        lock = self.chat_locks.get(session_id)
+        if lock is None:
+            lock = self.chat_locks[session_id] = asyncio.Lock()
+        return lock
+
+    async def _chat_turn(self, session_id: str, data: dict, content: str, trace: RequestTrace):
+        """Load the session and add the student's message; returns (prompt, save(answer))."""
+        messages, memory, version = await run_blocking(self.store.load_chat, session_id)
+        messages.append({"role": "user", "content": content})
+        with trace.span("memory"):
+            await run_blocking(update_chat_memory, memory, messages)
+        prompt = build_study_chat_prompt(
+            str(data.get("notes") or ""),
+            _flag(data, "notes_only", False),
+            _flag(data, "label_sources", True),
+            _flag(data, "strict_mode", True),
+            messages,
+            _int_arg(data, "notes_budget", NOTES_TOKEN_BUDGET),
+            memory=memory,
+        )
+
+        async def save(answer: str):
+            messages.append({"role": "assistant", "content": answer})
+            await run_blocking(self.store.save_chat, session_id, messages, memory, version)
+
+        return prompt, save
+
+    async def _stream_chat_turn(self, session_id: str, data: dict, content: str, trace: RequestTrace):
+        # The lock is taken once the stream is read, so a response that's never sent can't leave it held
+        async with self._chat_lock(session_id):
+            prompt, save = await self._chat_turn(session_id, data, content, trace)
+            timings = {}
+            chunks = iter_in_thread(lambda: stream_ai_response(prompt, mode="study_chat", timings=timings, trace=trace, request=content))
+            async for event in _ndjson_answer(chunks, trace, timings, on_done=save):
+                yield event
+
+    async def chat_message(self, req: Request, session_id: str):
+        data = req.json()
+        content = str(data.get("content") or "").strip()
+        if not content:
+            raise HTTPError(400, "content is required")
+        trace = RequestTrace("api_chat_turn", "study_chat", session_id)
+
+        if _flag(data, "stream") and not _flag(data, "simulate"):
+            # A missing session is a 404, not an error line in a 200 stream
+            await run_blocking(self.store.load_chat, session_id)
+            return self._stream_chat_turn(session_id, data, content, trace)
+
+        async with self._chat_lock(session_id):
+            prompt, save = await self._chat_turn(session_id, data, content, trace)
+            if _flag(data, "simulate"):
+                answer = simulated_response("study_chat", content)
+                get_tracer().record(trace)
+            else:
+                try:
+                    answer = await run_blocking(get_ai_response, prompt, mode="study_chat", trace=trace, request=content)
+                finally:
+                    get_tracer().record(trace)
+            await save(answer)
+        return {"session_id": session_id, "text": answer}
+
+    async def create_ngn_case(self, req: Request):
+        data = req.json()
+        topic = str(data.get("topic") or "").strip()
+        if not topic:
+            raise HTTPError(400, "topic is required")
+        case_id = uuid.uuid4().hex[:12]
+        trace = RequestTrace("ngn_case", "ngn_case", data.get("session_id"))
+        stream = await run_blocking(start_ngn_case, topic, trace, get_tracer())
+        await run_blocking(self.store.create_ngn_case, case_id, topic, stream.from_pool)
+        self.ngn_streams[case_id] = stream
+        threading.Thread(target=self._persist_ngn, args=(case_id, stream), name="ngn-persist", daemon=True).start()
+        return {"case_id": case_id, "from_pool": stream.from_pool}
+
+    def _persist_ngn(self, case_id: str, stream):
+        """Mirror a generating case into the store as each stage lands, so every worker can serve it."""
+        try:
+            stream.wait_for_header()
+            saved = -1
+            idx = 0
+            while True:
+                stream.wait_for_stage(idx)
+                # Read done first: once it's set the snapshot is guaranteed complete
+                done = stream.done
+                case = stream.snapshot()
+                count = len(case.stages) if case else 0
+                if count != saved or done:
+                    self.store.save_ngn_progress(case_id, case, done, stream.error)
+                    saved = count
+                if done:
+                    return
+                idx = count
+        finally:
+            self.ngn_streams.pop(case_id, None)
+
+    async def get_ngn_case(self, req: Request, case_id: str):
+        wait_stage = req.query.get("wait_stage")
+        if wait_stage is not None:
+            wait_stage = _int_arg(req.query, "wait_stage", 0)
+            timeout = min(_float_arg(req.query, "timeout", NGN_WAIT_MAX_SECONDS), NGN_WAIT_MAX_SECONDS)
+            stream = self.ngn_streams.get(case_id)
+            if stream is not None:
+                await run_blocking(stream.wait_for_stage, wait_stage, timeout)
+            else:
+                # Generating in another worker (or finished): poll the shared store
+                deadline = time.monotonic() + timeout
+                while time.monotonic() < deadline:
+                    state = await run_blocking(self.store.load_ngn_case, case_id)
+                    stages = (state["case"] or {}).get("stages") or []
+                    if state["done"] or len(stages) > wait_stage:
+                        break
+                    await asyncio.sleep(NGN_POLL_SECONDS)
+            # The persist thread may be a moment behind the stream; let it catch up
+            for _ in range(8):
+                state = await run_blocking(self.store.load_ngn_case, case_id)
+                if state["done"] or len((state["case"] or {}).get("stages") or []) > wait_stage:
+                    return state
+                if self.ngn_streams.get(case_id) is None:
+                    break
+                await asyncio.sleep(NGN_POLL_SECONDS / 4)
+        return await run_blocking(self.store.load_ngn_case, case_id)
+
+    async def answer_ngn_stage(self, req: Request, case_id: str, stage: str):
+        data = req.json()
+        idx = int(stage)
+        state = await run_blocking(self.store.load_ngn_case, case_id)
+        stages = (state["case"] or {}).get("stages") or []
+        if idx >= len(stages):
+            raise HTTPError(409, f"Stage {idx} is not ready yet")
+        typed = ngn_partial_case_from_dict({**state["case"], "stages": stages[:idx + 1]}).stages[idx]
+        chosen = {
+            "key_cues": list(data.get("key_cues") or []),
+            "hypothesis": data.get("hypothesis"),
+            "action": data.get("action"),
+            "outcome": data.get("outcome"),
+        }
+        score = score_ngn_stage(typed, **chosen)
+        await run_blocking(self.store.add_ngn_answer, case_id, {"stage": typed.stage, "score": score, "chosen": chosen})
+        return {
+            "stage": typed.stage,
+            "score": score,
+            "max_score": 4,
+            "best": stages[idx]["best"],
+            "rationale": typed.rationale,
+            "next_update": typed.next_update,
+        }
+
+
+# -------------------------
+# HTTP/1.1 plumbing
+# -------------------------
+async def read_request(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    while True:
+        raw = await reader.readline()
+        if raw in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = raw.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPError(400, "Bad Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, f"Body over {MAX_BODY_BYTES // (1024 * 1024)} MB")
+    body = await reader.readexactly(length) if length else b""
+    return Request(method.upper(), target, headers, body)
+
+
+def _head(status: int, content_type: str, extra: dict, keep_alive: bool) -> bytes:
+    lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'OK')}", f"Content-Type: {content_type}"]
+    lines += [f"{k}: {v}" for k, v in extra.items()]
+    lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def write_response(writer: asyncio.StreamWriter, result, keep_alive: bool, status: int = 200):
+    if isinstance(result, Text):
+        body = result.body.encode("utf-8")
+        writer.write(_head(status, result.content_type, {"Content-Length": len(body)}, keep_alive) + body)
+    elif hasattr(result, "__aiter__"):
+        writer.write(_head(status, "application/x-ndjson", {"Transfer-Encoding": "chunked"}, keep_alive))
+        try:
+            async for event in result:
+                line = (json.dumps(event) + "\n").encode("utf-8")
+                writer.write(f"{len(line):x}\r\n".encode("latin-1") + line + b"\r\n")
+                await writer.drain()
+        except Exception as e:
+            line = (json.dumps({"error": f"{type(e).__name__}: {e}"}) + "\n").encode("utf-8")
+            writer.write(f"{len(line):x}\r\n".encode("latin-1") + line + b"\r\n")
+        writer.write(b"0\r\n\r\n")
+    else:
+        body = json.dumps(result).encode("utf-8")
+        writer.write(_head(status, "application/json", {"Content-Length": len(body)}, keep_alive) + body)
+    await writer.drain()
+
+
+def make_connection_handler(api: EngineAPI):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    req = await asyncio.wait_for(read_request(reader), KEEPALIVE_SECONDS)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    return
+                except HTTPError as e:
+                    await write_response(writer, {"error": e.message}, False, e.status)
+                    return
+                if req is None:
+                    return
+                keep_alive = req.headers.get("connection", "").lower() != "close"
+                status = 201 if req.method == "POST" and req.path in ("/v1/chat/sessions", "/v1/ngn/cases") else 200
+                try:
+                    result = await api.dispatch(req)
+                except HTTPError as e:
+                    result, status = {"error": e.message}, e.status
+                except Exception as e:
+                    result, status = {"error": f"{type(e).__name__}: {e}"}, 500
+                await write_response(writer, result, keep_alive, status)
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def _serve(host: str, port: int, reuse_port: bool):
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(ENGINE_THREADS, thread_name_prefix="engine"))
+    api = EngineAPI(SessionStore(os.path.join(CACHE_DIR, "sessions.sqlite3")))
+    if get_client() and NGN_POOL_SIZE > 0:
+        get_ngn_pool()
+    if get_client() and WARMUP_ENABLED:
+        get_cache_warmer()
+    server = await asyncio.start_server(make_connection_handler(api), host, port, reuse_port=reuse_port or None)
+    async with server:
+        await server.serve_forever()
+
+
+def serve(host: str = "127.0.0.1", port: int = DEFAULT_PORT, reuse_port: bool = False):
+    try:
+        asyncio.run(_serve(host, port, reuse_port))
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="NurseThink engine HTTP API")
+    parser.add_argument("--host", default=os.getenv("NURSETHINK_ENGINE_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("NURSETHINK_ENGINE_PORT", str(DEFAULT_PORT))))
+    parser.add_argument("--workers", type=int, default=1, help="worker processes sharing the port (SO_REUSEPORT)")
+    args = parser.parse_args(argv)
+
+    if args.workers <= 1:
+        serve(args.host, args.port)
+        return
+    ctx = multiprocessing.get_context("spawn")
+    workers = [
+        ctx.Process(target=serve, args=(args.host, args.port, True), name=f"nursethink-worker-{i}")
+        for i in range(args.workers)
+    ]
+    for w in workers:
+        w.start()
+
+    def stop(*_):
+        raise KeyboardInterrupt
+
+    # `kill <parent>` should take the workers down too, not orphan them on the port
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for w in workers:
+            w.join()
+    except KeyboardInterrupt:
+        for w in workers:
+            w.terminate()
+
+
+if __name__ == "__main__":
+    main()
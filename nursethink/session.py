@@ -0,0 +1,247 @@
+"""Compact per-session state: chat history and NGN scores that don't grow with the session.
+
+Streamlit keeps st.session_state in server memory for every open tab, so a
+long chat used to cost memory for its whole length. ChatLog writes every
+message through to a per-session log on disk (SQLite, shared by all
+sessions) and keeps only the newest messages resident, up to a byte cap.
+It still behaves like the list of {"role", "content"} dicts the chat code
+expects; anything older is read back from disk when asked for.
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from array import array
+from functools import lru_cache
+
+from .config import CACHE_DIR
+
+# Resident chat text per session, in bytes; older messages are read back from disk when needed
+SESSION_MEMORY_CAP = int(os.getenv("NURSETHINK_SESSION_MEMORY_KB", "64")) * 1024
+# The newest messages always stay resident, whatever their size (the prompt's recent window needs them)
+CHAT_RESIDENT_MIN = 4
+CHAT_LOG_RETENTION_DAYS = float(os.getenv("NURSETHINK_CHAT_LOG_DAYS", "7"))
+# Messages shown per page in the chat panel
+CHAT_PAGE_SIZE = 20
+# Per-turn prompt sizes kept for the debug chart
+PROMPT_TOKENS_KEPT = 200
+
+ROLES = ("user", "assistant")
+_ROLE_CODES = {role: i for i, role in enumerate(ROLES)}
+
+
+class ChatLogStore:
+    """On-disk chat logs, one row per message, keyed by session."""
+
+    def __init__(self, path: str, retention_days: float = CHAT_LOG_RETENTION_DAYS):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        db = self._db()
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS chat_log ("
+            "session TEXT NOT NULL, idx INTEGER NOT NULL, role INTEGER NOT NULL, content TEXT NOT NULL, "
+            "ts REAL NOT NULL, PRIMARY KEY (session, idx))"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS ngn_answers ("
+            "session TEXT NOT NULL, ts REAL NOT NULL, stage INTEGER NOT NULL, score INTEGER NOT NULL, chosen TEXT NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS chat_log_ts ON chat_log (ts)")
+        # Sessions are gone once their tab is; drop their logs after the retention period
+        cutoff = time.time() - retention_days * 86400
+        db.execute("DELETE FROM chat_log WHERE ts < ?", (cutoff,))
+        db.execute("DELETE FROM ngn_answers WHERE ts < ?", (cutoff,))
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def append(self, session: str, idx: int, role: int, content: str):
+        self._db().execute(
+            "INSERT OR REPLACE INTO chat_log (session, idx, role, content, ts) VALUES (?, ?, ?, ?, ?)",
+            (session, idx, role, content, time.time()),
+        )
+
+    def read(self, session: str, start: int, stop: int) -> list:
+        """[(role_code, content)] for messages start..stop-1."""
+        return self._db().execute(
+            "SELECT role, content FROM chat_log WHERE session = ? AND idx >= ? AND idx < ? ORDER BY idx",
+            (session, start, stop),
+        ).fetchall()
+
+    def clear(self, session: str):
+        self._db().execute("DELETE FROM chat_log WHERE session = ?", (session,))
+
+    def add_ngn_answer(self, session: str, stage: int, score: int, chosen: str):
+        self._db().execute(
+            "INSERT INTO ngn_answers (session, ts, stage, score, chosen) VALUES (?, ?, ?, ?, ?)",
+            (session, time.time(), stage, score, chosen),
+        )
+
+
+@lru_cache(maxsize=None)
+def get_chat_log_store() -> ChatLogStore:
+    return ChatLogStore(os.path.join(CACHE_DIR, "chat_log.sqlite3"))
+
+
+# Live logs in this process, for the memory report and /metrics
+_live_logs = weakref.WeakSet()
+
+
+class ChatLog:
+    """A session's chat messages: the newest resident (capped), all of them on disk.
+
+    Supports len(), indexing, slicing, iteration and append() of {"role", "content"} dicts.
+    """
+
+    __slots__ = ("session", "cap", "offset", "roles", "texts", "resident_bytes", "prompt_tokens", "__weakref__")
+
+    def __init__(self, session: str, cap: int = SESSION_MEMORY_CAP):
+        self.session = session
+        self.cap = cap
+        # Messages before offset are only on disk
+        self.offset = 0
+        # One byte per message for the role instead of a dict and a string each
+        self.roles = array("B")
+        self.texts = []
+        self.resident_bytes = 0
+        self.prompt_tokens = array("I")
+        _live_logs.add(self)
+
+    def __len__(self) -> int:
+        return self.offset + len(self.texts)
+
+    def _message(self, role: int, content: str) -> dict:
+        return {"role": ROLES[role], "content": content}
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return self.messages(start, stop)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("chat message index out of range")
+        return self.messages(index, index + 1)[0]
+
+    def __iter__(self):
+        for start in range(0, len(self), CHAT_PAGE_SIZE):
+            yield from self.messages(start, start + CHAT_PAGE_SIZE)
+
+    def __reversed__(self):
+        for i in range(len(self) - 1, -1, -1):
+            yield self[i]
+
+    def messages(self, start: int, stop: int) -> list:
+        """Messages start..stop-1; the part before the resident window comes from disk."""
+        stop = min(stop, len(self))
+        out = []
+        if start < self.offset:
+            rows = get_chat_log_store().read(self.session, start, min(stop, self.offset))
+            out.extend(self._message(role, content) for role, content in rows)
+        for i in range(max(start, self.offset), stop):
+            out.append(self._message(self.roles[i - self.offset], self.texts[i - self.offset]))
+        return out
+
+    def append(self, message: dict):
+        role = _ROLE_CODES[message["role"]]
+        content = message["content"]
+        get_chat_log_store().append(self.session, len(self), role, content)
+        self.roles.append(role)
+        self.texts.append(content)
+        self.resident_bytes += sys.getsizeof(content)
+        self._spill()
+
+    def _spill(self):
+        # Everything is already on disk; spilling just forgets the oldest resident messages
+        drop = 0
+        while self.resident_bytes > self.cap and len(self.texts) - drop > CHAT_RESIDENT_MIN:
+            self.resident_bytes -= sys.getsizeof(self.texts[drop])
+            drop += 1
+        if drop:
+            del self.roles[:drop]
+            del self.texts[:drop]
+            self.offset += drop
+
+    def clear(self):
+        get_chat_log_store().clear(self.session)
+        self.offset = 0
+        self.roles = array("B")
+        self.texts = []
+        self.resident_bytes = 0
+        self.prompt_tokens = array("I")
+
+    def record_prompt_tokens(self, tokens: int):
+        self.prompt_tokens.append(tokens)
+        if len(self.prompt_tokens) > PROMPT_TOKENS_KEPT:
+            del self.prompt_tokens[:-PROMPT_TOKENS_KEPT]
+
+
+class NGNScores:
+    """Per-stage scores of the current NGN case; the chosen answers go to the on-disk log."""
+
+    __slots__ = ("session", "stages", "scores")
+
+    def __init__(self, session: str):
+        self.session = session
+        self.stages = array("B")
+        self.scores = array("B")
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def add(self, stage: int, score: int, chosen: str):
+        self.stages.append(stage)
+        self.scores.append(score)
+        get_chat_log_store().add_ngn_answer(self.session, stage, score, chosen)
+
+    def perfect(self, max_score: int = 4) -> int:
+        return sum(1 for s in self.scores if s == max_score)
+
+
+def approx_size(obj, _seen: set = None) -> int:
+    """Rough deep size in bytes of a session_state value (containers, strings, slotted objects)."""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, bool, array)) or obj is None:
+        return size
+    if isinstance(obj, dict):
+        return size + sum(approx_size(k, seen) + approx_size(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return size + sum(approx_size(v, seen) for v in obj)
+    if isinstance(obj, (threading.Condition, sqlite3.Connection)) or callable(obj):
+        return size
+    slots = [s for cls in type(obj).__mro__ for s in getattr(cls, "__slots__", ()) if s != "__weakref__"]
+    attrs = [getattr(obj, s) for s in slots if hasattr(obj, s)]
+    if hasattr(obj, "__dict__"):
+        attrs.append(vars(obj))
+    return size + sum(approx_size(a, seen) for a in attrs)
+
+
+def session_memory_report(state) -> list:
+    """[(key, bytes)] for one session's state, largest first."""
+    return sorted(((str(k), approx_size(v)) for k, v in state.items()), key=lambda kv: -kv[1])
+
+
+def get_session_stats() -> dict:
+    # Across every live chat in this process, exported on /metrics
+    logs = list(_live_logs)
+    return {
+        "chat_sessions": len(logs),
+        "chat_messages": sum(len(log) for log in logs),
+        "chat_resident_messages": sum(len(log.texts) for log in logs),
+        "chat_resident_bytes": sum(log.resident_bytes for log in logs),
+    }
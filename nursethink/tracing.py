@@ -0,0 +1,239 @@
+"""Per-request tracing: spans to JSONL plus Prometheus-style metrics."""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .config import CACHE_DIR
+
+TRACE_FILE = os.getenv("NURSETHINK_TRACE_FILE", os.path.join(CACHE_DIR, "traces.jsonl"))
+TRACE_FILE_MAX_BYTES = 50 * 1024 * 1024
+METRICS_PORT = int(os.getenv("NURSETHINK_METRICS_PORT", "0"))  # 0 = no /metrics server
+SPAN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class RequestTrace:
+    """Spans and attributes for one user-visible request (upload, generate, chat turn, NGN case…)."""
+
+    def __init__(self, kind: str, mode: str = None, session_id: str = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.mode = mode
+        self.session_id = session_id
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.spans = {}
+        self.attrs = {}
+        self.finished = False
+
+    @contextmanager
+    def span(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, time.perf_counter() - t)
+
+    def add_span(self, name: str, seconds: float):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, name: str, amount: float):
+        self.attrs[name] = self.attrs.get(name, 0) + amount
+
+    def cache(self, name: str, hit: bool):
+        self.attrs.setdefault("cache", {})[name] = "hit" if hit else "miss"
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "mode": self.mode,
+            "session": self.session_id,
+            "ts": self.started,
+            "total_seconds": round(self.attrs.get("total_seconds", 0.0), 6),
+            "spans": {k: round(v, 6) for k, v in self.spans.items()},
+            **{k: v for k, v in self.attrs.items() if k != "total_seconds"},
+        }
+
+
+class Histogram:
+    def __init__(self, buckets=SPAN_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+
+def _labels(**labels) -> str:
+    parts = [f'{k}="{str(v).replace(chr(34), "")}"' for k, v in labels.items() if v is not None]
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Tracer:
+    """Process-wide sink: appends finished traces to JSONL and aggregates Prometheus metrics."""
+
+    def __init__(self, path: str = TRACE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.requests = Counter()
+        self.cache_results = Counter()
+        self.tokens = Counter()
+        self.spans = {}
+        self.collectors = []
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def record(self, trace: RequestTrace):
+        if trace.finished:
+            return
+        trace.finished = True
+        trace.attrs["total_seconds"] = time.perf_counter() - trace._t0
+        with self._lock:
+            self.requests[(trace.kind, trace.mode or "")] += 1
+            for name, result in trace.attrs.get("cache", {}).items():
+                self.cache_results[(name, result)] += 1
+            for direction in ("input", "output"):
+                self.tokens[direction] += trace.attrs.get(f"{direction}_tokens", 0)
+            for name, seconds in list(trace.spans.items()) + [("total", trace.attrs["total_seconds"])]:
+                self.spans.setdefault((trace.kind, name), Histogram()).observe(seconds)
+            ttft = trace.attrs.get("ttft_seconds")
+            if ttft is not None:
+                self.spans.setdefault((trace.kind, "ttft"), Histogram()).observe(ttft)
+            self._append(trace.to_dict())
+
+    def _append(self, record: dict):
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) > TRACE_FILE_MAX_BYTES:
+                os.replace(self.path, self.path + ".1")
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError:
+            pass
+
+    def add_collector(self, fn):
+        """fn() -> [(metric_name, labels_dict, value)] rendered as extra gauges/counters."""
+        self.collectors.append(fn)
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            lines.append("# TYPE nursethink_requests_total counter")
+            for (kind, mode), n in sorted(self.requests.items()):
+                lines.append(f"nursethink_requests_total{_labels(kind=kind, mode=mode or None)} {n}")
+            lines.append("# TYPE nursethink_cache_requests_total counter")
+            for (name, result), n in sorted(self.cache_results.items()):
+                lines.append(f"nursethink_cache_requests_total{_labels(cache=name, result=result)} {n}")
+            lines.append("# TYPE nursethink_tokens_total counter")
+            for direction, n in sorted(self.tokens.items()):
+                lines.append(f"nursethink_tokens_total{_labels(direction=direction)} {n}")
+            lines.append("# TYPE nursethink_span_seconds histogram")
+            for (kind, name), h in sorted(self.spans.items()):
+                cumulative = 0
+                for bound, count in zip(list(h.buckets) + ["+Inf"], h.counts):
+                    cumulative += count
+                    lines.append(
+                        f"nursethink_span_seconds_bucket{_labels(kind=kind, span=name, le=bound)} {cumulative}"
+                    )
+                lines.append(f"nursethink_span_seconds_sum{_labels(kind=kind, span=name)} {h.sum:.6f}")
+                lines.append(f"nursethink_span_seconds_count{_labels(kind=kind, span=name)} {h.count}")
+        for collect in self.collectors:
+            try:
+                for name, labels, value in collect():
+                    lines.append(f"{name}{_labels(**labels)} {value}")
+            except Exception:
+                continue
+        return "\n".join(lines) + "\n"
+
+
+def _cache_collector():
+    # Imported here: those modules record into the tracer themselves
+    from .bank import get_question_bank
+    from .classify import get_classifier_stats
+    from .coalesce import get_single_flight
+    from .scheduler import get_model_scheduler
+    from .session import get_session_stats
+    from .cleanup import get_cleanup_stats
+    from .extraction import get_extraction_cache
+    from .llm import get_response_cache
+    from .ngn import get_ngn_stats
+    from .notes_store import get_notes_store
+    from .page_index import get_page_index
+    from .upstream import get_circuit_breaker, get_upstream_stats
+    from .warmup import WARMUP_ENABLED, get_cache_warmer
+
+    out = []
+    # Only when enabled: get_cache_warmer() starts the warm-up thread
+    warmup = [("warmup", get_cache_warmer().stats)] if WARMUP_ENABLED else []
+    for name, stats in (
+        ("extraction", get_extraction_cache().stats),
+        ("response", get_response_cache().stats),
+        ("ngn", get_ngn_stats()),
+        ("upstream", get_upstream_stats()),
+        ("notes_cleanup", get_cleanup_stats()),
+        ("classifier", get_classifier_stats()),
+        ("question_bank", get_question_bank().stats),
+        ("coalesce", get_single_flight().stats),
+        ("scheduler", get_model_scheduler().stats),
+        ("session", get_session_stats()),
+        ("notes_store", get_notes_store().stats),
+        ("page_index", get_page_index().stats),
+        *warmup,
+    ):
+        for key, value in stats.items():
+            out.append((f"nursethink_{name}_{key}", {}, value))
+    breaker = get_circuit_breaker()
+    for state in ("closed", "open", "half_open"):
+        out.append(("nursethink_upstream_breaker_state", {"state": state}, int(breaker.state == state)))
+    return out
+
+
+@lru_cache(maxsize=None)
+def get_tracer() -> Tracer:
+    tracer = Tracer()
+    tracer.add_collector(_cache_collector)
+    if METRICS_PORT:
+        start_metrics_server(tracer, METRICS_PORT)
+    return tracer
+
+
+def start_metrics_server(tracer: Tracer, port: int):
+    """Serve tracer.render_prometheus() at http://0.0.0.0:<port>/metrics from a daemon thread."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = tracer.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    except OSError:
+        # Another worker on this host already serves it
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,275 @@
+"""Resilience for model calls: per-mode timeouts, retry with backoff + jitter, and a circuit breaker.
+
+Under a classroom burst the upstream starts answering 429/5xx. Retrying
+right away (or every student waiting out a 30 s timeout) makes that worse,
+so failures back off with jitter. Once enough calls in a row have failed,
+the breaker opens and calls fail fast until one probe gets through.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from functools import lru_cache, partial
+
+from .scheduler import current_priority, get_model_scheduler
+
+MODEL_CONNECT_TIMEOUT = 5.0
+# Keep-alive pool shared by every session in the process
+MODEL_POOL_CONNECTIONS = int(os.getenv("NURSETHINK_MODEL_POOL", "50"))
+MODEL_DEFAULT_TIMEOUT = float(os.getenv("NURSETHINK_MODEL_TIMEOUT", "30"))
+# Per-mode timeout in seconds (long generations get more room, background summaries less);
+# NURSETHINK_MODEL_TIMEOUT_<MODE> overrides one mode
+MODEL_TIMEOUTS = {
+    "ngn_case": 90.0,
+    "study_chat": 45.0,
+    "quiz": 60.0,
+    "chat_summary": 20.0,
+}
+MODEL_MAX_RETRIES = int(os.getenv("NURSETHINK_MODEL_RETRIES", "3"))
+RETRY_BASE_SECONDS = 0.5
+RETRY_MAX_SECONDS = 8.0
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("NURSETHINK_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("NURSETHINK_BREAKER_RESET_SECONDS", "30"))
+
+
+class UpstreamUnavailable(RuntimeError):
+    """The circuit breaker is open: the model service is treated as down for now."""
+
+
+def _httpx():
+    # Loaded on the first model call, not at import: the SDK and its HTTP stack are slow to import
+    try:
+        import httpx
+    except ImportError:  # some SDK builds vendor their HTTP stack; fall back to plain float timeouts
+        return None
+    return httpx
+
+
+def model_timeout_seconds(mode: str = None) -> float:
+    key = (mode or "").lower().strip()
+    return float(os.getenv(f"NURSETHINK_MODEL_TIMEOUT_{key.upper()}", MODEL_TIMEOUTS.get(key, MODEL_DEFAULT_TIMEOUT)))
+
+
+def model_timeout(mode: str = None):
+    seconds = model_timeout_seconds(mode)
+    httpx = _httpx()
+    return httpx.Timeout(seconds, connect=MODEL_CONNECT_TIMEOUT) if httpx else seconds
+
+
+def pooled_http_client():
+    """httpx client for the SDK with a bounded keep-alive pool, or None to use the SDK default."""
+    httpx = _httpx()
+    if httpx is None:
+        return None
+    import openai
+
+    limits = httpx.Limits(
+        max_connections=MODEL_POOL_CONNECTIONS,
+        max_keepalive_connections=MODEL_POOL_CONNECTIONS,
+        keepalive_expiry=60,
+    )
+    return openai.DefaultHttpxClient(limits=limits, timeout=model_timeout())
+
+
+def failure_kind(exc: Exception):
+    """Short label for a retryable upstream failure, or None if retrying won't help (bad request, auth…)."""
+    import openai
+
+    if isinstance(exc, openai.APITimeoutError):
+        return "timeout"
+    if isinstance(exc, openai.APIConnectionError):
+        return "connection"
+    if isinstance(exc, openai.RateLimitError):
+        return "rate_limited"
+    status = getattr(exc, "status_code", None)
+    if isinstance(exc, openai.APIStatusError) and status is not None and status >= 500:
+        return "server_error"
+    return None
+
+
+def retry_after_seconds(exc: Exception):
+    response = getattr(exc, "response", None)
+    value = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    try:
+        return min(float(value), RETRY_MAX_SECONDS) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: float = None) -> float:
+    """Full-jitter exponential backoff; never sooner than the server's Retry-After."""
+    delay = random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+
+class CircuitBreaker:
+    """closed -> open after N consecutive upstream failures -> half_open after a cool-down -> one probe."""
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open" and not self._probing:
+                # Exactly one caller gets to test the water
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self) -> bool:
+        """Count an upstream failure; True if this one opened the breaker."""
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+
+@lru_cache(maxsize=None)
+def get_circuit_breaker() -> CircuitBreaker:
+    return CircuitBreaker()
+
+
+@lru_cache(maxsize=None)
+def get_upstream_stats() -> dict:
+    # Process-wide counters, exported with the other stats on /metrics
+    return {
+        "calls": 0,
+        "retries": 0,
+        "timeout": 0,
+        "connection": 0,
+        "rate_limited": 0,
+        "server_error": 0,
+        "breaker_opened": 0,
+        "breaker_rejected": 0,
+        "fallbacks": 0,
+    }
+
+
+def _admission(trace, user: str, tokens: int, on_wait):
+    """Arguments for ModelScheduler.acquire(); the user defaults to the trace's session."""
+    user = user or (trace.session_id if trace else None)
+    return dict(user=user, tokens=tokens, priority=current_priority(), on_wait=on_wait)
+
+
+def _record_wait(trace, timings: dict, waited: float):
+    if trace:
+        trace.add_span("queue_wait", waited)
+    if timings is not None:
+        timings["queue_wait"] = timings.get("queue_wait", 0.0) + waited
+
+
+def _before_attempt(breaker: CircuitBreaker, stats: dict):
+    if not breaker.allow():
+        stats["breaker_rejected"] += 1
+        raise UpstreamUnavailable("Model service is degraded; failing fast")
+    stats["calls"] += 1
+
+
+def record_upstream_failure(exc: Exception):
+    """Count a failure against the breaker if it was the upstream's fault. Returns its kind (or None)."""
+    kind = failure_kind(exc)
+    if kind is None:
+        return None
+    get_upstream_stats()[kind] += 1
+    if get_circuit_breaker().record_failure():
+        get_upstream_stats()["breaker_opened"] += 1
+    return kind
+
+
+def _refund(tokens: int):
+    # A failed attempt hands its reservation back; a retry reserves again on admission
+    if tokens:
+        get_model_scheduler().settle(tokens, 0)
+
+
+def _after_failure(exc: Exception, attempt: int, retries: int, breaker: CircuitBreaker, stats: dict, trace=None):
+    """Record a failed attempt; return the delay before the next one, or None to give up."""
+    if record_upstream_failure(exc) is None:
+        # The service answered (bad request, auth…), so it isn't degraded
+        breaker.record_success()
+        return None
+    if attempt >= retries or breaker.state == "open":
+        return None
+    stats["retries"] += 1
+    if trace:
+        trace.add("retries", 1)
+    return backoff_delay(attempt, retry_after_seconds(exc))
+
+
+def call_with_retries(fn, retries: int = MODEL_MAX_RETRIES, trace=None, user: str = None, tokens: int = 0, on_wait=None,
+                      timings: dict = None):
+    """Run fn() (one upstream request) under the shared breaker, retrying 429/5xx/timeouts with backoff.
+
+    Each attempt is admitted by the process-wide scheduler first (tokens = its estimated size,
+    on_wait = queue-position callback, see ModelScheduler.acquire); the time spent in line is
+    added to timings["queue_wait"] if a dict is passed. A failed attempt's tokens are given
+    back; after a success the caller settles them with the real usage.
+    """
+    breaker = get_circuit_breaker()
+    stats = get_upstream_stats()
+    admission = _admission(trace, user, tokens, on_wait)
+    attempt = 0
+    while True:
+        _before_attempt(breaker, stats)
+        _record_wait(trace, timings, get_model_scheduler().acquire(**admission))
+        try:
+            result = fn()
+        except BaseException as e:
+            _refund(tokens)
+            delay = _after_failure(e, attempt, retries, breaker, stats, trace) if isinstance(e, Exception) else None
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+            continue
+        breaker.record_success()
+        return result
+
+
+async def acall_with_retries(fn, retries: int = MODEL_MAX_RETRIES, trace=None, user: str = None, tokens: int = 0,
+                             timings: dict = None):
+    """call_with_retries for coroutines: await fn() and sleep without blocking the loop."""
+    breaker = get_circuit_breaker()
+    stats = get_upstream_stats()
+    admission = _admission(trace, user, tokens, None)
+    attempt = 0
+    while True:
+        _before_attempt(breaker, stats)
+        # Waiting in line blocks, so it happens on an executor thread
+        waited = await asyncio.get_running_loop().run_in_executor(None, partial(get_model_scheduler().acquire, **admission))
+        _record_wait(trace, timings, waited)
+        try:
+            result = await fn()
+        except BaseException as e:
+            # Cancelled too (a BaseException): the reservation still goes back
+            _refund(tokens)
+            delay = _after_failure(e, attempt, retries, breaker, stats, trace) if isinstance(e, Exception) else None
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        breaker.record_success()
+        return result
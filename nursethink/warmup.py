@@ -0,0 +1,115 @@
+"""Response-cache warm-up for the quick templates.
+
+The TEMPLATES are the most-clicked prompts, and with no notes their prompt
+only depends on the mode and the strict / label-sources toggles. A background
+thread precomputes every combination into the shared response cache at start
+and again on a schedule, so a template click with those toggles is a cache hit.
+"""
+import os
+import threading
+import time
+from functools import lru_cache
+
+from .llm import get_ai_response, get_client, get_response_cache, response_cache_key, response_ttl
+from .notes import NOTES_TOKEN_BUDGET
+from .prompts import TEMPLATES, build_prompt_sections, join_sections
+from .scheduler import background_calls
+
+WARMUP_ENABLED = os.getenv("NURSETHINK_WARM_CACHE", "") == "1"
+WARMUP_INTERVAL_SECONDS = float(os.getenv("NURSETHINK_WARM_CACHE_HOURS", "12")) * 3600
+# Let the app (and its first real requests) start before warm-up calls compete for the API
+WARMUP_START_DELAY_SECONDS = float(os.getenv("NURSETHINK_WARM_CACHE_DELAY", "10"))
+# Pause between warm-up calls; the model scheduler also queues them behind students' calls
+WARMUP_PAUSE_SECONDS = 2.0
+# Modes whose answers are cached and whose prompts a template fills in (quiz and ngn_case are never cached)
+WARMUP_MODES = ("priority", "delegation", "therapeutic", "mixed_drill", "explain", "mnemonics")
+# The app's defaults for the controls that don't vary here
+WARMUP_DIFFICULTY = "medium"
+
+
+def warmup_prompts() -> list:
+    """[(mode, template_name, prompt)] for every template x mode x (strict, label sources), empty notes.
+
+    mixed_drill stems route to the specialised prompt, which is often the same prompt as that mode's;
+    each distinct prompt is listed once.
+    """
+    seen = set()
+    out = []
+    for name, request in TEMPLATES.items():
+        for mode in WARMUP_MODES:
+            for strict_mode in (True, False):
+                for label_sources in (True, False):
+                    prompt = join_sections(build_prompt_sections(
+                        mode, request, "", WARMUP_DIFFICULTY, False, label_sources, strict_mode, NOTES_TOKEN_BUDGET
+                    ))
+                    key = response_cache_key(prompt)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    out.append((mode, name, prompt))
+    return out
+
+
+def _lower_thread_priority():
+    # Linux applies setpriority to a single thread by its native id; elsewhere this is a no-op
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+
+
+class CacheWarmer:
+    """Daemon thread that keeps warmup_prompts() answered in the response cache."""
+
+    def __init__(self, interval: float = WARMUP_INTERVAL_SECONDS, start_delay: float = WARMUP_START_DELAY_SECONDS,
+                 pause: float = WARMUP_PAUSE_SECONDS):
+        self.interval = interval
+        self.start_delay = start_delay
+        self.pause = pause
+        self.stats = {"runs": 0, "prompts": 0, "warmed": 0, "fresh": 0, "failed": 0, "seconds": 0.0, "last_run": 0.0}
+        self._wake = threading.Event()
+        self._worker = threading.Thread(target=self._run, name="cache-warmup", daemon=True)
+        self._worker.start()
+
+    def run_now(self):
+        self._wake.set()
+
+    def _run(self):
+        _lower_thread_priority()
+        self._wake.wait(self.start_delay)
+        while True:
+            self._wake.clear()
+            with background_calls():
+                self.warm()
+            self._wake.wait(self.interval)
+
+    def warm(self):
+        """One pass: answer every prompt whose cached answer is missing or would expire before the next pass."""
+        if not get_client():
+            return
+        cache = get_response_cache()
+        t0 = time.perf_counter()
+        prompts = warmup_prompts()
+        self.stats["prompts"] = len(prompts)
+        for mode, _, prompt in prompts:
+            key = response_cache_key(prompt)
+            left = cache.expires_in(key)
+            if left is not None and left > self.interval:
+                self.stats["fresh"] += 1
+                continue
+            get_ai_response(prompt, mode=mode, refresh=True)
+            # Errors and fallback answers aren't cached; the entry is new only if the call worked
+            left = cache.expires_in(key)
+            if left is not None and left > response_ttl(mode) - 60:
+                self.stats["warmed"] += 1
+            else:
+                self.stats["failed"] += 1
+            time.sleep(self.pause)
+        self.stats["runs"] += 1
+        self.stats["seconds"] += time.perf_counter() - t0
+        self.stats["last_run"] = time.time()
+
+
+@lru_cache(maxsize=None)
+def get_cache_warmer() -> CacheWarmer:
+    return CacheWarmer()
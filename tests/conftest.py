@@ -0,0 +1,76 @@
+import os
+import sys
+import tempfile
+
+# The SQLite stores and caches live under CACHE_DIR, read at import: keep them out of the checkout
+os.environ.setdefault("NURSETHINK_CACHE_DIR", tempfile.mkdtemp(prefix="nursethink-tests-"))
+# No model calls from tests
+os.environ.pop("OPENAI_API_KEY", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+import pytest  # noqa: E402
+
+
+def _stage(n: int) -> dict:
+    return {
+        "stage": n,
+        "cues": [f"cue {n}"],
+        "question": f"What now at stage {n}?",
+        "options": {
+            "key_cues": ["SpO2 88%", "RR 28", "pain 3/10"],
+            "hypotheses": ["atelectasis", "anxiety"],
+            "actions": ["raise head of bed", "give analgesic"],
+            "outcomes": ["SpO2 above 92%", "pain 0/10"],
+        },
+        "best": {
+            "key_cues": ["SpO2 88%", "RR 28"],
+            "hypothesis": "atelectasis",
+            "action": "raise head of bed",
+            "outcome": "SpO2 above 92%",
+        },
+        "rationale": "Oxygenation first.",
+        "next_update": "" if n == 3 else f"Update after stage {n}.",
+    }
+
+
+@pytest.fixture
+def ngn_case_dict():
+    """A valid three-stage NGN case as the model returns it."""
+    return {
+        "title": "Post-op day 1",
+        "patient": {"age": 67, "sex": "F", "setting": "med-surg", "history": ["COPD"]},
+        "stages": [_stage(n) for n in (1, 2, 3)],
+    }
+
+
+def _make_pdf(texts: list) -> bytes:
+    """A minimal PDF with one line of text per page; a bytes item is used as the page's content stream."""
+    n = len(texts)
+    objs = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(n))
+    objs.append(f"<< /Type /Pages /Kids [{kids}] /Count {n} >>".encode())
+    font = 3 + 2 * n
+    for i, text in enumerate(texts):
+        objs.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font} 0 R >> >> >>".encode()
+        )
+        stream = text if isinstance(text, bytes) else f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+        objs.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objs.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objs):
+        offsets.append(len(out))
+        out += f"{i + 1} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{o:010d} 00000 n \n".encode() for o in offsets)
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF".encode()
+    return out
+
+
+@pytest.fixture
+def make_pdf():
+    return _make_pdf
@@ -0,0 +1,48 @@
+import pytest
+
+from nursethink.bank import QuestionBank, bank_variant, parse_question_type
+from nursethink.ngn import ngn_case_from_dict
+
+QUESTION = "Question Type: **Priority**\n\nA client with chest pain... Which action first?"
+
+
+@pytest.fixture
+def bank(tmp_path):
+    return QuestionBank(str(tmp_path / "bank.sqlite3"))
+
+
+def test_variant_tracks_notes_and_toggles_but_not_whitespace():
+    base = bank_variant("Digoxin: check apical pulse.")
+    assert bank_variant("Digoxin:   check apical pulse.\n") == base
+    assert bank_variant("Warfarin: check INR.") != base
+    assert bank_variant("Digoxin: check apical pulse.", notes_only=True) != base
+
+
+def test_question_type_is_read_from_the_answer():
+    assert parse_question_type(QUESTION) == "priority"
+    assert parse_question_type("QUESTION TYPE:  Therapeutic  Communication\n...") == "therapeutic communication"
+    assert parse_question_type("No header here") == "any"
+
+
+def test_each_student_gets_each_item_once(bank):
+    first = bank.add("quiz", "Heart Failure", QUESTION, "medium", seen_by="ana")
+    second = bank.add("quiz", "heart failure", QUESTION.replace("chest pain", "dyspnea"), "medium")
+    # The same text again is a duplicate, not a new item
+    assert bank.add("quiz", "heart failure", QUESTION, "medium") == first
+    assert bank.stats["stored"] == 2 and bank.stats["duplicates"] == 1
+
+    assert [row[0] for row in bank.take("ana", "quiz", "heart failure", "medium", limit=5)] == [second]
+    assert bank.take("ana", "quiz", "heart failure", "medium") == []
+    assert [row[0] for row in bank.take("ben", "quiz", "heart failure", "medium", limit=5)] == [first, second]
+    assert bank.take("ben", "quiz", "heart failure", "hard") == []
+    assert bank.take("cy", "quiz", "heart failure", "medium", qtype="delegation") == []
+    assert bank.stats["hits"] == 3 and 0 < bank.hit_rate() < 1
+
+
+def test_ngn_cases_round_trip(bank, ngn_case_dict):
+    case = ngn_case_from_dict(ngn_case_dict)
+    bank.add_ngn_case("Post-op", case, seen_by="ana")
+    assert bank.take_ngn_case("ana", "post-op") is None
+    served = bank.take_ngn_case("ben", "post-op")
+    assert served.to_dict() == case.to_dict()
+    assert bank.count("ngn_case") == 1 and bank.count("quiz") == 0
@@ -0,0 +1,51 @@
+from nursethink.chat import (
+    CHAT_SUMMARY_TOKEN_BUDGET,
+    extract_chat_summary,
+    new_chat_memory,
+    recent_window_start,
+    update_chat_memory,
+)
+from nursethink.notes import estimate_tokens
+
+
+def _messages(n: int, words: int = 40) -> list:
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"Turn {i}. " + "detail " * words}
+        for i in range(n)
+    ]
+
+
+def test_recent_window_fits_the_budget_but_keeps_the_last_message():
+    messages = _messages(10)
+    start = recent_window_start(messages, 200)
+    assert 0 < start < 10
+    assert sum(estimate_tokens(m["content"]) + 2 for m in messages[start:]) <= 200
+    assert recent_window_start(_messages(3, words=1000), 10) == 2
+
+
+def test_memory_slides_only_past_the_budget_and_summarizes_the_dropped_turns():
+    memory = new_chat_memory()
+    folded = []
+
+    def summarize(previous, turns):
+        folded.append(len(turns))
+        return previous + f"[{len(turns)} turns]"
+
+    messages = _messages(2)
+    assert not update_chat_memory(memory, messages, summarize, token_budget=400)
+    messages = _messages(12)
+    assert update_chat_memory(memory, messages, summarize, token_budget=400)
+    assert memory["summarized_upto"] == folded[0] and memory["summaries"] == 1
+    assert sum(estimate_tokens(m["content"]) + 2 for m in messages[memory["summarized_upto"]:]) <= 200
+
+
+def test_a_cleared_chat_resets_the_memory():
+    memory = {"summary": "old", "summarized_upto": 9, "summaries": 2}
+    update_chat_memory(memory, _messages(2), lambda p, t: p, token_budget=400)
+    assert memory == new_chat_memory()
+
+
+def test_local_summary_keeps_first_sentences_within_budget():
+    summary = extract_chat_summary("", _messages(200))
+    assert summary.startswith("- ") and "Turn 199." in summary
+    assert estimate_tokens(summary) <= CHAT_SUMMARY_TOKEN_BUDGET + 50
@@ -0,0 +1,46 @@
+import pytest
+
+from nursethink.classify import TRAINING_STEMS, classify_question, get_classifier_stats, get_question_classifier
+from nursethink.prompts import COMPILED_MODE_PREFIXES, build_prompt_sections
+
+
+@pytest.mark.parametrize(
+    "stem, mode",
+    [
+        ("A client 2 hours post-op has an SpO2 of 86%. Which action should the nurse take first?", "priority"),
+        ("Which of these tasks may the RN delegate to the UAP?", "delegation"),
+        ('The client says, "I am afraid I will never walk again." What is the best response?', "therapeutic"),
+    ],
+)
+def test_clear_stems_are_routed(stem, mode):
+    route = classify_question(stem)
+    assert route["mode"] == route["label"] == mode
+    assert route["confidence"] >= 0.7
+
+
+def test_vague_stems_keep_the_mixed_prompt():
+    route = classify_question("heart failure meds")
+    assert route["mode"] is None and route["label"] in ("priority", "delegation", "therapeutic")
+    before = get_classifier_stats()["fallbacks"]
+    classify_question("heart failure meds", min_confidence=1.01)
+    assert get_classifier_stats()["fallbacks"] == before + 1
+
+
+def test_fits_its_own_training_stems():
+    classifier = get_question_classifier()
+    right = sum(classifier.predict(text)[0] == label for text, label in TRAINING_STEMS)
+    assert right == len(TRAINING_STEMS)
+
+
+def test_mixed_drill_prompt_is_built_as_the_routed_mode():
+    routing = {}
+    sections = dict(build_prompt_sections(
+        "mixed_drill", "Which task can the nurse assign to the LPN?", "", "medium", False, False, False,
+        routing=routing,
+    ))
+    assert routing["mode"] == "delegation"
+    assert sections["static_prefix"] == COMPILED_MODE_PREFIXES["delegation"]
+    routing = {}
+    sections = dict(build_prompt_sections("mixed_drill", "diabetes", "", "medium", False, False, False, routing=routing))
+    assert routing["mode"] is None
+    assert sections["static_prefix"] == COMPILED_MODE_PREFIXES["mixed_drill"]
@@ -0,0 +1,49 @@
+from nursethink.cleanup import PAGE_BREAK, clean_notes_with_stats
+
+
+def book(pages):
+    return f"\n{PAGE_BREAK}\n".join(pages)
+
+
+def page(n, body):
+    return f"NURS 210 · Med-Surg II\n{body}\nPage {n} of 40"
+
+
+def test_running_header_and_footer_are_removed_at_page_edges():
+    text = book(page(n, f"Topic {n}: assess the client first.") for n in range(1, 5))
+    cleaned, stats = clean_notes_with_stats(text)
+    assert "NURS 210" not in cleaned and "Page" not in cleaned
+    assert all(f"Topic {n}:" in cleaned for n in range(1, 5))
+    assert stats["boilerplate_lines"] == 8
+
+
+def test_repeated_reference_ranges_are_content():
+    body = "Potassium\nNormal 3.5-5.0 mEq/L\nHold digoxin if low."
+    text = book(page(n, f"Section {n}\n{body}") for n in range(1, 5))
+    cleaned, _ = clean_notes_with_stats(text)
+    assert cleaned.count("Normal 3.5-5.0 mEq/L") == 4
+
+
+def test_bare_numbers_in_the_body_are_kept():
+    vitals = "Vital signs\nBP\n90/60\nHR\n120\nReassess in 15 minutes."
+    text = book(page(n, vitals) for n in range(1, 4))
+    cleaned, _ = clean_notes_with_stats(text)
+    assert cleaned.count("90/60") == 3 and cleaned.count("120") == 3
+
+
+def test_pasted_notes_without_page_breaks_are_not_stripped():
+    text = "\n\n".join("Heart failure\nDaily weights\n12" for _ in range(4))
+    cleaned, stats = clean_notes_with_stats(text)
+    assert stats["boilerplate_lines"] == 0 and cleaned.count("12") == 4
+
+
+def test_hyphenation_and_duplicate_paragraphs():
+    slide = (
+        "Early signs of hypoxia include restlessness, tachycardia and anxiety; cyanosis appears late. "
+        "Check the airway, raise the head of the bed, apply oxygen as ordered and stay with the client. "
+        "Recheck the pulse oximetry reading after every intervention and report the trend."
+    )
+    text = f"Watch for hypo-\nglycemia at night.\n\n{slide}\n\n{slide.replace('report', 'document')}"
+    cleaned, stats = clean_notes_with_stats(text)
+    assert "hypoglycemia" in cleaned
+    assert stats["hyphen_joins"] == 1 and stats["duplicate_paragraphs"] == 1
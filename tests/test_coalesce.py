@@ -0,0 +1,65 @@
+import threading
+
+from nursethink import coalesce
+from nursethink.coalesce import SingleFlight
+
+
+def test_first_caller_leads_and_the_rest_follow():
+    flight = SingleFlight()
+    leader_call, leader = flight.join("k")
+    follower_call, follower = flight.join("k")
+    other_call, other = flight.join("other")
+    assert leader and not follower and other
+    assert follower_call is leader_call and other_call is not leader_call
+    assert flight.stats["upstream"] == 2 and flight.stats["coalesced"] == 1
+
+
+def test_followers_replay_the_whole_stream_even_when_late():
+    flight = SingleFlight()
+    call, _ = flight.join("k")
+    call.publish("Stage 1")
+    received = []
+    started = threading.Event()
+
+    def follow():
+        started.set()
+        received.append("".join(call.follow()))
+
+    thread = threading.Thread(target=follow)
+    thread.start()
+    started.wait()
+    call.publish(" / Stage 2")
+    flight.done("k", call)
+    thread.join(5)
+    assert received == ["Stage 1 / Stage 2"]
+    # A late joiner still replays everything
+    assert "".join(call.follow()) == "Stage 1 / Stage 2"
+
+
+def test_done_frees_the_key_and_passes_on_the_error():
+    flight = SingleFlight()
+    call, _ = flight.join("k")
+    flight.done("k", call, error="timeout")
+    assert call.done and call.error == "timeout"
+    assert list(call.follow()) == []
+    fresh, leader = flight.join("k")
+    assert leader and fresh is not call
+    # A stale leader finishing doesn't drop the new call
+    flight.done("k", call)
+    assert flight.join("k") == (fresh, False)
+
+
+def test_process_lock_is_off_unless_enabled(tmp_path, monkeypatch):
+    assert SingleFlight(str(tmp_path)).process_lock("k", 1.0) == (None, False)
+    if coalesce.fcntl is None:
+        return
+    monkeypatch.setattr(coalesce, "COALESCE_ACROSS_PROCESSES", True)
+    first, second = SingleFlight(str(tmp_path)), SingleFlight(str(tmp_path))
+    lock, waited = first.process_lock("k", 1.0)
+    assert lock is not None and not waited
+    # Another process holding it: the second one waits, then gives up at its timeout
+    assert second.process_lock("k", 0.1) == (None, True)
+    first.release(lock)
+    lock, waited = second.process_lock("k", 1.0)
+    assert lock is not None and not waited
+    second.release(lock)
@@ -0,0 +1,31 @@
+from nursethink.extraction import ExtractionCache, extract_bytes, upload_key
+
+
+def test_upload_key_tracks_content_and_page_limit():
+    assert upload_key("a.txt", b"x") == upload_key("B.TXT", b"x")
+    assert upload_key("a.txt", b"x") != upload_key("a.txt", b"y")
+    assert upload_key("a.pdf", b"x", 10) != upload_key("a.pdf", b"x")
+    assert upload_key("a.txt", b"x", 10) == upload_key("a.txt", b"x")
+
+
+def test_cache_hits_memory_then_disk(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    cache.put("k1", "notes", {"seconds": 2.0})
+    assert cache.get("k1")[2] == "memory"
+    fresh = ExtractionCache(str(tmp_path))
+    text, meta, source = fresh.get("k1")
+    assert (text, meta["seconds"], source) == ("notes", 2.0, "disk")
+    assert fresh.get("missing") is None
+
+
+def test_partial_extractions_are_not_persisted(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    cache.put("k2", "half", {}, persist=False)
+    assert ExtractionCache(str(tmp_path)).get("k2") is None
+
+
+def test_extract_bytes_reads_txt_and_caches_it():
+    text, info = extract_bytes("notes.txt", "Digoxin: check apical pulse".encode())
+    assert text == "Digoxin: check apical pulse"
+    assert info["source"] == "extracted"
+    assert extract_bytes("notes.txt", "Digoxin: check apical pulse".encode())[1]["source"] == "memory"
@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+
+ENGINE_MODULES = [
+    "chat", "engine", "extraction", "llm", "ngn", "notes", "prompts", "quiz", "tracing", "upstream",
+    "library", "bank", "page_index", "session", "notes_store", "server",
+]
+
+
+def test_engine_imports_leave_the_sdk_and_pdf_reader_unloaded():
+    # A fresh interpreter: this test process has imported them already
+    code = (
+        "import sys\n"
+        + "".join(f"import nursethink.{name}\n" for name in ENGINE_MODULES)
+        + "print(sorted(m for m in ('openai', 'PyPDF2', 'httpx') if m in sys.modules))"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    assert out.stdout.strip() == "[]"
@@ -0,0 +1,75 @@
+import pytest
+
+from nursethink.library import NotesLibrary, new_student_token, student_from_token
+
+HF = "Heart failure: daily weights, fluid restriction and furosemide.\n\nWatch potassium with loop diuretics."
+COPD = "COPD: pursed-lip breathing and low-flow oxygen.\n\nTripod positioning eases dyspnea."
+
+
+@pytest.fixture
+def library(tmp_path):
+    return NotesLibrary(str(tmp_path / "library.sqlite3"))
+
+
+def test_same_file_is_stored_and_indexed_once(library):
+    doc_a, indexed_a = library.add_document("ana", "hf.pdf", "sha-hf", HF, pages=2)
+    assert indexed_a and library.has_text("sha-hf")
+    # A second student uploading the same file doesn't need the text again
+    doc_b, indexed_b = library.add_document("ben", "heart.pdf", "sha-hf")
+    assert not indexed_b and doc_b != doc_a
+    assert library.add_document("ana", "hf.pdf", "sha-hf") == (doc_a, False)
+    with pytest.raises(ValueError):
+        library.add_document("ana", "new.pdf", "sha-new")
+
+
+def test_search_is_scoped_to_the_user_and_documents(library):
+    hf, _ = library.add_document("ana", "hf.pdf", "sha-hf", HF)
+    copd, _ = library.add_document("ana", "copd.pdf", "sha-copd", COPD)
+    library.add_document("ben", "other.pdf", "sha-other", "Potassium replacement protocol.")
+    hits = library.search("ana", "potassium")
+    assert [h["doc_id"] for h in hits] == [hf]
+    assert library.search("ana", "potassium", doc_ids=[copd]) == []
+    assert library.search("ana", "   ") == []
+    # Query punctuation can't break the full-text MATCH syntax
+    assert [h["doc_id"] for h in library.search("ana", '"tripod" OR (')] == [copd]
+
+
+def test_documents_text_keeps_the_requested_order(library):
+    hf, _ = library.add_document("ana", "hf.pdf", "sha-hf", HF)
+    copd, _ = library.add_document("ana", "copd.pdf", "sha-copd", COPD)
+    assert library.documents_text("ana", [hf]) == HF
+    combined = library.documents_text("ana", [copd, hf])
+    assert combined.index("# copd.pdf") < combined.index("# hf.pdf")
+    assert library.documents_text("ben", [hf]) == ""
+
+
+def test_shared_text_is_dropped_with_its_last_reference(library):
+    a, _ = library.add_document("ana", "hf.pdf", "sha-hf", HF)
+    b, _ = library.add_document("ben", "hf.pdf", "sha-hf")
+    assert not library.remove_document("ben", a)
+    assert library.remove_document("ana", a)
+    assert library.has_text("sha-hf") and library.search("ben", "furosemide")
+    assert library.remove_document("ben", b)
+    assert not library.has_text("sha-hf")
+    assert library.list_documents("ben") == []
+
+
+def test_lazily_read_pages_get_their_own_passage_numbers(library):
+    doc, _ = library.add_document("ana", "textbook.pdf", "sha-book", HF, pages=40)
+    long_page = " ".join(["Sepsis bundle: lactate, cultures, antibiotics within one hour."] * 80)
+    library.add_passages("sha-book", [(11, long_page), (12, "Sepsis and septic shock definitions.")])
+    hits = library.search("ana", "sepsis", limit=50)
+    chunks = [h["chunk"] for h in hits]
+    assert len(chunks) > 2 and len(set(chunks)) == len(chunks)
+    assert min(chunks) > max(h["chunk"] for h in library.search("ana", "potassium"))
+    assert {h["page"] for h in hits} == {11, 12}
+    assert library.search("ana", "potassium")[0]["page"] is None
+
+
+def test_only_issued_student_tokens_open_a_library():
+    token = new_student_token()
+    student_id = student_from_token(token)
+    assert student_id and token.startswith(student_id + ".")
+    assert student_from_token(new_student_token()) != student_id
+    for forged in (student_id, f"{student_id}.{'0' * 32}", f"x{token}", "", None):
+        assert student_from_token(forged) is None
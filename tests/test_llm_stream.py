@@ -0,0 +1,104 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from nursethink import llm, upstream
+from nursethink.llm import stream_ai_response
+from nursethink.scheduler import ModelScheduler
+
+
+def delta(text):
+    return SimpleNamespace(type="response.output_text.delta", delta=text)
+
+
+COMPLETED = SimpleNamespace(
+    type="response.completed", response=SimpleNamespace(usage=SimpleNamespace(input_tokens=40, output_tokens=6)),
+)
+
+
+class FakeClient:
+    def __init__(self, events):
+        self.calls = 0
+        self.responses = SimpleNamespace(create=self.create)
+        self.events = events
+
+    def create(self, model, input, timeout, stream=False):
+        self.calls += 1
+        return self.events()
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    scheduler = ModelScheduler(rpm=0, tpm=60000)
+    monkeypatch.setattr(llm, "get_model_scheduler", lambda: scheduler)
+    monkeypatch.setattr(upstream, "get_model_scheduler", lambda: scheduler)
+    return scheduler
+
+
+def prompt():
+    return f"Explain the priority for {uuid.uuid4().hex}"
+
+
+def test_text_streams_and_is_cached(monkeypatch, scheduler):
+    client = FakeClient(lambda: iter([delta("Airway "), delta("first."), COMPLETED]))
+    monkeypatch.setattr(llm, "get_client", lambda: client)
+    text = prompt()
+    timings = {}
+    assert list(stream_ai_response(text, mode="explain", timings=timings)) == ["Airway ", "first."]
+    assert timings["error"] is None and not timings["cached"] and timings["chars"] == len("Airway first.")
+    assert scheduler.stats["tokens_used"] == 46
+
+    again = {}
+    assert list(stream_ai_response(text, mode="explain", timings=again)) == ["Airway first."]
+    assert again["cached"] and client.calls == 1
+
+
+def test_uncached_modes_call_every_time(monkeypatch, scheduler):
+    client = FakeClient(lambda: iter([delta("Case"), COMPLETED]))
+    monkeypatch.setattr(llm, "get_client", lambda: client)
+    text = prompt()
+    for _ in range(2):
+        assert "".join(stream_ai_response(text, mode="ngn_case")) == "Case"
+    assert client.calls == 2
+
+
+def test_a_broken_stream_ends_with_an_error_and_is_not_cached(monkeypatch, scheduler):
+    def broken():
+        yield delta("Airway ")
+        raise ValueError("connection reset")
+
+    client = FakeClient(broken)
+    monkeypatch.setattr(llm, "get_client", lambda: client)
+    text = prompt()
+    timings = {}
+    parts = list(stream_ai_response(text, mode="explain", timings=timings))
+    assert parts[0] == "Airway " and parts[-1].startswith("\n\nAI error: ValueError")
+    assert timings["error"] == "ValueError"
+    # Charged for what it used, not the whole reservation
+    assert scheduler.stats["tokens_used"] == llm.estimate_tokens(text) + llm.estimate_tokens("Airway ")
+    list(stream_ai_response(text, mode="explain"))
+    assert client.calls == 2
+
+
+def test_no_key_is_reported_not_raised(monkeypatch):
+    monkeypatch.setattr(llm, "get_client", lambda: None)
+    timings = {}
+    text = "".join(stream_ai_response(prompt(), mode="explain", timings=timings))
+    assert llm.is_error_text(text) and timings["error"] == "NoAPIKey"
+
+
+def test_an_unreadable_answer_still_settles_its_reservation(monkeypatch, scheduler):
+    class Unreadable:
+        usage = SimpleNamespace(input_tokens=40, output_tokens=6)
+
+        @property
+        def output_text(self):
+            raise ValueError("malformed response")
+
+    client = SimpleNamespace(responses=SimpleNamespace(create=lambda **kwargs: Unreadable()))
+    monkeypatch.setattr(llm, "get_client", lambda: client)
+    answer = llm.get_ai_response(prompt(), mode="explain")
+    assert llm.is_error_text(answer)
+    assert scheduler.stats["tokens_used"] == 46
+    assert scheduler.tokens.level == pytest.approx(scheduler.tokens.capacity - 46, abs=1)
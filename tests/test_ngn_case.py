@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from nursethink import ngn
+from nursethink.ngn import NGNCaseError, finalize_ngn_case, ngn_case_from_dict, score_ngn_stage
+
+
+@pytest.fixture
+def model(monkeypatch):
+    """Replies handed out by a fake get_ai_response, and the prompts it was called with."""
+    calls = []
+    replies = []
+
+    def fake(prompt, mode=None, **kw):
+        calls.append(prompt)
+        return replies.pop(0) if replies else "AI error: RuntimeError: no reply"
+
+    monkeypatch.setattr(ngn, "get_ai_response", fake)
+    return calls, replies
+
+
+def test_valid_case_needs_no_repair(model, ngn_case_dict):
+    case = finalize_ngn_case("topic", json.dumps(ngn_case_dict))
+    assert [s.stage for s in case.stages] == [1, 2, 3]
+    assert model[0] == []
+
+
+def test_best_answer_must_be_one_of_the_options(ngn_case_dict):
+    ngn_case_dict["stages"][1]["best"]["action"] = "call rapid response"
+    with pytest.raises(NGNCaseError) as err:
+        ngn_case_from_dict(ngn_case_dict)
+    assert err.value.problems == ["stages[1].best.action: not one of options.actions"]
+
+
+def test_only_the_broken_stage_is_repaired(model, ngn_case_dict):
+    calls, replies = model
+    good_stage = json.dumps(ngn_case_dict["stages"][1])
+    del ngn_case_dict["stages"][1]["best"]
+    replies.append(good_stage)
+    case = finalize_ngn_case("topic", json.dumps(ngn_case_dict))
+    assert len(calls) == 1 and "stage 2 of 3" in calls[0]
+    assert case.stages[1].best.action == "raise head of bed"
+
+
+@pytest.mark.parametrize("text", ["AI error: RateLimitError: slow down", "❌ OpenAI API key not found."])
+def test_failed_generation_is_not_repaired(model, text):
+    with pytest.raises(NGNCaseError):
+        finalize_ngn_case("topic", text)
+    assert model[0] == []
+
+
+def test_stream_error_is_not_repaired(model, ngn_case_dict):
+    partial = json.dumps(ngn_case_dict)[:200] + "\n\nAI error: APITimeoutError: timed out"
+    with pytest.raises(NGNCaseError):
+        finalize_ngn_case("topic", partial, error="APITimeoutError")
+    assert model[0] == []
+
+
+def test_repair_stops_at_the_first_failed_call(model, ngn_case_dict):
+    calls, replies = model
+    for stage in ngn_case_dict["stages"]:
+        del stage["best"]
+    replies.append("AI error: UpstreamUnavailable: failing fast")
+    with pytest.raises(NGNCaseError):
+        finalize_ngn_case("topic", json.dumps(ngn_case_dict))
+    assert len(calls) == 1
+
+
+def test_scoring(ngn_case_dict):
+    stage = ngn_case_from_dict(ngn_case_dict).stages[0]
+    assert score_ngn_stage(stage, ["SpO2 88%"], "atelectasis", "raise head of bed", "SpO2 above 92%") == 4
+    assert score_ngn_stage(stage, [], "anxiety", "give analgesic", "pain 0/10") == 0
@@ -0,0 +1,24 @@
+from nursethink.ngn import NGNCasePool, ngn_case_from_dict, normalize_topic
+
+
+def test_pool_hands_out_each_stored_case_once(tmp_path, ngn_case_dict):
+    pool = NGNCasePool(str(tmp_path / "pool.sqlite3"), ["Post-op respiratory"], size=2)
+    pool.add("Post-op  Respiratory", ngn_case_from_dict(ngn_case_dict))
+    assert pool.count("post-op respiratory") == 1
+    case = pool.pop("POST-OP respiratory")
+    assert case.title == "Post-op day 1" and len(case.stages) == 3
+    assert pool.pop("post-op respiratory") is None
+    assert pool.stats["hits"] == 1 and pool.stats["misses"] == 1
+
+
+def test_stale_stored_cases_are_dropped_as_misses(tmp_path):
+    pool = NGNCasePool(str(tmp_path / "pool.sqlite3"), [], size=1)
+    pool._db().execute(
+        "INSERT INTO ngn_pool (topic, case_json, created) VALUES (?, ?, 0)", ("sepsis", '{"title": "old"}')
+    )
+    assert pool.pop("sepsis") is None
+    assert pool.count("sepsis") == 0
+
+
+def test_normalize_topic():
+    assert normalize_topic("  Post-op\tRespiratory ") == "post-op respiratory"
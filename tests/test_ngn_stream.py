@@ -0,0 +1,42 @@
+import json
+
+from nursethink.ngn import NGNStreamParser, salvage_ngn_json
+
+
+def _feed_in_pieces(text: str, size: int) -> list:
+    parser = NGNStreamParser()
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(parser.feed(text[i:i + size]))
+    return events
+
+
+def test_header_and_stages_are_emitted_as_they_complete(ngn_case_dict):
+    text = "```json\n" + json.dumps(ngn_case_dict) + "\n```"
+    for size in (1, 7, len(text)):
+        events = _feed_in_pieces(text, size)
+        assert [kind for kind, _ in events] == ["header", "stage", "stage", "stage"]
+        assert events[0][1]["title"] == "Post-op day 1"
+        assert [obj["stage"] for _, obj in events[1:]] == [1, 2, 3]
+
+
+def test_stage_is_emitted_before_the_rest_arrives(ngn_case_dict):
+    text = json.dumps(ngn_case_dict)
+    cut = text.index('{"stage": 2')
+    parser = NGNStreamParser()
+    assert [kind for kind, _ in parser.feed(text[:cut])] == ["header", "stage"]
+    assert [kind for kind, _ in parser.feed(text[cut:])] == ["stage", "stage"]
+
+
+def test_braces_inside_strings_do_not_confuse_the_parser(ngn_case_dict):
+    ngn_case_dict["stages"][0]["rationale"] = 'Watch for "}" and {this} and ] too'
+    events = _feed_in_pieces(json.dumps(ngn_case_dict), 5)
+    assert events[1][1]["rationale"] == 'Watch for "}" and {this} and ] too'
+    assert len(events) == 4
+
+
+def test_salvage_keeps_complete_stages_of_truncated_output(ngn_case_dict):
+    text = json.dumps(ngn_case_dict)
+    raw = salvage_ngn_json(text[:text.index('{"stage": 3') + 20])
+    assert raw["title"] == "Post-op day 1"
+    assert [s["stage"] for s in raw["stages"]] == [1, 2]
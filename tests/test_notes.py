@@ -0,0 +1,39 @@
+from nursethink.notes import build_context, chunk_notes, estimate_tokens, select_notes_chunks
+
+
+def _topic(name: str, n: int = 60) -> str:
+    return " ".join(f"{name} fact {i} for the nurse to remember." for i in range(n))
+
+
+def test_chunk_notes_keeps_paragraphs_and_splits_long_ones():
+    chunks = chunk_notes("Short one.\n\nShort two.\n\n" + _topic("digoxin", 200), chunk_tokens=200)
+    assert chunks[0].startswith("Short one.\n\nShort two.")
+    assert len(chunks) > 2
+    assert all(estimate_tokens(c) <= 260 for c in chunks)
+
+
+def test_short_notes_are_sent_whole():
+    assert select_notes_chunks("Airway first.", "airway") == []
+    assert build_context("Airway first.", "airway") == "Airway first."
+    assert build_context("", "airway") == "(none provided)"
+
+
+def test_long_notes_send_the_chunks_that_match_the_query():
+    notes = "\n\n".join(_topic(t) for t in ("digoxin", "insulin", "warfarin", "heparin", "furosemide"))
+    selected = select_notes_chunks(notes, "warfarin INR", token_budget=600)
+    assert selected
+    assert all("warfarin" in text for _, _, text in selected)
+    assert sum(estimate_tokens(text) for _, _, text in selected) <= 600
+    assert "(Relevant excerpts" in build_context(notes, "warfarin", 600)
+
+
+def test_one_prompt_cleans_its_notes_once():
+    from nursethink.cleanup import get_cleanup_stats
+
+    # Ragged spacing: the cleaned text differs from the raw one
+    notes = "\n\n".join(_topic(t).replace(" ", "  ") for t in ("lithium", "clozapine", "haloperidol", "sertraline"))
+    before = dict(get_cleanup_stats())
+    build_context(notes, "lithium levels", 600)
+    stats = get_cleanup_stats()
+    assert stats["documents"] == before["documents"] + 1
+    assert stats["tokens_before"] - before["tokens_before"] == estimate_tokens(notes)
@@ -0,0 +1,46 @@
+from nursethink.notes_store import NOTES_PREVIEW_CHARS, NotesStore, notes_digest, notes_preview, notes_ref, resolve_notes
+
+LONG = "\n\n".join(f"Paragraph {i}: " + "assess, plan, implement, evaluate. " * 5 for i in range(100))
+
+
+def test_short_notes_stay_in_the_widget():
+    assert notes_preview("Digoxin: check apical pulse.") == ("Digoxin: check apical pulse.", None)
+    assert resolve_notes("Digoxin: check apical pulse.") == "Digoxin: check apical pulse."
+
+
+def test_unchanged_preview_resolves_to_the_full_text():
+    value, sha = notes_preview(LONG)
+    assert sha == notes_digest(LONG) and len(value) < NOTES_PREVIEW_CHARS + 200
+    assert value.endswith("more characters of these notes are used but not shown here. Edit above this line.]")
+    # Cut at a paragraph break, not mid-sentence
+    assert value.split("\n\n[… ")[0].endswith("evaluate.")
+    assert resolve_notes(value, sha) == LONG
+    assert resolve_notes(notes_ref(sha)) == LONG
+
+
+def test_edit_above_the_marker_keeps_the_rest():
+    value, sha = notes_preview(LONG)
+    edited = "My own summary first.\n\n" + value
+    resolved = resolve_notes(edited, sha)
+    assert resolved.startswith("My own summary first.\n\nParagraph 0:")
+    assert resolved.endswith(LONG[-200:])
+
+
+def test_deleting_the_marker_drops_the_rest():
+    value, sha = notes_preview(LONG)
+    kept = value.rpartition("\n\n[… ")[0]
+    assert resolve_notes(kept, sha) == kept
+
+
+def test_unknown_reference_falls_back_to_the_widget_value():
+    assert resolve_notes("what the widget has", "0" * 64) == "what the widget has"
+    assert resolve_notes(notes_ref("0" * 64)) == ""
+
+
+def test_store_memory_then_disk(tmp_path):
+    store = NotesStore(str(tmp_path / "notes.sqlite3"), memory_items=1)
+    a, b = store.put("first notes"), store.put("second notes")
+    assert store.get(b) == "second notes" and store.stats["memory_hits"] == 1
+    assert store.get(a) == "first notes" and store.stats["disk_hits"] == 1
+    assert store.get("missing") is None and store.stats["misses"] == 1
+    assert store.put("first notes") == a and store.stats["stored"] == 2
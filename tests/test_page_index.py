@@ -0,0 +1,86 @@
+import io
+
+import pytest
+
+from nursethink.cleanup import PAGE_BREAK
+from nursethink.page_index import PageIndex, content_words, page_ref, read_outline
+
+
+def test_kerning_joins_a_word_but_word_gaps_stay_spaces():
+    assert content_words(b"[(Heart)-250(failure)] TJ [(Acute)-1000(kidney)] TJ") == "Heart failure Acute kidney"
+    assert content_words(b"[(he)-20(art) 12.5 (s)] TJ") == "hearts"
+    assert content_words(b"(Heart\\) -20 \\(failure) Tj") == "Heart) -20 (failure"
+
+
+TOPICS = [
+    "Airway management and suction",
+    "Breathing: pursed lip breathing",
+    "Circulation and perfusion",
+    "Insulin sliding scale",
+    "Heart failure daily weights",
+    "Digoxin toxicity and potassium",
+    "Warfarin and INR monitoring",
+    "Stroke assessment FAST",
+]
+
+
+@pytest.fixture
+def book(make_pdf, tmp_path):
+    from PyPDF2 import PdfReader, PdfWriter
+
+    pages = TOPICS + [
+        b"BT /F1 12 Tf 72 720 Td [(Sep)-20(sis)-300(bundle)] TJ ET",
+        "Sepsis antibiotics within one hour",
+        "Sepsis antibiotics within one hour",
+        "Lactate and fluids",
+    ]
+    writer = PdfWriter()
+    for page in PdfReader(io.BytesIO(make_pdf(pages))).pages:
+        writer.add_page(page)
+    writer.add_outline_item("Cardiac", 4)
+    writer.add_outline_item("Infection and sepsis", 8)
+    out = io.BytesIO()
+    writer.write(out)
+    index = PageIndex(str(tmp_path / "pages.sqlite3"), str(tmp_path / "pdfs"))
+    assert index.build("book", out.getvalue(), min_pages=len(pages)) == {
+        "pages": len(pages), "outline": 2, "seconds": pytest.approx(index.stats["index_seconds"]),
+    }
+    return index
+
+
+def test_short_pdfs_are_not_read_lazily(make_pdf, tmp_path):
+    index = PageIndex(str(tmp_path / "pages.sqlite3"), str(tmp_path / "pdfs"))
+    assert index.build("short", make_pdf(["one", "two"]), min_pages=3) is None
+    assert not index.has("short")
+
+
+def test_outline_ranges_run_to_the_next_bookmark(book):
+    from PyPDF2 import PdfReader
+
+    with open(book._pdf_path("book"), "rb") as f:
+        reader = PdfReader(f)
+        assert read_outline(reader, 12) == [("Cardiac", 0, 4, 8), ("Infection and sepsis", 0, 8, 12)]
+    text = book.document_text("book")
+    assert "- Infection and sepsis (p. 9–12)" in text and text.endswith(page_ref("book"))
+
+
+def test_select_pages_prefers_matching_pages_and_skips_repeats(book):
+    assert book.select_pages("book", "digoxin potassium", limit=1) == [5]
+    # The kerned page is indexed as words
+    assert {"sepsis", "bundle"} <= book._index("book")[2][8]
+    sepsis = book.select_pages("book", "sepsis antibiotics", limit=3)
+    # The bookmark lifts its whole section; the repeated page goes once
+    assert sepsis == [8, 9, 11]
+    assert book.select_pages("book", "zzz", limit=2) == [0, 1]
+
+
+def test_relevant_text_extracts_and_labels_the_chosen_pages(book):
+    text = book.relevant_text("book", "digoxin warfarin", limit=2)
+    assert text.split(f"\n{PAGE_BREAK}\n") == [
+        "[Page 6]\nDigoxin toxicity and potassium",
+        "[Page 7]\nWarfarin and INR monitoring",
+    ]
+    book.relevant_text("book", "digoxin warfarin", limit=2)
+    assert book.stats["pages_extracted"] == 2 and book.stats["page_hits"] == 2
+    book.drop("book")
+    assert not book.has("book") and book.select_pages("book", "digoxin") == []
@@ -0,0 +1,37 @@
+import time
+
+from nursethink.pdf import iter_pdf_pages
+
+
+def test_short_pdf_pages_come_back_in_order(make_pdf):
+    pages = list(iter_pdf_pages(make_pdf(["Airway first", "Then breathing", "Then circulation"])))
+    assert [p["page"] for p in pages] == [0, 1, 2]
+    assert [p["status"] for p in pages] == ["ok"] * 3
+    assert "breathing" in pages[1]["text"]
+
+
+def test_a_stuck_page_of_a_short_pdf_times_out_and_the_rest_are_read(make_pdf, monkeypatch):
+    from PyPDF2 import PageObject
+
+    extract = PageObject.extract_text
+
+    def slow_on_stuck(page, *args, **kwargs):
+        text = extract(page, *args, **kwargs)
+        if "stuck" in text:
+            time.sleep(1.0)
+        return text
+
+    monkeypatch.setattr(PageObject, "extract_text", slow_on_stuck)
+    t0 = time.perf_counter()
+    pages = list(iter_pdf_pages(make_pdf(["one", "stuck", "three"]), page_timeout=0.2))
+    assert [(p["page"], p["status"]) for p in pages] == [(0, "ok"), (1, "timeout"), (2, "ok")]
+    assert "three" in pages[2]["text"]
+    assert time.perf_counter() - t0 < 0.9
+
+
+def test_large_pdf_uses_the_pool_and_respects_max_pages(make_pdf):
+    data = make_pdf([f"Page {i} sepsis" for i in range(20)])
+    pages = list(iter_pdf_pages(data, workers=2, pages_per_task=4))
+    assert [p["page"] for p in pages] == list(range(20))
+    assert all(p["status"] == "ok" and f"Page {p['page']} " in p["text"] for p in pages)
+    assert len(list(iter_pdf_pages(data, max_pages=5))) == 5
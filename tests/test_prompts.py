@@ -0,0 +1,35 @@
+import pytest
+
+from nursethink.prompts import COMPILED_MODE_PREFIXES, build_prompt, build_prompt_sections, join_sections
+
+
+def _sections(mode="priority", request="Which client first?", notes="Airway first.", **kw):
+    args = dict(difficulty="medium", notes_only=False, label_sources=True, strict_mode=True)
+    args.update(kw)
+    return build_prompt_sections(mode, request, notes, **args)
+
+
+def test_static_prefix_first_and_request_last():
+    sections = _sections()
+    assert [name for name, _ in sections] == ["static_prefix", "controls", "strict", "notes", "request"]
+    assert sections[0][1] is COMPILED_MODE_PREFIXES["priority"]
+    assert sections[-1][1].endswith("Which client first?")
+
+
+def test_prefix_is_the_same_whatever_the_request_and_notes():
+    a = join_sections(_sections(request="one", notes="x"))
+    b = join_sections(_sections(request="two", notes="y", strict_mode=False))
+    prefix = COMPILED_MODE_PREFIXES["priority"]
+    assert a.startswith(prefix) and b.startswith(prefix)
+
+
+def test_quiz_carries_difficulty_and_build_prompt_joins_sections():
+    assert "DIFFICULTY: hard" in _sections(mode="quiz", difficulty="hard")[-1][1]
+    assert build_prompt("explain", "x", "", "medium", False, True, False) == join_sections(
+        _sections(mode="explain", request="x", notes="", strict_mode=False)
+    )
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        _sections(mode="nope")
@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+from nursethink.quiz import (
+    QUIZ_DUPLICATE_THRESHOLD,
+    AsyncRateLimiter,
+    build_quiz_batch_prompt,
+    jaccard,
+    quiz_stem,
+    shingles,
+)
+
+QUESTION = """A client with heart failure reports a 2 kg weight gain overnight. Which action first?
+A) Reassess the client's lung sounds
+B) Notify the provider
+C) Restrict fluids
+"""
+
+
+def test_stem_stops_at_the_first_option():
+    assert quiz_stem(QUESTION) == "A client with heart failure reports a 2 kg weight gain overnight. Which action first?"
+
+
+def test_reworded_options_are_duplicates_and_new_scenarios_are_not():
+    same = shingles(quiz_stem(QUESTION.replace("Reassess", "Auscultate")))
+    other = shingles(quiz_stem("A client on warfarin has an INR of 5.2. What should the nurse do?\nA) Hold the dose"))
+    stem = shingles(quiz_stem(QUESTION))
+    assert jaccard(stem, same) >= QUIZ_DUPLICATE_THRESHOLD
+    assert jaccard(stem, other) < QUIZ_DUPLICATE_THRESHOLD
+    assert jaccard(set(), stem) == 0.0
+
+
+def test_batch_prompts_vary_the_angle():
+    prompts = {build_quiz_batch_prompt("base", i, 3) for i in range(3)}
+    assert len(prompts) == 3
+    assert all(p.startswith("base\n\n") for p in prompts)
+
+
+def test_rate_limiter_allows_a_burst_then_paces():
+    async def run():
+        limiter = AsyncRateLimiter(600, burst=3)
+        t0 = time.monotonic()
+        for _ in range(3):
+            await limiter.acquire()
+        burst = time.monotonic() - t0
+        await limiter.acquire()
+        return burst, time.monotonic() - t0
+
+    burst, total = asyncio.run(run())
+    assert burst < 0.05
+    assert total >= 0.08  # 600/min: the fourth waits ~0.1 s
@@ -0,0 +1,35 @@
+import time
+
+from nursethink.llm import ResponseCache, response_cache_key, response_ttl
+
+
+def test_key_ignores_whitespace_differences():
+    assert response_cache_key("Which client\n first?") == response_cache_key("Which  client first? ")
+    assert response_cache_key("a") != response_cache_key("b")
+
+
+def test_put_get_and_uncached_modes(tmp_path):
+    cache = ResponseCache(str(tmp_path / "r.sqlite3"))
+    cache.put("k", "answer", ttl=60)
+    assert cache.get("k") == "answer"
+    cache.put("q", "quiz", ttl=response_ttl("quiz"))
+    assert cache.get("q") is None
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = ResponseCache(str(tmp_path / "r.sqlite3"))
+    cache.put("k", "answer", ttl=0.01)
+    time.sleep(0.02)
+    assert cache.expires_in("k") < 0
+    assert cache.get("k") is None
+
+
+def test_least_recently_used_entries_are_evicted_over_the_size_cap(tmp_path):
+    cache = ResponseCache(str(tmp_path / "r.sqlite3"), max_bytes=250)
+    for i in range(3):
+        cache.put(f"k{i}", "x" * 100, ttl=60)
+        time.sleep(0.01)
+    assert cache.get("k0") is None
+    assert cache.get("k2") == "x" * 100
+    assert cache.stats["evictions"] >= 1
@@ -0,0 +1,123 @@
+import asyncio
+import threading
+import time
+
+import openai
+import pytest
+
+from nursethink import upstream
+from nursethink.scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    ModelScheduler,
+    TokenBucket,
+    background_calls,
+    current_priority,
+)
+from nursethink.upstream import acall_with_retries, call_with_retries
+
+
+def test_bucket_waits_for_refill_and_caps_oversized_requests():
+    bucket = TokenBucket(6000)  # 100 a second, 1000 burst
+    assert bucket.wait_for(1000) == 0.0
+    bucket.take(1500)
+    assert bucket.level == -500
+    assert bucket.wait_for(100) == pytest.approx(6.0)
+    # Bigger than the burst: wait for a full bucket, not forever
+    assert bucket.wait_for(5000) == pytest.approx(15.0)
+    bucket.give_back(5000)
+    assert bucket.level == bucket.capacity
+    assert TokenBucket(0).wait_for(10 ** 9) == 0.0
+
+
+def test_background_calls_are_scoped_to_the_block():
+    assert current_priority() == PRIORITY_INTERACTIVE
+    with background_calls():
+        assert current_priority() == PRIORITY_BACKGROUND
+    assert current_priority() == PRIORITY_INTERACTIVE
+
+
+def test_users_are_served_fairly_not_first_come():
+    scheduler = ModelScheduler(rpm=600, tpm=0)
+    scheduler.requests.level = 0.0
+    order = []
+
+    def ask(label, user):
+        scheduler.acquire(user=user, tokens=100)
+        order.append(label)
+
+    threads = []
+    for label, user in [("a1", "ana"), ("a2", "ana"), ("a3", "ana"), ("b1", "ben")]:
+        threads.append(threading.Thread(target=ask, args=(label, user)))
+        threads[-1].start()
+        while scheduler.stats["waiting"] < len(threads) - len(order):
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join(10)
+    assert order == ["a1", "b1", "a2", "a3"]
+    assert scheduler.stats["admitted"] == 4 and scheduler.stats["queued"] >= 3
+
+
+def test_settle_trues_up_the_reservation():
+    scheduler = ModelScheduler(rpm=0, tpm=6000)
+    scheduler.acquire(tokens=800)
+    assert scheduler.tokens.level == pytest.approx(200, abs=1)
+    scheduler.settle(800, 300)
+    assert scheduler.tokens.level == pytest.approx(700, abs=1)
+    scheduler.settle(0, 200)
+    assert scheduler.tokens.level == pytest.approx(500, abs=1)
+    assert scheduler.stats["tokens_reserved"] == 800 and scheduler.stats["tokens_used"] == 500
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    scheduler = ModelScheduler(rpm=0, tpm=6000)
+    monkeypatch.setattr(upstream, "get_model_scheduler", lambda: scheduler)
+    monkeypatch.setattr(upstream, "backoff_delay", lambda attempt, retry_after=None: 0.0)
+    upstream.get_circuit_breaker.cache_clear()
+    yield scheduler
+    upstream.get_circuit_breaker.cache_clear()
+
+
+def server_error():
+    exc = openai.InternalServerError.__new__(openai.InternalServerError)
+    exc.status_code = 503
+    exc.response = None
+    return exc
+
+
+def always_down():
+    raise server_error()
+
+
+def test_failed_attempts_give_their_tokens_back(scheduler):
+    attempts = []
+
+    def flaky():
+        attempts.append(scheduler.tokens.level)
+        if len(attempts) < 3:
+            raise server_error()
+        return "ok"
+
+    assert call_with_retries(flaky, retries=3, tokens=400) == "ok"
+    # Every attempt went out with the same level: nothing leaked from the failed ones
+    assert attempts == pytest.approx([attempts[0]] * 3, abs=1)
+    assert scheduler.tokens.level == pytest.approx(scheduler.tokens.capacity - 400, abs=1)
+
+    with pytest.raises(openai.InternalServerError):
+        call_with_retries(always_down, retries=1, tokens=400)
+    assert scheduler.tokens.level == pytest.approx(scheduler.tokens.capacity - 400, abs=1)
+
+
+def test_async_attempts_refund_too(scheduler):
+    async def failing():
+        raise server_error()
+
+    async def cancelled():
+        raise asyncio.CancelledError()
+
+    with pytest.raises(openai.InternalServerError):
+        asyncio.run(acall_with_retries(failing, retries=2, tokens=400))
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(acall_with_retries(cancelled, tokens=400))
+    assert scheduler.tokens.level == pytest.approx(scheduler.tokens.capacity, abs=1)
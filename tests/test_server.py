@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+import pytest
+
+from nursethink.server import EngineAPI, HTTPError, Request, SessionStore
+
+
+@pytest.fixture
+def api(tmp_path):
+    return EngineAPI(SessionStore(str(tmp_path / "sessions.sqlite3")))
+
+
+def call(api, method, target, body=None):
+    raw = json.dumps(body).encode() if body is not None else b""
+    return asyncio.run(api.dispatch(Request(method, target, {}, raw)))
+
+
+def test_prompt_defaults_match_the_ui(api):
+    prompt = call(api, "POST", "/v1/prompt", {"mode": "quiz", "request": "sepsis"})["prompt"]
+    assert "Notes-only mode: False" in prompt
+    assert "DIFFICULTY: medium" in prompt
+    strict = call(api, "POST", "/v1/prompt", {"mode": "quiz", "notes_only": "true", "difficulty": "Hard"})["prompt"]
+    assert "Notes-only mode: True" in strict and "DIFFICULTY: hard" in strict
+
+
+@pytest.mark.parametrize(
+    "method, target, body, status",
+    [
+        ("POST", "/v1/prompt", {"mode": "nope"}, 400),
+        ("POST", "/v1/prompt", {"mode": "quiz", "notes_budget": "lots"}, 400),
+        ("GET", "/v1/ngn/cases/abc?wait_stage=1&timeout=soon", None, 400),
+        ("GET", "/v1/prompt", None, 405),
+        ("GET", "/v1/missing", None, 404),
+    ],
+)
+def test_bad_requests_get_4xx(api, method, target, body, status):
+    with pytest.raises(HTTPError) as err:
+        call(api, method, target, body)
+    assert err.value.status == status
+
+
+def test_invalid_json_body_is_a_400(api):
+    with pytest.raises(HTTPError) as err:
+        asyncio.run(api.dispatch(Request("POST", "/v1/prompt", {}, b"{not json")))
+    assert err.value.status == 400
+
+
+def test_malformed_summary_turns_are_a_400(api):
+    for turns in ([{}], [{"role": "user"}], "hello", [{"role": "nurse", "content": "hi"}]):
+        with pytest.raises(HTTPError) as err:
+            call(api, "POST", "/v1/chat/summary", {"turns": turns})
+        assert err.value.status == 400
+
+
+def test_concurrent_turns_on_one_session_keep_both_messages(api):
+    session_id = call(api, "POST", "/v1/chat/sessions", {})["session_id"]
+    target = f"/v1/chat/sessions/{session_id}/messages"
+
+    async def two_turns():
+        turns = [
+            api.dispatch(Request("POST", target, {}, json.dumps({"content": text, "simulate": True}).encode()))
+            for text in ("first question", "second question")
+        ]
+        await asyncio.gather(*turns)
+
+    asyncio.run(two_turns())
+    messages = call(api, "GET", f"/v1/chat/sessions/{session_id}")["messages"]
+    assert [m["role"] for m in messages] == ["user", "assistant", "user", "assistant"]
+    assert {messages[0]["content"], messages[2]["content"]} == {"first question", "second question"}
+
+
+def test_saving_a_stale_chat_is_a_409(api):
+    session_id = api.store.create_chat()
+    messages, memory, version = api.store.load_chat(session_id)
+    api.store.save_chat(session_id, messages + [{"role": "user", "content": "a"}], memory, version)
+    with pytest.raises(HTTPError) as err:
+        api.store.save_chat(session_id, messages + [{"role": "user", "content": "b"}], memory, version)
+    assert err.value.status == 409
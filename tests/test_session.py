@@ -0,0 +1,69 @@
+import uuid
+
+import pytest
+
+from nursethink.session import CHAT_RESIDENT_MIN, PROMPT_TOKENS_KEPT, ChatLog, NGNScores, approx_size, get_session_stats
+
+
+@pytest.fixture
+def chat():
+    # A tiny cap so a few messages spill to the on-disk log
+    return ChatLog(f"test-{uuid.uuid4().hex}", cap=1024)
+
+
+def fill(chat, n):
+    for i in range(n):
+        chat.append({"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + "x" * 200})
+
+
+def test_old_messages_spill_to_disk_but_stay_readable(chat):
+    fill(chat, 30)
+    assert len(chat) == 30
+    assert chat.offset > 0 and len(chat.texts) >= CHAT_RESIDENT_MIN
+    assert chat.resident_bytes <= 1024 or len(chat.texts) == CHAT_RESIDENT_MIN
+    assert chat[0] == {"role": "user", "content": "message 0 " + "x" * 200}
+    assert chat[-1]["role"] == "assistant" and chat[-1]["content"].startswith("message 29 ")
+    with pytest.raises(IndexError):
+        chat[30]
+
+
+def test_slices_and_iteration_cross_the_disk_boundary(chat):
+    fill(chat, 45)
+    window = chat[chat.offset - 2:chat.offset + 2]
+    assert [m["content"].split()[1] for m in window] == [str(i) for i in range(chat.offset - 2, chat.offset + 2)]
+    assert [m["content"].split()[1] for m in chat[::10]] == ["0", "10", "20", "30", "40"]
+    assert [m["content"].split()[1] for m in chat] == [str(i) for i in range(45)]
+    assert next(reversed(chat))["content"].startswith("message 44 ")
+
+
+def test_clear_forgets_everything(chat):
+    fill(chat, 20)
+    chat.record_prompt_tokens(500)
+    chat.clear()
+    assert len(chat) == 0 and list(chat) == [] and len(chat.prompt_tokens) == 0
+    fill(chat, 1)
+    assert chat[0]["content"].startswith("message 0 ")
+
+
+def test_prompt_token_history_is_bounded(chat):
+    for n in range(PROMPT_TOKENS_KEPT + 50):
+        chat.record_prompt_tokens(n)
+    assert len(chat.prompt_tokens) == PROMPT_TOKENS_KEPT and chat.prompt_tokens[-1] == PROMPT_TOKENS_KEPT + 49
+
+
+def test_stats_and_sizes(chat):
+    fill(chat, 10)
+    stats = get_session_stats()
+    assert stats["chat_sessions"] >= 1 and stats["chat_messages"] >= 10
+    # Resident size is bounded by the cap, however long the chat gets
+    small = approx_size(chat)
+    fill(chat, 200)
+    assert approx_size(chat) < small + 1024
+
+
+def test_ngn_scores():
+    scores = NGNScores(f"test-{uuid.uuid4().hex}")
+    for stage, score in [(1, 4), (2, 3), (3, 4)]:
+        scores.add(stage, score, "raise head of bed")
+    assert len(scores) == 3 and scores.perfect() == 2
+    assert list(scores.stages) == [1, 2, 3]
@@ -0,0 +1,42 @@
+import json
+
+from nursethink.tracing import Histogram, RequestTrace, Tracer
+
+
+def test_trace_is_written_once_as_jsonl(tmp_path):
+    tracer = Tracer(str(tmp_path / "traces.jsonl"))
+    trace = RequestTrace("generate", mode="priority", session_id="s1")
+    with trace.span("model"):
+        pass
+    trace.add_span("model", 0.5)
+    trace.cache("response", False)
+    trace.set(input_tokens=120, output_tokens=30)
+    tracer.record(trace)
+    tracer.record(trace)
+    lines = (tmp_path / "traces.jsonl").read_text().splitlines()
+    assert len(lines) == 1
+    record = json.loads(lines[0])
+    assert record["kind"] == "generate" and record["session"] == "s1"
+    assert record["spans"]["model"] >= 0.5
+    assert record["cache"] == {"response": "miss"}
+
+
+def test_prometheus_output_has_counters_histograms_and_collectors(tmp_path):
+    tracer = Tracer(str(tmp_path / "traces.jsonl"))
+    trace = RequestTrace("chat")
+    trace.set(input_tokens=10, ttft_seconds=0.2)
+    tracer.record(trace)
+    tracer.add_collector(lambda: [("nursethink_cache_entries", {"cache": "response"}, 3)])
+    tracer.add_collector(lambda: 1 / 0)
+    text = tracer.render_prometheus()
+    assert 'nursethink_requests_total{kind="chat"} 1' in text
+    assert 'nursethink_tokens_total{direction="input"} 10' in text
+    assert 'nursethink_span_seconds_count{kind="chat",span="ttft"} 1' in text
+    assert 'nursethink_cache_entries{cache="response"} 3' in text
+
+
+def test_histogram_buckets():
+    h = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        h.observe(value)
+    assert h.counts == [1, 1, 1] and h.count == 3
@@ -0,0 +1,99 @@
+import openai
+import pytest
+
+from nursethink import upstream
+from nursethink.upstream import (
+    RETRY_MAX_SECONDS,
+    CircuitBreaker,
+    UpstreamUnavailable,
+    backoff_delay,
+    call_with_retries,
+    failure_kind,
+    retry_after_seconds,
+)
+
+
+def api_error(cls, status=None, headers=None):
+    # The SDK's constructors want real HTTP objects; only the attributes we read matter here
+    exc = cls.__new__(cls)
+    exc.status_code = status
+    exc.response = type("Response", (), {"headers": headers or {}})()
+    return exc
+
+
+@pytest.fixture(autouse=True)
+def fresh_breaker(monkeypatch):
+    upstream.get_circuit_breaker.cache_clear()
+    monkeypatch.setattr(upstream, "backoff_delay", lambda attempt, retry_after=None: 0.0)
+    yield
+    upstream.get_circuit_breaker.cache_clear()
+
+
+def test_only_upstream_trouble_is_retryable():
+    assert failure_kind(api_error(openai.APITimeoutError)) == "timeout"
+    assert failure_kind(api_error(openai.RateLimitError, 429)) == "rate_limited"
+    assert failure_kind(api_error(openai.InternalServerError, 503)) == "server_error"
+    assert failure_kind(api_error(openai.BadRequestError, 400)) is None
+    assert failure_kind(ValueError("bug")) is None
+
+
+def test_retry_after_is_read_and_capped():
+    assert retry_after_seconds(api_error(openai.RateLimitError, 429, {"retry-after": "2"})) == 2.0
+    assert retry_after_seconds(api_error(openai.RateLimitError, 429, {"retry-after": "600"})) == RETRY_MAX_SECONDS
+    assert retry_after_seconds(api_error(openai.RateLimitError, 429, {"retry-after": "soon"})) is None
+    assert retry_after_seconds(ValueError()) is None
+
+
+def test_backoff_is_jittered_but_respects_retry_after():
+    assert all(0 <= backoff_delay(3) <= RETRY_MAX_SECONDS for _ in range(50))
+    assert backoff_delay(0, retry_after=3.0) == 3.0
+
+
+def test_breaker_opens_then_lets_one_probe_through(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=10)
+    assert not breaker.record_failure()
+    assert breaker.record_failure() and breaker.state == "open"
+    assert not breaker.allow()
+    now = upstream.time.monotonic()
+    monkeypatch.setattr(upstream.time, "monotonic", lambda: now + 11)
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()
+    assert breaker.record_failure() and breaker.state == "open"
+    monkeypatch.setattr(upstream.time, "monotonic", lambda: now + 22)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_retries_transient_failures_then_succeeds():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise api_error(openai.InternalServerError, 502)
+        return "ok"
+
+    assert call_with_retries(flaky, retries=3) == "ok"
+    assert len(calls) == 3
+    assert upstream.get_circuit_breaker().state == "closed"
+
+
+def test_does_not_retry_a_bad_request():
+    calls = []
+
+    def bad():
+        calls.append(1)
+        raise api_error(openai.BadRequestError, 400)
+
+    with pytest.raises(openai.BadRequestError):
+        call_with_retries(bad, retries=3)
+    assert len(calls) == 1
+
+
+def test_open_breaker_fails_fast():
+    breaker = upstream.get_circuit_breaker()
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    with pytest.raises(UpstreamUnavailable):
+        call_with_retries(lambda: "never", retries=0)
@@ -0,0 +1,48 @@
+from nursethink import warmup
+from nursethink.llm import ResponseCache, response_cache_key, response_ttl
+from nursethink.prompts import TEMPLATES, build_prompt_sections, join_sections
+from nursethink.warmup import WARMUP_MODES, CacheWarmer, warmup_prompts
+
+
+def test_prompts_are_distinct_and_match_a_default_template_click():
+    prompts = warmup_prompts()
+    keys = [response_cache_key(prompt) for _, _, prompt in prompts]
+    assert len(keys) == len(set(keys))
+    assert {mode for mode, _, _ in prompts} <= set(WARMUP_MODES)
+    name, request = next(iter(TEMPLATES.items()))
+    click = join_sections(build_prompt_sections("priority", request, "", "medium", False, True, True))
+    assert ("priority", name, click) in prompts
+
+
+def test_warm_answers_missing_prompts_and_skips_fresh_ones(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    calls = []
+
+    def answer(prompt, mode=None, refresh=False):
+        calls.append(mode)
+        if mode != "explain":  # a failed call isn't cached
+            cache.put(response_cache_key(prompt), "answer", ttl=response_ttl(mode), mode=mode)
+        return "answer"
+
+    monkeypatch.setattr(warmup, "get_client", lambda: object())
+    monkeypatch.setattr(warmup, "get_response_cache", lambda: cache)
+    monkeypatch.setattr(warmup, "get_ai_response", answer)
+    warmer = CacheWarmer(interval=60, start_delay=3600, pause=0)
+    prompts = warmup_prompts()
+    explain = sum(1 for mode, _, _ in prompts if mode == "explain")
+
+    warmer.warm()
+    assert len(calls) == len(prompts)
+    assert warmer.stats["warmed"] == len(prompts) - explain and warmer.stats["failed"] == explain
+
+    calls.clear()
+    warmer.warm()
+    assert calls == ["explain"] * explain
+    assert warmer.stats["fresh"] == len(prompts) - explain and warmer.stats["runs"] == 2
+
+
+def test_no_client_means_no_warm_up(monkeypatch):
+    monkeypatch.setattr(warmup, "get_client", lambda: None)
+    warmer = CacheWarmer(start_delay=3600)
+    warmer.warm()
+    assert warmer.stats["runs"] == 0